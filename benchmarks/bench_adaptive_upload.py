@@ -0,0 +1,65 @@
+"""
+Fixed-size versus adaptive test case uploads against the VECTR stub.
+
+The stub answers 503 to mutations larger than --overload-above, standing in for
+a VECTR instance that can't take the configured batch size, and can reject any
+test case whose name contains --reject-name. Each mode uploads the same test
+cases into its own campaign and reports throughput, requests made and how many
+test cases were created.
+
+    python benchmarks/bench_adaptive_upload.py --cases 5000 --batch-size 200 --overload-above 120 --latency-ms 20
+"""
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectrapi.vectr_api_client import VectrGQLConnParams, AdaptiveBatchSizer, \
+    create_test_cases_adaptive, \
+    create_test_cases_batched, \
+    close_connections
+from delivrto.transform import generate_vectr_test_case
+from bench_outcome_notes import BenchConnection, synthetic_email
+from vectr_stub import start_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fixed-size and adaptive test case uploads")
+    parser.add_argument("--cases", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--overload-above", type=int, default=120)
+    parser.add_argument("--reject-name")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vectr_con = BenchConnection()
+    test_cases = [generate_vectr_test_case(vectr_con, synthetic_email(i, 2, 2, rng), False) for i in range(args.cases)]
+    server = start_stub(latency=args.latency_ms / 1000, overload_above=args.overload_above, reject_name=args.reject_name)
+    params = VectrGQLConnParams(api_key="bench", vectr_gql_url=server.url)
+    sizer = AdaptiveBatchSizer(args.batch_size)
+
+    modes = {
+        "fixed": lambda campaign_id: create_test_cases_batched(
+            params, "db", campaign_id, test_cases, batch_size=args.batch_size, max_in_flight=args.max_in_flight),
+        "adaptive": lambda campaign_id: create_test_cases_adaptive(
+            params, "db", campaign_id, test_cases, max_in_flight=args.max_in_flight, sizer=sizer),
+    }
+    print(f"[*] {args.cases} test cases, batch size {args.batch_size}, stub overloaded above {args.overload_above}")
+    for mode, upload in modes.items():
+        requests_before = server.state.request_count
+        start = time.perf_counter()
+        report = upload(mode)
+        elapsed = time.perf_counter() - start
+        created = len(server.state.test_cases.get(mode, []))
+        print(f"  - {mode:<8} {elapsed:7.2f}s {args.cases / elapsed:8.0f} cases/s "
+              f"{server.state.request_count - requests_before:5d} requests {created:6d} created "
+              f"{len(report.failed_batches):4d} failed batches")
+    print(f"[*] Adaptive batch size settled at {sizer.size}")
+    close_connections()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Full versus summarised click tables in OutcomeNotes.
+
+Renders the Clicks section of emails with growing numbers of scanner clicks,
+listing every click and with --click-rows, and reports the notes size and
+render time of each. Scanner clicks come from a pool of --sources source IPs
+and user agents, as they would from a URL-rewriting gateway's sandboxes.
+
+    python benchmarks/bench_click_summary.py --clicks 10,100,1000,10000 --click-rows 20
+"""
+import argparse, os, random, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivrto.outcome_notes import render_clicks, _click_time
+
+
+def scanner_clicks(count, sources, rng):
+    return [
+        {
+            "timestamp": str(1685622840 + i),
+            "http_method": rng.choice(["GET", "HEAD"]),
+            "user_agent": f"Scanner/{rng.randrange(sources) % 7}.0",
+            "source_ip": f"10.{rng.randrange(sources) % 256}.0.1",
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full and summarised click tables")
+    parser.add_argument("--clicks", default="10,100,1000,10000")
+    parser.add_argument("--click-rows", type=int, default=20)
+    parser.add_argument("--sources", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"[*] Clicks from {args.sources} sources, summarised after {args.click_rows} rows")
+    for count in [int(clicks) for clicks in args.clicks.split(",")]:
+        clicks = scanner_clicks(count, args.sources, rng)
+        for mode, max_rows in ("full", None), ("summary", args.click_rows):
+            notes = render_clicks(clicks, max_rows)
+            # Timed from a cold timestamp cache, as for an email seen for the first time
+            elapsed = min(timeit.repeat(lambda: render_clicks(clicks, max_rows), setup=_click_time.cache_clear,
+                                        number=1, repeat=args.repeat))
+            print(f"  - {count:6d} clicks {mode:<8} {len(notes.encode()) / 1024:9.1f} KiB {elapsed * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
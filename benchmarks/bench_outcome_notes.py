@@ -0,0 +1,153 @@
+"""
+Micro-benchmark for the OutcomeNotes rendering in generate_vectr_test_case.
+
+Generates synthetic delivr.to email results with a configurable number of
+clicks and mail control entries, checks that the joined renderers produce
+byte-identical notes to the original string-concatenation implementation,
+and prints the per-email cost of both.
+
+    python benchmarks/bench_outcome_notes.py --emails 2000 --clicks 50
+"""
+import argparse, os, random, sys, timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivrto.outcome_notes import render_clicks, render_defender, render_gateway_response, render_sublime
+from delivrto.mail_controls import SUPPORTED_SECURITY_TOOL_INTEGRATIONS
+from delivrto.transform import generate_vectr_test_case
+
+
+class BenchConnection:
+    org_name = "Bench Org"
+
+
+def synthetic_email(index, clicks, rules, rng):
+    return {
+        "email_id": f"{index:08x}-0000-4000-8000-{index:012x}",
+        "payload_name": f"payload-{index % 97}.html",
+        "payload_description": "Synthetic benchmark payload",
+        "payload_tags": ["HTML", "Smuggling"],
+        "payload_references": ["https://example.com/a", "https://example.com/b"],
+        "mail_type": rng.choice(["as_attachment", "as_link", "as_body"]),
+        "sent": "2023-06-01 12:34" if index % 2 else "1685622840",
+        "status": rng.choice(["Delivered", "Blocked (Dropped)", "Delivered (Junk)", "Stripped"]),
+        "sendgrid_reason": "250 2.0.0 OK 1685622840 queued",
+        "clicks": [
+            {
+                "timestamp": str(1685622840 + c),
+                "http_method": "GET",
+                "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+                "source_ip": f"10.0.{c % 256}.{index % 256}",
+            }
+            for c in range(clicks)
+        ],
+        "mail_control_information": {
+            "Sublime": {
+                "state": "flagged",
+                "flagged_rules": [{"name": f"Rule {r}"} for r in range(rules)],
+            },
+            "Defender": {
+                "state": "Junked",
+                "threat_types": ",".join(f"Type{r}" for r in range(rules)),
+                "threat_names": ",".join(f"Name{r}" for r in range(rules)),
+                "detection_methods": {f"Type{r}": ["URL detonation", "Reputation"] for r in range(rules)},
+            },
+        },
+    }
+
+
+def legacy_outcome_notes(email_json):
+    """The original += rendering, kept as the reference output"""
+    outcome_notes = ""
+    if 'clicks' in email_json and len(email_json['clicks']) > 0:
+        outcome_notes+="**Clicks:**\n\n"
+        outcome_notes+="| Timestamp | Method | User Agent | Source IP |\n"
+        outcome_notes+="| - | - | - | - |\n"
+        for click in email_json.get('clicks',[]):
+            ts = datetime.fromtimestamp(int(click['timestamp'])).isoformat()
+            outcome_notes+=f"| {ts} | {click['http_method']} | {click['user_agent']} | {click['source_ip']} |" + "\n"
+        outcome_notes+="\n\n\n"
+    if 'sendgrid_reason' in email_json:
+        outcome_notes+="**Gateway Response:**\n\n"
+        outcome_notes+=f"```\n{email_json['sendgrid_reason']}\n```\n\n\n"
+    for control, v in email_json.get('mail_control_information', {}).items():
+        if control not in SUPPORTED_SECURITY_TOOL_INTEGRATIONS:
+            continue
+        if control == "Sublime":
+            outcome_notes+="**Sublime:**\n\n"
+            outcome_notes+=f"Action: `{v['state']}`\n\n"
+            if v['flagged_rules']:
+                outcome_notes+="Rules:\n"
+                for rule in v['flagged_rules']:
+                    outcome_notes+=f" - `{rule['name']}`"
+                    outcome_notes+="\n"
+        if control == "Defender":
+            outcome_notes+="**Defender**\n\n"
+            outcome_notes+=f"Action: `{v['state']}`"+"\n\n"
+            if v['threat_types']:
+                outcome_notes+="Threat Types:\n"
+                for tt in v['threat_types'].split(','):
+                    outcome_notes+=f" - `{tt}`"
+                    outcome_notes+="\n"
+                outcome_notes+="\n"
+            if v['threat_names']:
+                outcome_notes+="Threat Names:\n"
+                for tt in v['threat_names'].split(','):
+                    outcome_notes+=f" - `{tt}`"
+                    outcome_notes+="\n"
+                outcome_notes+="\n"
+            if v['detection_methods']:
+                outcome_notes+="Detection Methods:\n\n"
+                for tt in v['detection_methods']:
+                    for m in v['detection_methods'][tt]:
+                        outcome_notes+=f" - `{tt}: {m}`"
+                        outcome_notes+="\n"
+    return outcome_notes
+
+
+def joined_outcome_notes(email_json):
+    """The same sections built with the delivrto.outcome_notes renderers"""
+    outcome_notes = []
+    if email_json.get('clicks'):
+        outcome_notes.append(render_clicks(email_json['clicks']))
+    if 'sendgrid_reason' in email_json:
+        outcome_notes.append(render_gateway_response(email_json['sendgrid_reason']))
+    for control, v in email_json.get('mail_control_information', {}).items():
+        if control == "Sublime":
+            outcome_notes.append(render_sublime(v))
+        if control == "Defender":
+            outcome_notes.append(render_defender(v))
+    return "".join(outcome_notes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OutcomeNotes rendering")
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--clicks", type=int, default=25)
+    parser.add_argument("--rules", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    emails = [synthetic_email(i, args.clicks, args.rules, rng) for i in range(args.emails)]
+    vectr_con = BenchConnection()
+
+    for email_json in emails:
+        test_case = generate_vectr_test_case(vectr_con, email_json, False)
+        if test_case.outcomeNotes != legacy_outcome_notes(email_json):
+            sys.exit(f"[!] OutcomeNotes differ for email {email_json['email_id']}")
+    print(f"[+] OutcomeNotes identical for {len(emails)} emails")
+
+    legacy = min(timeit.repeat(lambda: [legacy_outcome_notes(e) for e in emails], number=1, repeat=args.repeat))
+    joined = min(timeit.repeat(lambda: [joined_outcome_notes(e) for e in emails], number=1, repeat=args.repeat))
+    transform = min(timeit.repeat(lambda: [generate_vectr_test_case(vectr_con, e, False) for e in emails], number=1, repeat=args.repeat))
+    print(f"[*] {args.clicks} clicks, {args.rules} rules per email")
+    print(f"  - legacy notes only:   {legacy / len(emails) * 1e6:8.1f} us/email")
+    print(f"  - joined notes only:   {joined / len(emails) * 1e6:8.1f} us/email")
+    print(f"  - full transform:      {transform / len(emails) * 1e6:8.1f} us/email")
+
+
+if __name__ == "__main__":
+    main()
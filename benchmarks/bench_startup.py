@@ -0,0 +1,93 @@
+"""
+Startup time of the CLI's lightweight invocations.
+
+Runs the CLI in fresh processes for --help, for an argument error and for
+spooling a small synthetic export, next to a bare interpreter as the baseline,
+and reports the fastest wall time of each. One more run of each under
+`python -X importtime` reports the total import time, the slowest top-level
+imports and which of the heavy dependencies (gql, requests, urllib3, aiohttp,
+pydantic) were loaded at all, so an import that creeps back onto a quick path
+shows up here.
+
+    python benchmarks/bench_startup.py --repeat 10 --top 5
+"""
+import argparse, os, subprocess, sys, tempfile, time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CLI = os.path.join(os.path.dirname(BENCHMARK_DIR), "delivrto_vectr_import.py")
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from synthetic_export import write_export
+
+HEAVY_MODULES = ["gql", "requests", "urllib3", "aiohttp", "asyncio", "multiprocessing", "pydantic"]
+
+VECTR_ENV = """API_KEY="bench:bench"
+VECTR_GQL_URL="http://127.0.0.1:9/graphql"
+TARGET_DB="BENCH"
+ORG_NAME="Benchmark Org"
+ASSESSMENT_NAME="Startup"
+CAMPAIGN_NAME="Startup"
+"""
+
+
+def invocations(export_path, spool_path):
+    return [
+        ("python", ["-c", "pass"]),
+        ("--help", [CLI, "--help"]),
+        ("bad args", [CLI, "--no-banner", "--path", export_path, "--async", "--step"]),
+        ("--spool", [CLI, "--no-banner", "--progress", "--path", export_path, "--spool", spool_path]),
+    ]
+
+
+def wall_time(command, cwd, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *command], cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def import_times(command, cwd):
+    """(module, nesting level, cumulative microseconds) of every import made by command"""
+    child = subprocess.run([sys.executable, "-X", "importtime", *command], cwd=cwd,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in child.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        module = name.strip()
+        imports.append((module, (len(name) - len(name.lstrip()) - 1) // 2, int(cumulative)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup of --help, argument errors and spool-only runs")
+    parser.add_argument("--emails", type=int, default=100, help="Emails in the spooled export")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="Slowest top-level imports listed per invocation")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "vectr.env"), "w") as env_file:
+            env_file.write(VECTR_ENV)
+        export_path = os.path.join(tmp, "export.json")
+        write_export(export_path, args.emails)
+        spool_path = os.path.join(tmp, "export.ndjson.gz")
+
+        for label, command in invocations(export_path, spool_path):
+            elapsed = wall_time(command, tmp, args.repeat)
+            imports = import_times(command, tmp)
+            top_level = sorted((entry for entry in imports if entry[1] == 0), key=lambda entry: -entry[2])
+            loaded = {module for module, _, _ in imports}
+            heavy = [module for module in HEAVY_MODULES if module in loaded]
+            print(f"\n[*] {label}: {elapsed * 1000:.1f}ms, {sum(entry[2] for entry in top_level) / 1000:.1f}ms importing")
+            print(f"  - heavy modules: {', '.join(heavy) or 'none'}")
+            for module, _, cumulative in top_level[:args.top]:
+                print(f"  - {cumulative / 1000:7.1f}ms {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Per-case cost of building and serialising test cases.
+
+Compares the validated pydantic TestCase (built from the comma-joined strings it
+expects) with the TestCaseRecord the importer fills directly, for both
+construction and conversion into the testCaseData GraphQL input.
+
+    python benchmarks/bench_test_case_construction.py --cases 20000
+"""
+import argparse, os, random, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectrapi.models import TestCase, TestCaseRecord
+from vectrapi.vectr_api_client import _create_test_case_vars
+from delivrto.transform import generate_vectr_test_case
+from bench_outcome_notes import BenchConnection, synthetic_email
+
+
+def record_fields(record):
+    return {field: value for field, value in record}
+
+
+def test_case_kwargs(record):
+    """The string keyword arguments TestCase validation expects for the same data"""
+    kwargs = {}
+    for field in TestCase.__fields__.values():
+        value = getattr(record, field.name)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            value = ",".join(v["name"] if isinstance(v, dict) else v for v in value)
+        kwargs[field.alias] = value
+    return kwargs
+
+
+def per_case_us(func, count, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TestCase construction and serialisation")
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vectr_con = BenchConnection()
+    records = [generate_vectr_test_case(vectr_con, synthetic_email(i, 2, 2, rng), False) for i in range(args.cases)]
+    fields = [record_fields(r) for r in records]
+    kwargs = [test_case_kwargs(r) for r in records]
+
+    test_cases = [TestCase(**kw) for kw in kwargs]
+    if _create_test_case_vars("db", "c", test_cases) != _create_test_case_vars("db", "c", records):
+        sys.exit("[!] TestCaseRecord serialises differently from TestCase")
+    print(f"[+] testCaseData identical for {len(records)} test cases")
+
+    count = len(records)
+    print("[*] Construction")
+    print(f"  - TestCase:        {per_case_us(lambda: [TestCase(**kw) for kw in kwargs], count, args.repeat):8.2f} us/case")
+    print(f"  - TestCaseRecord:  {per_case_us(lambda: [TestCaseRecord(**f) for f in fields], count, args.repeat):8.2f} us/case")
+    print("[*] Serialisation to testCaseData")
+    print(f"  - TestCase:        {per_case_us(lambda: _create_test_case_vars('db', 'c', test_cases), count, args.repeat):8.2f} us/case")
+    print(f"  - TestCaseRecord:  {per_case_us(lambda: _create_test_case_vars('db', 'c', records), count, args.repeat):8.2f} us/case")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Scaling benchmark for the import pipeline, run entirely offline.
+
+For each export size a synthetic export is written and then imported the way
+the CLI's sync path does it: the export is streamed with EmailResultsReader,
+transformed one upload window at a time and uploaded with
+create_test_cases_batched to a local VECTR stub. Parse, transform and upload
+throughput are timed separately. Each size runs in its own process so the
+reported peak RSS belongs to that size alone.
+
+    python benchmarks/run_benchmarks.py --sizes 100,10000,1000000 --latency-ms 20
+    python benchmarks/run_benchmarks.py --shape api --clicks 10 --error-rate 0.01 --json results.json
+"""
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+from itertools import islice
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from synthetic_export import SHAPES, write_export
+
+BENCHMARK_DB = "BENCH"
+BENCHMARK_CAMPAIGN_ID = "benchmark-campaign"
+
+
+class BenchConnection:
+    org_name = "Benchmark Org"
+
+
+def run_size(args) -> dict:
+    from delivrto.transform import generate_vectr_test_case
+    from delivrto.export_reader import EmailResultsReader
+    from vectrapi.vectr_api_client import VectrGQLConnParams, close_connections, create_test_cases_batched, get_connection
+    from vectr_stub import start_stub
+
+    stub = start_stub(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate, seed=args.seed)
+    connection_params = VectrGQLConnParams(api_key="bench:bench", vectr_gql_url=stub.url)
+    vectr_con = BenchConnection()
+    window = args.batch_size * args.max_in_flight
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"export-{args.single}.json")
+        write_export(path, args.single, args.shape, args.clicks, args.seed)
+        export_size = os.path.getsize(path)
+
+        parse = transform = upload = 0.0
+        emails = uploaded = failed_batches = 0
+        started = time.perf_counter()
+        with open(path) as data_file:
+            reader = iter(EmailResultsReader(data_file))
+            while True:
+                mark = time.perf_counter()
+                chunk = list(islice(reader, window))
+                parse += time.perf_counter() - mark
+                if not chunk:
+                    break
+                emails += len(chunk)
+
+                mark = time.perf_counter()
+                test_cases = [tc for tc in (generate_vectr_test_case(vectr_con, email_json, False) for email_json in chunk) if tc]
+                transform += time.perf_counter() - mark
+
+                mark = time.perf_counter()
+                report = create_test_cases_batched(connection_params, BENCHMARK_DB, BENCHMARK_CAMPAIGN_ID, test_cases,
+                                                   args.batch_size, args.max_in_flight)
+                upload += time.perf_counter() - mark
+                uploaded += len(report.created_ids)
+                failed_batches += len(report.failed_batches)
+        elapsed = time.perf_counter() - started
+
+    api_stats = get_connection(connection_params).stats
+    close_connections()
+    stub.shutdown()
+    return {
+        "emails": emails,
+        "shape": args.shape,
+        "export_bytes": export_size,
+        "uploaded": uploaded,
+        "failed_batches": failed_batches,
+        "parse_seconds": parse,
+        "transform_seconds": transform,
+        "upload_seconds": upload,
+        "total_seconds": elapsed,
+        "requests": api_stats.request_count,
+        "request_errors": api_stats.error_count,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def rate(count, seconds):
+    return f"{count / seconds:10.0f}/s" if seconds else "         -"
+
+
+def print_result(result):
+    emails = result["emails"]
+    print(f"\n[*] {emails} emails ({result['shape'].upper()} export, {result['export_bytes'] / 2**20:.1f} MB)")
+    print(f"  - parse:      {rate(emails, result['parse_seconds'])}")
+    print(f"  - transform:  {rate(emails, result['transform_seconds'])}")
+    print(f"  - upload:     {rate(result['uploaded'], result['upload_seconds'])}"
+          f"  ({result['requests']} requests, {result['request_errors']} errors, {result['failed_batches']} failed batches)")
+    print(f"  - end to end: {rate(emails, result['total_seconds'])}  ({result['total_seconds']:.2f}s)")
+    print(f"  - peak RSS:   {result['peak_rss_mb']:10.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse, transform and upload throughput against a local VECTR stub")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma separated export sizes, in emails")
+    parser.add_argument("--shape", choices=SHAPES, default="ui")
+    parser.add_argument("--clicks", type=int, default=3, help="Maximum clicks per email")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Stub delay per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra stub delay of up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_size(args)))
+        return
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--single", str(size)],
+                               capture_output=True, text=True)
+        if child.returncode:
+            sys.exit(f"[!] Benchmark of {size} emails failed:\n{child.stderr}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print_result(result)
+        results.append(result)
+
+    if args.json_path:
+        with open(args.json_path, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"\n[+] Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
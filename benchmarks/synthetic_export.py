@@ -0,0 +1,107 @@
+"""
+Synthetic delivr.to exports for benchmarking.
+
+UI exports are a top level array using the UI's mail types ("Link") and
+flattened mail_control_information.<Control> keys. API exports wrap the
+emails in {"emails": [...]} and use the API's mail types ("as_link") with a
+nested mail_control_information object. Emails are written one at a time so
+exports of a million emails don't need to fit in memory.
+
+    python benchmarks/synthetic_export.py --emails 100000 --shape api --clicks 5 export.json
+"""
+import argparse, json, random
+from typing import Iterator
+
+SHAPES = ["ui", "api"]
+
+MAIL_TYPES = {
+    "ui": ["Link", "Attachment", "Body"],
+    "api": ["as_link", "as_attachment", "as_body"],
+}
+
+STATUSES = [
+    "Delivered", "Delivered (Junk)", "Blocked (Dropped)", "Blocked (Bounced)",
+    "Stripped", "Held", "Rewritten", "Sent",
+]
+
+
+def synthetic_email(index: int, shape: str, clicks: int, rng: random.Random) -> dict:
+    email_json = {
+        "email_id": f"{index:08x}-0000-4000-8000-{index:012x}",
+        "payload_name": f"payload-{index % 211}.{rng.choice(['html', 'zip', 'iso', 'lnk'])}",
+        "payload_description": "Synthetic benchmark payload",
+        "payload_tags": rng.sample(["HTML", "Smuggling", "Archive", "Macro", "QR"], 2),
+        "payload_references": ["https://example.com/technique"],
+        "mail_type": rng.choice(MAIL_TYPES[shape]),
+        "sent": f"2023-{1 + index % 12:02d}-{1 + index % 28:02d} {index % 24:02d}:{index % 60:02d}",
+        "status": rng.choice(STATUSES),
+    }
+    click_count = rng.randint(0, clicks)
+    if click_count:
+        email_json["clicks"] = [
+            {
+                "timestamp": str(1685622840 + index + c),
+                "http_method": rng.choice(["GET", "POST"]),
+                "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+                "source_ip": f"10.{c % 256}.{index // 256 % 256}.{index % 256}",
+            }
+            for c in range(click_count)
+        ]
+    if rng.random() < 0.3:
+        email_json["sendgrid_reason"] = "550 5.7.1 Message rejected"
+
+    controls = {}
+    if rng.random() < 0.6:
+        rules = rng.randint(0, 3)
+        controls["Sublime"] = {
+            "state": "flagged" if rules else "delivered",
+            "flagged_rules": [{"name": f"Suspicious attachment {r}"} for r in range(rules)],
+        }
+    if rng.random() < 0.6:
+        threats = rng.randint(0, 2)
+        controls["Defender"] = {
+            "state": rng.choice(["Delivered", "Junked", "Quarantined"]),
+            "threat_types": ",".join(["Phish", "Malware"][:threats]),
+            "threat_names": ",".join(["Trojan:HTML/Phish", "Trojan:Win32/Wacatac"][:threats]),
+            "detection_methods": {"Phish": ["URL detonation reputation"]} if threats else {},
+        }
+    if controls:
+        if shape == "api":
+            email_json["mail_control_information"] = controls
+        else:
+            for control, data in controls.items():
+                email_json[f"mail_control_information.{control}"] = data
+    return email_json
+
+
+def synthetic_emails(count: int, shape: str = "ui", clicks: int = 3, seed: int = 0) -> Iterator[dict]:
+    rng = random.Random(seed)
+    for index in range(count):
+        yield synthetic_email(index, shape, clicks, rng)
+
+
+def write_export(path: str, count: int, shape: str = "ui", clicks: int = 3, seed: int = 0):
+    """Write a synthetic export of count emails to path"""
+    with open(path, "w") as export:
+        export.write('{"emails": [' if shape == "api" else "[")
+        for index, email_json in enumerate(synthetic_emails(count, shape, clicks, seed)):
+            if index:
+                export.write(",\n")
+            export.write(json.dumps(email_json))
+        export.write("]}" if shape == "api" else "]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic delivr.to export")
+    parser.add_argument("path")
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--shape", choices=SHAPES, default="ui")
+    parser.add_argument("--clicks", type=int, default=3, help="Maximum clicks per email")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_export(args.path, args.emails, args.shape, args.clicks, args.seed)
+    print(f"[+] Wrote {args.emails} email {args.shape.upper()} export to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Local stand-in for the VECTR GraphQL API.
+
+Implements the organisation, assessment and campaign lookups, the paginated
+test case reads and the assessment, campaign and test case (create and update)
+mutations vectr_api_client sends, keeping everything in memory. Every request can be delayed (--latency-ms with
+--jitter-ms) and a fraction of them answered with a GraphQL error
+(--error-rate). Test case mutations larger than --overload-above answer 503,
+and those holding a test case whose name contains --reject-name fail with a
+GraphQL error, to exercise adaptive batching. gzip-encoded request bodies
+are accepted and responses are gzip-encoded for clients that accept it. Any
+organisation name resolves, and test cases can be created in any campaign ID.
+
+Run it standalone and point vectr.env at it to benchmark the CLI itself:
+
+    python benchmarks/vectr_stub.py --port 8765 --latency-ms 20
+    VECTR_GQL_URL="http://127.0.0.1:8765/graphql"
+"""
+import argparse, gzip, json, random, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class VectrStubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.organizations: Dict[str, str] = {}
+        self.assessments: Dict[Tuple[str, str], str] = {}
+        # Campaign IDs keyed by (db, assessment ID, name)
+        self.campaigns: Dict[Tuple[str, str, str], str] = {}
+        self.test_cases: Dict[str, List[dict]] = {}
+        self.test_cases_by_id: Dict[str, dict] = {}
+        self.request_count = 0
+        self.error_count = 0
+
+    @property
+    def test_case_count(self) -> int:
+        return sum(len(test_cases) for test_cases in self.test_cases.values())
+
+    def _id(self, table: dict, key, create: bool) -> Optional[str]:
+        if key not in table and create:
+            table[key] = str(uuid.uuid4())
+        return table.get(key)
+
+    def resolve(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        with self.lock:
+            if "testcases(" in query:
+                # Cursors are offsets into the campaign's test cases
+                test_cases = self.test_cases.get(variables["campaignId"], [])
+                start = int(variables.get("after") or 0)
+                end = start + (variables.get("first") or len(test_cases))
+                return {"testcases": {
+                    "nodes": [dict(test_case) for test_case in test_cases[start:end]],
+                    "pageInfo": {"hasNextPage": end < len(test_cases), "endCursor": str(min(end, len(test_cases)))}
+                }}
+            if "organizations(" in query:
+                org_id = self._id(self.organizations, variables["nameVar"], True)
+                return {"organizations": {"nodes": [{"id": org_id, "name": variables["nameVar"]}]}}
+            if "assessments(" in query:
+                return {"assessments": {"nodes": self._nodes(self.assessments, variables)}}
+            if "campaigns(" in query:
+                return {"campaigns": {"nodes": self._campaign_nodes(variables)}}
+            if "assessment {" in query:
+                request = variables["input"]
+                created = [self._created(self.assessments, (request["db"], data["name"]), data["name"]) for data in request["assessmentData"]]
+                return {"assessment": {"create": {"assessments": created}}}
+            if "campaign {" in query:
+                request = variables["input"]
+                created = [self._created(self.campaigns, (request["db"], request["assessmentId"], data["name"]), data["name"])
+                           for data in request["campaignData"]]
+                return {"campaign": {"create": {"campaigns": created}}}
+            if "createWithTemplateMatchByName" in query:
+                request = variables["input"]
+                campaign_test_cases = self.test_cases.setdefault(request["campaignId"], [])
+                created = []
+                for test_case_input in request["createTestCaseInputs"]:
+                    data = test_case_input["testCaseData"]
+                    test_case = {"id": str(uuid.uuid4()), "name": data["name"], "description": data.get("description")}
+                    self._set_results(test_case, data)
+                    campaign_test_cases.append(test_case)
+                    self.test_cases_by_id[test_case["id"]] = test_case
+                    created.append({"id": test_case["id"], "name": test_case["name"]})
+                return {"testCase": {"createWithTemplateMatchByName": {"testCases": created}}}
+            if "update(" in query:
+                updated = []
+                for test_case_update in variables["input"]["testCaseUpdates"]:
+                    test_case = self.test_cases_by_id.get(test_case_update["testCaseId"])
+                    if test_case is None:
+                        raise KeyError(f"test case {test_case_update['testCaseId']} not found")
+                    self._set_results(test_case, test_case_update["testCaseData"])
+                    updated.append({"id": test_case["id"], "name": test_case["name"]})
+                return {"testCase": {"update": {"testCases": updated}}}
+            if "campaign(" in query:
+                campaign_id = variables["idVar"]
+                if campaign_id not in self.test_cases and campaign_id not in self.campaigns.values():
+                    raise KeyError(f"campaign {campaign_id} not found")
+                test_cases = list(self.test_cases.get(campaign_id, []))
+                return {"campaign": {"id": campaign_id, "name": "", "testCases": test_cases}}
+        raise ValueError("operation not supported by the VECTR stub")
+
+    def _set_results(self, test_case: dict, data: Dict[str, Any]):
+        # Shaped as VECTR returns them
+        if "outcome" in data:
+            test_case["outcome"] = {"name": data["outcome"]} if data["outcome"] else None
+        if "outcomeNotes" in data:
+            test_case["outcomeNotes"] = data["outcomeNotes"]
+        if "alertTriggered" in data:
+            test_case["alertTriggered"] = data["alertTriggered"] == "Yes"
+        if "tags" in data:
+            test_case["tags"] = [{"name": tag} for tag in data["tags"] or []]
+
+    def _nodes(self, table: dict, variables: Dict[str, Any]) -> List[dict]:
+        vectr_id = table.get((variables["db"], variables["nameVar"]))
+        return [{"id": vectr_id, "name": variables["nameVar"]}] if vectr_id else []
+
+    def _campaign_nodes(self, variables: Dict[str, Any]) -> List[dict]:
+        assessment_names = {assessment_id: name for (_, name), assessment_id in self.assessments.items()}
+        return [{"id": campaign_id, "name": name, "assessment": {"name": assessment_names.get(assessment_id)}}
+                for (db, assessment_id, name), campaign_id in self.campaigns.items()
+                if db == variables["db"] and name == variables["nameVar"]]
+
+    def _created(self, table: dict, key: tuple, name: str) -> dict:
+        return {"id": self._id(table, key, True), "name": name, "description": "", "createTime": int(time.time())}
+
+
+class VectrStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None,
+                 overload_above: int = 0, reject_name: Optional[str] = None):
+        super().__init__(address, VectrStubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.overload_above = overload_above
+        self.reject_name = reject_name
+        self.rng = random.Random(seed)
+        self.state = VectrStubState()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/graphql"
+
+
+class VectrStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server: VectrStubServer = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        body = json.loads(body)
+        delay = server.latency + server.rng.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        with server.state.lock:
+            server.state.request_count += 1
+        test_case_inputs = ((body.get("variables") or {}).get("input") or {}).get("createTestCaseInputs") or []
+        if server.overload_above and len(test_case_inputs) > server.overload_above:
+            with server.state.lock:
+                server.state.error_count += 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            if server.error_rate and server.rng.random() < server.error_rate:
+                raise RuntimeError("injected error")
+            if server.reject_name and any(server.reject_name in data["testCaseData"]["name"] for data in test_case_inputs):
+                raise ValueError(f"test case matching {server.reject_name!r} rejected")
+            response = {"data": server.state.resolve(body["query"], body.get("variables") or {})}
+        except Exception as e:
+            with server.state.lock:
+                server.state.error_count += 1
+            response = {"data": None, "errors": [{"message": str(e)}]}
+        payload = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            payload = gzip.compress(payload, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub(port: int = 0, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None,
+               overload_above: int = 0, reject_name: Optional[str] = None) -> VectrStubServer:
+    """Serve a VECTR stub on a background thread, port 0 picks a free port"""
+    server = VectrStubServer(("127.0.0.1", port), latency, jitter, error_rate, seed, overload_above, reject_name)
+    threading.Thread(target=server.serve_forever, name="vectr-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local VECTR GraphQL stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra delay of up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--overload-above", type=int, default=0, help="Answer 503 to test case mutations with more test cases than this")
+    parser.add_argument("--reject-name", help="Fail test case mutations holding a test case whose name contains this")
+    args = parser.parse_args()
+
+    server = VectrStubServer(("127.0.0.1", args.port), args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, args.seed,
+                             args.overload_above, args.reject_name)
+    print(f"[*] VECTR stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    state = server.state
+    print(f"\n[*] {state.request_count} requests, {state.error_count} errors, {state.test_case_count} test cases created")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import asyncio
+import sys
+from itertools import islice
+from pydantic import BaseModel
+from typing import Any, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple
+from vectrapi.models import Campaign, TestCaseInput
+from vectrapi.vectr_api_client import TestCaseBatchResult, TestCaseUploadReport, VectrGQLStats
+from vectrapi.vectr_api_async_client import AsyncVectrGQLConnection, \
+    create_assessment, \
+    create_campaigns, \
+    create_test_case_batch, \
+    get_org_id_for_campaign_and_assessment_data, \
+    get_assessment_by_name, \
+    get_campaign_by_name, \
+    iter_campaign_test_case_pages
+from .campaign_index import CampaignTestCaseIndex
+from .checkpoint import ImportCheckpoint
+from .id_cache import VectrIdCache, ORGANIZATION, ASSESSMENT, CAMPAIGN, campaign_cache_name
+
+# Number of emails handed to a worker thread per transform step
+TRANSFORM_CHUNK_SIZE = 50
+
+
+class AsyncImportResult(BaseModel):
+    emails_uploaded: List[str] = []
+    emails_skipped: int = 0
+    upload_report: TestCaseUploadReport = TestCaseUploadReport()
+    stats: VectrGQLStats = VectrGQLStats()
+
+
+async def _lookup_or_none(lookup) -> Optional[str]:
+    try:
+        return await lookup
+    except RuntimeError:
+        return None
+
+
+async def bootstrap_vectr_campaign(connection: AsyncVectrGQLConnection, vectr_con, id_cache: Optional[VectrIdCache] = None) -> str:
+    """Resolves the campaign ID for vectr_con, from id_cache when it holds a fresh one"""
+    vectr_con.reporter.resolving_campaign(vectr_con)
+
+    campaign_id = None
+    if id_cache:
+        campaign_id = id_cache.get(vectr_con.connection_params.vectr_gql_url, vectr_con.target_db, CAMPAIGN,
+                                   campaign_cache_name(vectr_con.assessment_name, vectr_con.campaign_name))
+    if campaign_id:
+        vectr_con.reporter.campaign_resolved(vectr_con, campaign_id, cached=True)
+        vectr_con.campaign_id_cached = True
+        return campaign_id
+    return await resolve_vectr_campaign(connection, vectr_con, id_cache)
+
+
+async def resolve_vectr_campaign(connection: AsyncVectrGQLConnection, vectr_con, id_cache: Optional[VectrIdCache] = None) -> str:
+    """Resolves (or creates) the assessment and campaign for vectr_con, running uncached lookups concurrently"""
+    vectr_url = vectr_con.connection_params.vectr_gql_url
+    target_db = vectr_con.target_db
+    assessment_name = vectr_con.assessment_name
+    campaign_name = vectr_con.campaign_name
+
+    org_id = id_cache.get(vectr_url, "", ORGANIZATION, vectr_con.org_name) if id_cache else None
+    assessment_id = id_cache.get(vectr_url, target_db, ASSESSMENT, assessment_name) if id_cache else None
+
+    org_id, assessment_id, campaign_id = await asyncio.gather(
+        _cached(org_id) or get_org_id_for_campaign_and_assessment_data(connection, vectr_con.org_name),
+        _cached(assessment_id) or _lookup_or_none(get_assessment_by_name(connection, target_db, assessment_name)),
+        _lookup_or_none(get_campaign_by_name(connection, target_db, campaign_name, assessment_name))
+    )
+
+    if assessment_id:
+        vectr_con.reporter.assessment_resolved(vectr_con, assessment_id, created=False)
+    else:
+        created_assessment_detail = await create_assessment(connection, target_db, org_id, assessment_name)
+        assessment_id = created_assessment_detail.get(assessment_name).get("id")
+        vectr_con.reporter.assessment_resolved(vectr_con, assessment_id, created=True)
+
+    if campaign_id:
+        vectr_con.reporter.campaign_resolved(vectr_con, campaign_id)
+    else:
+        cpgn = {campaign_name: Campaign(name=campaign_name, test_cases=[])}
+        created_campaigns = await create_campaigns(connection, target_db, org_id, cpgn, assessment_id)
+        campaign_id = created_campaigns.get(campaign_name).get("id")
+        vectr_con.reporter.campaign_resolved(vectr_con, campaign_id, created=True)
+
+    if id_cache:
+        id_cache.put(vectr_url, "", ORGANIZATION, vectr_con.org_name, org_id)
+        id_cache.put(vectr_url, target_db, ASSESSMENT, assessment_name, assessment_id)
+        id_cache.put(vectr_url, target_db, CAMPAIGN, campaign_cache_name(assessment_name, campaign_name), campaign_id)
+    return campaign_id
+
+
+def _cached(vectr_id: Optional[str]):
+    if vectr_id is None:
+        return None
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(vectr_id)
+    return future
+
+
+def _transform_chunk(emails: Iterator[dict], process_emails: Callable[[List[dict]], List[Any]]) -> Tuple[List[Tuple[str, TestCaseInput]], bool]:
+    transformed = []
+    chunk = list(islice(emails, TRANSFORM_CHUNK_SIZE))
+    for email_json, test_case in zip(chunk, process_emails(chunk)):
+        if test_case:
+            transformed.append((email_json['email_id'], test_case))
+    return transformed, len(chunk) < TRANSFORM_CHUNK_SIZE
+
+
+async def _produce_batches(emails: Iterable[dict],
+                           process_emails: Callable[[List[dict]], List[Any]],
+                           batch_size: int,
+                           batch_queue: asyncio.Queue,
+                           campaign_index: Optional[asyncio.Future] = None,
+                           skip_existing: bool = False,
+                           checkpoint: Optional[ImportCheckpoint] = None):
+    loop = asyncio.get_running_loop()
+    if checkpoint is not None:
+        emails = checkpoint.skip_confirmed(emails)
+    if campaign_index is not None:
+        # Emails already in the campaign are dropped before they are transformed, and
+        # nothing is read until a resumed checkpoint has been reconciled with the campaign
+        index = await campaign_index
+        if skip_existing:
+            emails = index.skip_imported(emails)
+    email_iter = iter(emails)
+    pending: List[Tuple[str, TestCaseInput]] = []
+    index = start = 0
+    exhausted = False
+    while not exhausted:
+        # Parsing and transformation run on a worker thread so the event loop
+        # keeps servicing bootstrap lookups and in-flight uploads meanwhile
+        transformed, exhausted = await loop.run_in_executor(None, _transform_chunk, email_iter, process_emails)
+        pending.extend(transformed)
+        while len(pending) >= batch_size or (exhausted and pending):
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            if checkpoint is not None:
+                checkpoint.mark_parsed([(email_id, test_case.name) for email_id, test_case in batch])
+            await batch_queue.put((TestCaseBatchResult(index=index, start=start, size=len(batch)), batch))
+            index += 1
+            start += len(batch)
+
+
+async def _upload_batches(connection: AsyncVectrGQLConnection,
+                          vectr_con,
+                          batch_queue: asyncio.Queue,
+                          results: List[Tuple[TestCaseBatchResult, List[str]]],
+                          checkpoint: Optional[ImportCheckpoint] = None,
+                          refresh_campaign: Optional[Callable[[str], Awaitable[bool]]] = None):
+    while True:
+        item = await batch_queue.get()
+        if item is None:
+            return
+        batch, batch_items = item
+        email_ids = [email_id for email_id, _ in batch_items]
+        if checkpoint is not None:
+            checkpoint.mark_sent(email_ids, batch.index)
+        test_cases = [tc for _, tc in batch_items]
+        campaign_id = vectr_con.campaign_id
+        await create_test_case_batch(connection, vectr_con.target_db, campaign_id, test_cases, batch)
+        if not batch.succeeded and refresh_campaign and await refresh_campaign(campaign_id):
+            # One more attempt against the refreshed campaign ID
+            await create_test_case_batch(connection, vectr_con.target_db, vectr_con.campaign_id, test_cases, batch,
+                                         batch_retries=batch.attempts)
+        if checkpoint is not None and batch.succeeded:
+            checkpoint.mark_confirmed(email_ids, _created_test_case_ids(batch))
+        results.append((batch, email_ids))
+
+
+def _created_test_case_ids(batch: TestCaseBatchResult) -> List[Optional[str]]:
+    if len(batch.created) == batch.size:
+        return [test_case["id"] for test_case in batch.created]
+    return [None] * batch.size
+
+
+async def run_async_import(vectr_con,
+                           emails: Iterable[dict],
+                           process_emails: Callable[[List[dict]], List[Any]],
+                           batch_size: int = 100,
+                           max_in_flight: int = 4,
+                           skip_existing: bool = False,
+                           checkpoint: Optional[ImportCheckpoint] = None,
+                           id_cache: Optional[VectrIdCache] = None) -> AsyncImportResult:
+    """Imports emails into VECTR with bootstrap, transformation and upload running concurrently
+
+    The VECTR bootstrap lookups start immediately while emails are transformed on a worker
+    thread; transformed test cases are grouped into batches in input order and fed through a
+    bounded queue to max_in_flight upload tasks. Batches are partitioned exactly as in
+    create_test_cases_batched so the outcome matches the synchronous import.
+
+    Parameters
+    ----------
+    vectr_con : Importer
+        Connection details, its campaign_id is filled in once the bootstrap completes; the
+        campaign lookups, ID refreshes and campaign index go to its reporter
+    emails : Iterable[dict]
+        delivr.to email results
+    process_emails : Callable[[List[dict]], List[Any]]
+        Turns a chunk of email results into one TestCase or TestCaseRecord each, or a falsy value for those that can't be processed
+    batch_size : int
+        Maximum number of Test Cases sent in one mutation, 0 sends everything in one batch
+    max_in_flight : int
+        Maximum number of batch mutations in flight at the same time
+    skip_existing : bool
+        Skip emails whose test case the campaign already holds, see CampaignTestCaseIndex
+    checkpoint : Optional[ImportCheckpoint]
+        Ledger recording each email's progress, confirmed emails in it are skipped
+    id_cache : Optional[VectrIdCache]
+        Cache of resolved VECTR IDs, a cached campaign ID is refreshed if a batch fails with it
+
+    Returns
+    -------
+    AsyncImportResult
+        Uploaded email IDs, the per-batch upload report and request stats
+    """
+    if batch_size <= 0:
+        batch_size = sys.maxsize
+    max_in_flight = max(max_in_flight, 1)
+    results: List[Tuple[TestCaseBatchResult, List[str]]] = []
+    unconfirmed_sent = checkpoint is not None and bool(checkpoint.unconfirmed_sent())
+    needs_index = skip_existing or unconfirmed_sent
+    campaign_index = asyncio.get_running_loop().create_future() if needs_index else None
+
+    async with AsyncVectrGQLConnection(vectr_con.connection_params) as connection:
+        refresh_lock = asyncio.Lock()
+
+        async def refresh_campaign(failed_campaign_id: str) -> bool:
+            async with refresh_lock:
+                if vectr_con.campaign_id != failed_campaign_id:
+                    # Another upload task already refreshed it
+                    return True
+                if not vectr_con.campaign_id_cached:
+                    return False
+                vectr_con.campaign_id_cached = False
+                vectr_con.reporter.refreshing_campaign_id(vectr_con)
+                if id_cache:
+                    id_cache.invalidate(vectr_con.connection_params.vectr_gql_url, vectr_con.target_db)
+                vectr_con.campaign_id = await resolve_vectr_campaign(connection, vectr_con, id_cache)
+                return vectr_con.campaign_id != failed_campaign_id
+
+        batch_queue = asyncio.Queue(maxsize=max_in_flight * 2)
+        producer = asyncio.create_task(_produce_batches(
+            emails, process_emails, batch_size, batch_queue, campaign_index, skip_existing, checkpoint
+        ))
+        uploaders = []
+        try:
+            vectr_con.campaign_id = await bootstrap_vectr_campaign(connection, vectr_con, id_cache)
+            if campaign_index is not None:
+                index = CampaignTestCaseIndex([])
+                async for page in iter_campaign_test_case_pages(connection, vectr_con.target_db, vectr_con.campaign_id,
+                                                                vectr_con.options.page_size):
+                    index.add(page)
+                reconciled = checkpoint.reconcile(index) if unconfirmed_sent else None
+                vectr_con.reporter.campaign_indexed(vectr_con, len(index), reconciled)
+                campaign_index.set_result(index)
+            uploaders = [
+                asyncio.create_task(_upload_batches(
+                    connection, vectr_con, batch_queue, results, checkpoint, refresh_campaign
+                ))
+                for _ in range(max_in_flight)
+            ]
+            await producer
+            for _ in uploaders:
+                await batch_queue.put(None)
+            await asyncio.gather(*uploaders)
+        finally:
+            for task in [producer, *uploaders]:
+                task.cancel()
+
+    results.sort(key=lambda result: result[0].index)
+    import_result = AsyncImportResult(
+        upload_report=TestCaseUploadReport(batches=[batch for batch, _ in results]),
+        stats=connection.stats,
+        emails_skipped=campaign_index.result().skipped if skip_existing else 0
+    )
+    for batch, email_ids in results:
+        if batch.succeeded:
+            import_result.emails_uploaded.extend(email_ids)
+    return import_result
@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+from vectrapi.models import TestCaseInput, TestCaseUploadReport
+from .checkpoint import ImportCheckpoint
+from .importer import Importer
+
+# Seconds a queued test case waits for its batch to fill before the batch is sent anyway
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+
+class BackgroundUploader:
+    """Uploads test cases queued one at a time in batches, on a background thread
+
+    add() only queues a test case, so whoever produces them, e.g. an operator
+    confirming emails one by one with --step, never waits on VECTR. A worker thread
+    collects the queued test cases and uploads them with Importer.upload_test_cases
+    once batch_size are pending, or once the first of them has waited flush_interval
+    seconds. close() uploads whatever is still queued and waits for it, after which
+    uploaded holds the email IDs whose test cases landed in VECTR and failed counts
+    the test cases that didn't. What happens on the worker thread is reported
+    through the importer's reporter, never printed.
+
+    Parameters
+    ----------
+    importer : Importer
+        Importer whose campaign the test cases are uploaded into
+    upload_report : TestCaseUploadReport
+        Report the upload batches are merged into
+    checkpoint : Optional[ImportCheckpoint]
+        Ledger recording each email's progress
+    batch_size : Optional[int]
+        Test cases uploaded together, the importer's batch size by default, 0 waits for flush_interval
+    flush_interval : float
+        Longest a queued test case waits for its batch to fill
+    """
+
+    def __init__(self,
+                 importer: Importer,
+                 upload_report: TestCaseUploadReport,
+                 checkpoint: Optional[ImportCheckpoint] = None,
+                 batch_size: Optional[int] = None,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.importer = importer
+        self.upload_report = upload_report
+        self.checkpoint = checkpoint
+        self.batch_size = importer.options.batch_size if batch_size is None else batch_size
+        self.flush_interval = flush_interval
+        self.queued = 0
+        self.uploaded: List[str] = []
+        self.failed = 0
+        # (email ID, test case) pairs, None once closed
+        self._queue: "queue.Queue[Optional[Tuple[str, TestCaseInput]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="background-upload", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Test cases queued whose upload hasn't finished yet"""
+        return self.queued - len(self.uploaded) - self.failed
+
+    def add(self, email_id: str, test_case: TestCaseInput):
+        self.queued += 1
+        self._queue.put((email_id, test_case))
+
+    def _run(self):
+        pending = []
+        flush_at = None
+        while True:
+            timeout = None if flush_at is None else max(flush_at - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._upload(pending)
+                pending, flush_at = [], None
+                continue
+            if item is None:
+                self._upload(pending)
+                return
+            pending.append(item)
+            if flush_at is None:
+                flush_at = time.monotonic() + self.flush_interval
+            if self.batch_size and len(pending) >= self.batch_size:
+                self._upload(pending)
+                pending, flush_at = [], None
+
+    def _upload(self, pending: List[Tuple[str, TestCaseInput]]):
+        if not pending:
+            return
+        email_ids = [email_id for email_id, _ in pending]
+        test_cases = [test_case for _, test_case in pending]
+        try:
+            uploaded = self.importer.upload_test_cases(test_cases, email_ids, self.upload_report, self.checkpoint,
+                                                       batch_size=len(test_cases))
+        except Exception as e:
+            # Keep the thread alive for the rest of the queue, these emails are reported as not uploaded
+            self.importer.reporter.background_upload_failed(self.importer, len(test_cases), e)
+            uploaded = []
+        self.failed += len(test_cases) - len(uploaded)
+        self.uploaded.extend(uploaded)
+
+    def close(self):
+        """Uploads the test cases still queued and waits until every upload finished"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
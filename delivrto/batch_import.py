@@ -0,0 +1,158 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
+from vectrapi.models import Campaign
+from vectrapi.vectr_api_client import VectrGQLConnParams, \
+    create_assessment, \
+    create_campaigns, \
+    get_org_id_for_campaign_and_assessment_data, \
+    get_assessment_by_name, \
+    get_campaign_by_name
+from .export_reader import COMPRESSED_EXTENSIONS
+from .id_cache import VectrIdCache, ORGANIZATION, ASSESSMENT, CAMPAIGN, campaign_cache_name
+
+EXPORT_EXTENSIONS = [".json", ".jsonl", ".ndjson"]
+
+
+class ImportJob(BaseModel):
+    path: str
+    assessment_name: str
+    campaign_name: str
+    campaign_id: Optional[str] = None
+    campaign_id_cached: bool = False
+
+
+def export_stem(path: str) -> str:
+    """File name of an export without its export extensions, and a compression extension following them"""
+    name = os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    if ext.lower() in COMPRESSED_EXTENSIONS and os.path.splitext(stem)[1].lower() in EXPORT_EXTENSIONS:
+        name = stem
+        stem, ext = os.path.splitext(name)
+    while ext.lower() in EXPORT_EXTENSIONS:
+        name = stem
+        stem, ext = os.path.splitext(name)
+    return name
+
+
+def load_import_manifest(manifest_path: str, default_assessment: str, default_campaign: str) -> List[ImportJob]:
+    """Reads import jobs from a JSON manifest
+
+    The manifest is a list of objects with a ``path`` to an export and optional ``assessment``
+    and ``campaign`` names, which default to the ones in vectr.env. Relative paths are
+    resolved against the manifest's directory.
+    """
+    with open(manifest_path, 'r') as manifest_file:
+        entries = json.load(manifest_file)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    return [
+        ImportJob(
+            path=os.path.join(base_dir, entry["path"]),
+            assessment_name=entry.get("assessment") or default_assessment,
+            campaign_name=entry.get("campaign") or default_campaign
+        )
+        for entry in entries
+    ]
+
+
+def jobs_from_directory(directory: str, default_assessment: str) -> List[ImportJob]:
+    """One import job per export in directory, each into a campaign named after its file"""
+    return [
+        ImportJob(
+            path=os.path.join(directory, name),
+            assessment_name=default_assessment,
+            campaign_name=export_stem(name)
+        )
+        for name in sorted(os.listdir(directory))
+        if os.path.isfile(os.path.join(directory, name)) and export_stem(name) != name
+    ]
+
+
+def _lookup_or_none(lookup, *lookup_args) -> Optional[str]:
+    try:
+        return lookup(*lookup_args)
+    except RuntimeError:
+        return None
+
+
+def resolve_import_jobs(connection_params: VectrGQLConnParams,
+                        target_db: str,
+                        org_name: str,
+                        jobs: List[ImportJob],
+                        id_cache: Optional[VectrIdCache] = None):
+    """Resolves (or creates) the campaign of every import job, filling in their campaign_id
+
+    Uncached assessments and campaigns are looked up concurrently, and all missing campaigns
+    of an assessment are created with a single create_campaigns call. Campaigns are resolved
+    per (assessment name, campaign name), so equally named campaigns of different assessments
+    stay apart.
+    """
+    vectr_url = connection_params.vectr_gql_url
+    assessment_names = sorted({job.assessment_name for job in jobs})
+    campaign_keys = sorted({(job.assessment_name, job.campaign_name) for job in jobs})
+
+    def cached(db: str, kind: str, name: str) -> Optional[str]:
+        return id_cache.get(vectr_url, db, kind, name) if id_cache else None
+
+    org_id = cached("", ORGANIZATION, org_name)
+    assessment_ids: Dict[str, Optional[str]] = {name: cached(target_db, ASSESSMENT, name) for name in assessment_names}
+    campaign_ids: Dict[Tuple[str, str], Optional[str]] = {
+        key: cached(target_db, CAMPAIGN, campaign_cache_name(*key)) for key in campaign_keys
+    }
+    cached_campaigns = {key for key, campaign_id in campaign_ids.items() if campaign_id}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        org_lookup = None if org_id else executor.submit(get_org_id_for_campaign_and_assessment_data, connection_params, org_name)
+        assessment_lookups = {
+            name: executor.submit(_lookup_or_none, get_assessment_by_name, connection_params, target_db, name)
+            for name, assessment_id in assessment_ids.items() if not assessment_id
+        }
+        campaign_lookups = {
+            (assessment_name, campaign_name): executor.submit(
+                _lookup_or_none, get_campaign_by_name, connection_params, target_db, campaign_name, assessment_name)
+            for (assessment_name, campaign_name), campaign_id in campaign_ids.items() if not campaign_id
+        }
+        assessment_ids.update({name: lookup.result() for name, lookup in assessment_lookups.items()})
+        campaign_ids.update({key: lookup.result() for key, lookup in campaign_lookups.items()})
+        if org_lookup:
+            org_id = org_lookup.result()
+
+    for assessment_name in assessment_names:
+        if assessment_ids[assessment_name]:
+            print(f"  - Using existing assessment '{assessment_name}' with ID: {assessment_ids[assessment_name]}")
+        else:
+            created_assessment_detail = create_assessment(connection_params, target_db, org_id, assessment_name)
+            assessment_ids[assessment_name] = created_assessment_detail.get(assessment_name).get("id")
+            print(f"  - Created assessment '{assessment_name}' with ID: {assessment_ids[assessment_name]}")
+
+    missing_campaigns: Dict[str, Dict[str, Campaign]] = {}
+    for assessment_name, campaign_name in campaign_keys:
+        if not campaign_ids[(assessment_name, campaign_name)]:
+            missing_campaigns.setdefault(assessment_name, {})[campaign_name] = Campaign(name=campaign_name, test_cases=[])
+    for assessment_name, campaigns in missing_campaigns.items():
+        created_campaigns = create_campaigns(connection_params, target_db, org_id, campaigns, assessment_ids[assessment_name])
+        for campaign_name in campaigns:
+            campaign_ids[(assessment_name, campaign_name)] = created_campaigns.get(campaign_name).get("id")
+            print(f"  - Created campaign '{campaign_name}' in '{assessment_name}' with ID: "
+                  f"{campaign_ids[(assessment_name, campaign_name)]}")
+
+    for assessment_name, campaign_name in campaign_keys:
+        campaign_id = campaign_ids[(assessment_name, campaign_name)]
+        if (assessment_name, campaign_name) in cached_campaigns:
+            print(f"  - Using cached campaign '{campaign_name}' in '{assessment_name}' ID: {campaign_id}")
+        elif campaign_name not in missing_campaigns.get(assessment_name, {}):
+            print(f"  - Using existing campaign '{campaign_name}' in '{assessment_name}' with ID: {campaign_id}")
+
+    for job in jobs:
+        job.campaign_id = campaign_ids[(job.assessment_name, job.campaign_name)]
+        job.campaign_id_cached = (job.assessment_name, job.campaign_name) in cached_campaigns
+
+    if id_cache:
+        id_cache.put(vectr_url, "", ORGANIZATION, org_name, org_id)
+        for assessment_name, assessment_id in assessment_ids.items():
+            id_cache.put(vectr_url, target_db, ASSESSMENT, assessment_name, assessment_id)
+        for (assessment_name, campaign_name), campaign_id in campaign_ids.items():
+            id_cache.put(vectr_url, target_db, CAMPAIGN, campaign_cache_name(assessment_name, campaign_name), campaign_id)
@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+from typing import Any, Dict, Iterable, List
+
+# Formats a campaign can be exported in, by file extension
+EXPORT_FORMATS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+
+# Test case fields exported unless others are asked for
+DEFAULT_EXPORT_FIELDS = ["id", "name", "outcome", "tags", "outcomeNotes"]
+
+# Separator of the tag names in a CSV tags column
+CSV_TAG_SEPARATOR = ";"
+
+
+def export_format(path: str) -> str:
+    """Format of a campaign export at path, from its extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXPORT_FORMATS:
+        raise ValueError(f"can't export to '{ext or path}', use one of {', '.join(EXPORT_FORMATS)}")
+    return EXPORT_FORMATS[ext]
+
+
+def flatten_test_case(test_case: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """The fields of a test case as VECTR returns it, with the outcome as its name and the tags as a list of names"""
+    row = {}
+    for field in fields:
+        value = test_case.get(field)
+        if field == "outcome":
+            value = value["name"] if value else None
+        elif field == "tags":
+            value = [tag["name"] for tag in value or []]
+        row[field] = value
+    return row
+
+
+class CampaignExportWriter:
+    """Writes the test cases of a campaign as NDJSON or CSV, as they are read
+
+    Rows are written page by page, so an export of any size only ever holds one
+    page of test cases. The format follows the extension of path (see
+    EXPORT_FORMATS). In a CSV export the tags are joined by CSV_TAG_SEPARATOR.
+    Like a spool, the export is written to a temporary file next to path and only
+    renamed to path once closed.
+
+    Parameters
+    ----------
+    path : str
+        File the export is written to
+    fields : List[str]
+        Test case fields exported, in column order
+    """
+
+    def __init__(self, path: str, fields: List[str]):
+        self.path = path
+        self.fields = fields
+        self.format = export_format(path)
+        self.count = 0
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8", newline="")
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=fields)
+            self._csv.writeheader()
+
+    def write(self, test_cases: Iterable[Dict[str, Any]]):
+        rows = [flatten_test_case(test_case, self.fields) for test_case in test_cases]
+        if self.format == "csv":
+            for row in rows:
+                if "tags" in row:
+                    row["tags"] = CSV_TAG_SEPARATOR.join(row["tags"])
+            self._csv.writerows(rows)
+        else:
+            self._file.write("".join(json.dumps(row) + "\n" for row in rows))
+        self.count += len(rows)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def discard(self):
+        """Abandons an unfinished export, removing its temporary file"""
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
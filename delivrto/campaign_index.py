@@ -0,0 +1,72 @@
+import re
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from .transform import test_case_variant
+
+EMAIL_ID_PATTERN = re.compile(r"\*\*Email ID\*\*: *(\S+)")
+
+
+class CampaignTestCaseIndex:
+    """In-memory index of the test cases a VECTR campaign already holds
+
+    Test cases are keyed by their Variant name and the delivr.to Email ID embedded in
+    their description. Test cases without an Email ID (e.g. created by hand) are matched
+    on Variant name alone.
+
+    Parameters
+    ----------
+    test_cases : Iterable[dict]
+        Campaign test cases with id, name and description
+    keep_test_cases : bool
+        Keep every test case by ID as well, e.g. to compare their results
+    """
+
+    def __init__(self, test_cases: Iterable[dict], keep_test_cases: bool = False):
+        self.test_case_ids: Dict[Tuple[str, str], str] = {}
+        self.unidentified_variants: Dict[str, str] = {}
+        self.test_cases: Dict[str, dict] = {}
+        self.keep_test_cases = keep_test_cases
+        self.skipped = 0
+        self.add(test_cases)
+
+    def add(self, test_cases: Iterable[dict]):
+        """Indexes more of the campaign's test cases, e.g. the next page read from VECTR"""
+        for test_case in test_cases:
+            if self.keep_test_cases:
+                self.test_cases[test_case["id"]] = test_case
+            match = EMAIL_ID_PATTERN.search(test_case.get("description") or "")
+            if match:
+                self.test_case_ids[(test_case["name"], match.group(1))] = test_case["id"]
+            else:
+                self.unidentified_variants[test_case["name"]] = test_case["id"]
+
+    def __len__(self) -> int:
+        return len(self.test_case_ids) + len(self.unidentified_variants)
+
+    def find(self, email_json: dict) -> Optional[str]:
+        """Returns the ID of the test case already imported for email_json, if any"""
+        return self.find_variant(test_case_variant(email_json), email_json['email_id'])
+
+    def find_variant(self, variant: str, email_id: str) -> Optional[str]:
+        """Returns the ID of the test case already imported as variant for email_id, if any"""
+        test_case_id = self.test_case_ids.get((variant, email_id))
+        if test_case_id is None:
+            test_case_id = self.unidentified_variants.get(variant)
+        return test_case_id
+
+    def skip_imported(self, email_results: Iterable[dict], variant: Callable[[dict], str] = test_case_variant) -> Iterable[dict]:
+        """
+        Yields only the email results (or other records with an email_id) whose variant isn't in the campaign yet
+
+        A record missing the fields its variant or Email ID come from is yielded
+        unchanged, to be reported as failed where it is processed.
+        """
+        for email_json in email_results:
+            try:
+                test_case_id = self.find_variant(variant(email_json), email_json['email_id'])
+            except (KeyError, TypeError):
+                yield email_json
+                continue
+            if test_case_id is not None:
+                self.skipped += 1
+                continue
+            yield email_json
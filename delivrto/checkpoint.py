@@ -0,0 +1,129 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+PARSED = "parsed"
+SENT = "sent"
+CONFIRMED = "confirmed"
+
+
+class ImportCheckpoint:
+    """On-disk ledger of every email's progress through an import
+
+    Each email of an import is recorded as parsed once its test case is generated, sent
+    when the batch holding it is handed to VECTR and confirmed, with its VECTR test case
+    ID, once that batch succeeds. A resumed import skips confirmed emails and reconciles
+    emails left in the sent state against the campaign so nothing is sent twice.
+
+    Parameters
+    ----------
+    path : str
+        SQLite database file holding the ledger
+    import_key : str
+        Identifies the import (target campaign and export) the ledger rows belong to
+    resume : bool
+        Keep the ledger of a previous run of this import instead of starting afresh
+    """
+
+    def __init__(self, path: str, import_key: str, resume: bool = False):
+        self.import_key = import_key
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS email_state (
+                    import_key TEXT NOT NULL,
+                    email_id TEXT NOT NULL,
+                    variant TEXT,
+                    state TEXT NOT NULL,
+                    test_case_id TEXT,
+                    batch_index INTEGER,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (import_key, email_id)
+                )
+                """
+            )
+            if not resume:
+                self._db.execute("DELETE FROM email_state WHERE import_key = ?", (import_key,))
+        self._confirmed = {
+            email_id for (email_id,) in self._db.execute(
+                "SELECT email_id FROM email_state WHERE import_key = ? AND state = ?", (import_key, CONFIRMED)
+            )
+        }
+
+    def _write(self, sql: str, rows: Iterable[tuple]):
+        with self._lock, self._db:
+            self._db.executemany(sql, rows)
+
+    def mark_parsed(self, emails: List[Tuple[str, str]]):
+        """Records (email_id, variant) pairs whose test cases were generated"""
+        now = time.time()
+        self._write(
+            """
+            INSERT INTO email_state (import_key, email_id, variant, state, updated) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (import_key, email_id) DO UPDATE SET variant = excluded.variant, state = excluded.state,
+                test_case_id = NULL, batch_index = NULL, updated = excluded.updated
+            """,
+            [(self.import_key, email_id, variant, PARSED, now) for email_id, variant in emails]
+        )
+
+    def mark_sent(self, email_ids: List[str], batch_index: int):
+        now = time.time()
+        self._write(
+            "UPDATE email_state SET state = ?, batch_index = ?, updated = ? WHERE import_key = ? AND email_id = ?",
+            [(SENT, batch_index, now, self.import_key, email_id) for email_id in email_ids]
+        )
+
+    def mark_confirmed(self, email_ids: List[str], test_case_ids: List[Optional[str]]):
+        now = time.time()
+        self._write(
+            "UPDATE email_state SET state = ?, test_case_id = ?, updated = ? WHERE import_key = ? AND email_id = ?",
+            [(CONFIRMED, test_case_id, now, self.import_key, email_id)
+             for email_id, test_case_id in zip(email_ids, test_case_ids)]
+        )
+        with self._lock:
+            self._confirmed.update(email_ids)
+
+    def unconfirmed_sent(self) -> List[Tuple[str, str]]:
+        """(email_id, variant) pairs sent to VECTR without a confirmed result"""
+        with self._lock:
+            return list(self._db.execute(
+                "SELECT email_id, variant FROM email_state WHERE import_key = ? AND state = ?", (self.import_key, SENT)
+            ))
+
+    def reconcile(self, campaign_index) -> int:
+        """Confirms unconfirmed sent emails found in the campaign, returning how many were found
+
+        The remaining unconfirmed emails never reached VECTR and are left to be sent again.
+        """
+        found_ids, found_test_case_ids = [], []
+        for email_id, variant in self.unconfirmed_sent():
+            test_case_id = campaign_index.find_variant(variant, email_id)
+            if test_case_id is not None:
+                found_ids.append(email_id)
+                found_test_case_ids.append(test_case_id)
+        self.mark_confirmed(found_ids, found_test_case_ids)
+        return len(found_ids)
+
+    def skip_confirmed(self, email_results: Iterable[dict]) -> Iterator[dict]:
+        """Yields only the email results not yet confirmed in VECTR, and those without an email_id to be reported as failed"""
+        for email_json in email_results:
+            if email_json.get('email_id') in self._confirmed:
+                self.skipped += 1
+                continue
+            yield email_json
+
+    def state_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM email_state WHERE import_key = ? GROUP BY state", (self.import_key,)
+            ))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,192 @@
+import gzip
+import io
+import json
+from typing import Any, BinaryIO, Iterator, Optional, TextIO
+
+# Characters read from the export per refill of the parse buffer
+READ_CHUNK_SIZE = 1 << 16
+
+# Compressed export extensions and the compression each stands for
+COMPRESSED_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+# Leading bytes identifying a compressed export, whatever it is named
+_MAGIC_NUMBERS = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+
+_WHITESPACE = " \t\n\r"
+
+
+class _JSONTokenStream:
+    """Incrementally decodes JSON values from a text stream
+
+    Only the value currently being decoded is held in memory, so arbitrarily large
+    arrays can be walked one element at a time with json.JSONDecoder.raw_decode.
+    """
+
+    def __init__(self, fp: TextIO):
+        self.fp = fp
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: int = READ_CHUNK_SIZE) -> bool:
+        data = self.fp.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof or not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"expected '{char}' but found '{found or 'end of file'}' in export")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete value, read at least as much again as is buffered
+                if self.eof or not self._fill(max(READ_CHUNK_SIZE, len(self.buf) - self.pos)):
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof and self._fill():
+                # A number or literal may continue past the end of the buffer
+                continue
+            self.pos = end
+            return obj
+
+    def array_items(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+
+class EmailResultsReader:
+    """Streams email results from a delivr.to export one record at a time
+
+    Handles UI exports (a top-level array of emails), API exports (an object holding
+    an ``emails`` array) and newline-delimited JSON with one email per line. The export
+    type is detected on construction, records are decoded lazily while iterating.
+
+    Parameters
+    ----------
+    fp : TextIO
+        Text stream positioned at the start of the export
+    """
+
+    def __init__(self, fp: TextIO):
+        self.records_read = 0
+        self._stream = _JSONTokenStream(fp)
+        self._first_record = None
+
+        first = self._stream.peek()
+        if first == "[":
+            self.export_type = "UI"
+        elif first == "{":
+            self._stream.expect("{")
+            record = {}
+            while self._stream.peek() != "}":
+                key = self._stream.value()
+                self._stream.expect(":")
+                if key == "emails" and self._stream.peek() == "[":
+                    self.export_type = "API"
+                    return
+                record[key] = self._stream.value()
+                if self._stream.peek() == ",":
+                    self._stream.pos += 1
+            self._stream.expect("}")
+            # A complete object without an emails array is the first line of NDJSON
+            self.export_type = "JSONL"
+            self._first_record = record
+        else:
+            raise ValueError("export is not a JSON array, API export object or JSON lines")
+
+    def _records(self) -> Iterator[dict]:
+        if self.export_type in ["UI", "API"]:
+            yield from self._stream.array_items()
+        else:
+            yield self._first_record
+            self._first_record = None
+            while self._stream.peek():
+                yield self._stream.value()
+
+    def __iter__(self) -> Iterator[dict]:
+        for record in self._records():
+            self.records_read += 1
+            yield record
+
+
+class CompressedExport(io.TextIOWrapper):
+    """Text stream decompressing an export while it is read
+
+    Parameters
+    ----------
+    compressed_file : BinaryIO
+        The compressed export, whose position tells how far through it reading has got
+    decompressed : BinaryIO
+        Decompressing reader over compressed_file
+    """
+
+    def __init__(self, compressed_file: BinaryIO, decompressed: BinaryIO):
+        super().__init__(decompressed, encoding="utf-8")
+        self.compressed_file = compressed_file
+
+    def close(self):
+        super().close()
+        self.compressed_file.close()
+
+
+def export_compression(data_file: BinaryIO) -> Optional[str]:
+    """Compression of a binary export stream ("gzip" or "zstd") from its leading bytes, None if uncompressed"""
+    head = data_file.peek(4)[:4] if hasattr(data_file, "peek") else b""
+    for magic, compression in _MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_export(path: str) -> TextIO:
+    """Opens an export for reading as text, decompressing gzip and zstd exports on the fly
+
+    Compression is detected from the file's content rather than its name. Nothing is
+    decompressed ahead of the reader, so compressed exports stream like plain ones.
+    zstd exports need the zstandard package.
+    """
+    data_file = open(path, "rb")
+    try:
+        compression = export_compression(data_file)
+        if compression == "gzip":
+            return CompressedExport(data_file, gzip.GzipFile(fileobj=data_file, mode="rb"))
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("reading zstd-compressed exports requires the zstandard package")
+            reader = zstandard.ZstdDecompressor().stream_reader(data_file, read_across_frames=True, closefd=False)
+            return CompressedExport(data_file, io.BufferedReader(reader))
+    except BaseException:
+        data_file.close()
+        raise
+    return io.TextIOWrapper(data_file)
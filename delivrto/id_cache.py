@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+ORGANIZATION = "organization"
+ASSESSMENT = "assessment"
+CAMPAIGN = "campaign"
+
+# Seconds a resolved ID is trusted before it is looked up again
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def campaign_cache_name(assessment_name: str, campaign_name: str) -> str:
+    """Name a campaign's ID is cached under, campaign names are only unique within an assessment"""
+    return f"{assessment_name}/{campaign_name}"
+
+
+class VectrIdCache:
+    """Local cache of resolved VECTR organization, assessment and campaign IDs
+
+    IDs are keyed by VECTR GraphQL URL, database, kind and name, and expire after ttl
+    seconds. A cached ID can still go stale inside its TTL (e.g. the campaign was deleted),
+    callers invalidate it when a request made with it fails.
+
+    Parameters
+    ----------
+    path : str
+        SQLite database file holding the cache
+    ttl : float
+        Seconds a cached ID stays valid, 0 disables the cache
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS vectr_ids (
+                    vectr_url TEXT NOT NULL,
+                    db TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    cached REAL NOT NULL,
+                    PRIMARY KEY (vectr_url, db, kind, name)
+                )
+                """
+            )
+
+    def get(self, vectr_url: str, db: str, kind: str, name: str) -> Optional[str]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM vectr_ids WHERE vectr_url = ? AND db = ? AND kind = ? AND name = ? AND cached > ?",
+                (vectr_url, db or "", kind, name, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, vectr_url: str, db: str, kind: str, name: str, vectr_id: str):
+        if self.ttl <= 0 or not vectr_id:
+            return
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO vectr_ids (vectr_url, db, kind, name, id, cached) VALUES (?, ?, ?, ?, ?, ?)",
+                (vectr_url, db or "", kind, name, vectr_id, time.time())
+            )
+
+    def invalidate(self, vectr_url: str, db: Optional[str] = None):
+        """Drops every cached ID for vectr_url, or only those of one database"""
+        with self._lock, self._db:
+            if db is None:
+                self._db.execute("DELETE FROM vectr_ids WHERE vectr_url = ?", (vectr_url,))
+            else:
+                self._db.execute("DELETE FROM vectr_ids WHERE vectr_url = ? AND db IN (?, '')", (vectr_url, db))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
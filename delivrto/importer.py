@@ -0,0 +1,739 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple, Union
+from vectrapi.defaults import DEFAULT_MAX_BATCH_BYTES, DEFAULT_MAX_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from vectrapi.models import Campaign, TestCaseInput, TestCaseRecord, VectrGQLConnParams, VectrGQLStats, TestCaseUploadReport
+from .campaign_index import CampaignTestCaseIndex
+from .checkpoint import ImportCheckpoint
+from .id_cache import VectrIdCache, ORGANIZATION, ASSESSMENT, CAMPAIGN, campaign_cache_name
+from .metrics import ImportMetrics, ProgressLine
+from .reporting import ImportReporter
+from .spool import spooled_test_case, spooled_variant
+from .test_case_updates import TestCaseUpdateReport, test_case_update
+from .transform import generate_vectr_test_case
+
+if TYPE_CHECKING:
+    # Only --workers starts a pool, so multiprocessing isn't imported for the annotation
+    from multiprocessing.pool import Pool
+
+
+class ImportOptions(BaseModel):
+    """How email results are transformed and uploaded by an Importer"""
+    # Test cases sent per mutation, 0 sends all in one request; the initial size with adaptive_batches
+    batch_size: int = 100
+    max_in_flight: int = 4
+    adaptive_batches: bool = False
+    max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES
+    # Clicks of an email listed in full in its outcome notes, see render_clicks
+    click_rows: Optional[int] = None
+    # Skip emails that already have a test case in the campaign
+    incremental: bool = False
+    # Update the changed fields of test cases already in the campaign instead of skipping them
+    update_existing: bool = False
+    # Test cases fetched per page when reading the campaign
+    page_size: int = DEFAULT_PAGE_SIZE
+    debug: bool = False
+
+
+class ImportResult(BaseModel):
+    emails_read: int = 0
+    emails_uploaded: List[str] = []
+    # Emails skipped as confirmed by a previous run, None unless resuming
+    emails_resumed: Optional[int] = None
+    # Emails skipped as already in the campaign, None unless incremental
+    emails_skipped: Optional[int] = None
+    upload_report: TestCaseUploadReport = TestCaseUploadReport()
+    update_report: TestCaseUpdateReport = TestCaseUpdateReport()
+
+
+class Importer:
+    """Imports delivr.to email results into a VECTR campaign
+
+    Holds the VECTR connection, the target campaign and the import options, so one
+    Importer can run any number of imports in the same process, reusing the pooled
+    connection and the resolved campaign ID. Its org_name, target_db, campaign_name,
+    campaign_id and click_rows are also what the transform functions expect of a
+    VECTR connection. The VECTR client (gql, requests) is only imported by the
+    methods that talk to VECTR, so an Importer that only transforms email results,
+    e.g. for a spool, starts without it. An Importer doesn't print, what it is doing
+    goes to its reporter and the upload reports are returned in ImportResult.
+
+    Parameters
+    ----------
+    connection_params : Optional[VectrGQLConnParams]
+        Connection parameters for the target VECTR instance, None to only transform email results
+    org_name : str
+        Organization set on the generated test cases, and of created assessments and campaigns
+    target_db : str
+        The database holding the campaign
+    assessment_name : str
+        Assessment holding the campaign, created if missing
+    campaign_name : str
+        Campaign the test cases are imported into, created if missing
+    options : ImportOptions
+        Batching, skipping and transform options
+    id_cache : Optional[VectrIdCache]
+        Cache of resolved VECTR IDs
+    checkpoint_path : Optional[str]
+        SQLite ledger recording each email's progress, None imports without checkpoints
+    metrics : Optional[ImportMetrics]
+        Stage timers and email counters the imports add to
+    progress : Optional[ProgressLine]
+        Progress line updated as emails are processed
+    worker_pool : Optional[Pool]
+        Worker processes from create_worker_pool that transform and upload shards of each import
+    workers : int
+        Number of processes in worker_pool
+    reporter : Optional[ImportReporter]
+        Receives the campaign lookups, processed emails and ID refreshes to show
+    """
+
+    def __init__(self,
+                 connection_params: Optional[VectrGQLConnParams],
+                 org_name: str,
+                 target_db: str,
+                 assessment_name: str,
+                 campaign_name: str,
+                 options: Optional[ImportOptions] = None,
+                 id_cache: Optional[VectrIdCache] = None,
+                 checkpoint_path: Optional[str] = None,
+                 metrics: Optional[ImportMetrics] = None,
+                 progress: Optional[ProgressLine] = None,
+                 worker_pool: Optional["Pool"] = None,
+                 workers: int = 0,
+                 reporter: Optional[ImportReporter] = None):
+        self.connection_params = connection_params
+        self.org_name = org_name
+        self.target_db = target_db
+        self.assessment_name = assessment_name
+        self.campaign_name = campaign_name
+        self.campaign_id: Optional[str] = None
+        self.campaign_id_cached = False
+        self.options = options or ImportOptions()
+        self.id_cache = id_cache
+        self.checkpoint_path = checkpoint_path
+        self.metrics = metrics or ImportMetrics()
+        self.progress = progress
+        self.worker_pool = worker_pool
+        self.workers = workers
+        self.reporter = reporter or ImportReporter()
+        # VECTR API requests made by the workers and async imports, which the shared connection's stats don't see
+        self.worker_stats = VectrGQLStats()
+
+    @property
+    def click_rows(self) -> Optional[int]:
+        return self.options.click_rows
+
+    @property
+    def stats(self) -> VectrGQLStats:
+        """Requests made to VECTR over the shared connection and by the workers"""
+        from vectrapi.vectr_api_client import get_connection
+        stats = get_connection(self.connection_params).stats.copy(deep=True)
+        stats.merge(self.worker_stats)
+        return stats
+
+    def for_campaign(self, campaign_name: str, assessment_name: Optional[str] = None,
+                     campaign_id: Optional[str] = None, campaign_id_cached: bool = False) -> "Importer":
+        """Importer into another campaign sharing this one's connection, options, caches and metrics"""
+        importer = Importer(
+            self.connection_params, self.org_name, self.target_db, assessment_name or self.assessment_name, campaign_name,
+            self.options, self.id_cache, self.checkpoint_path, self.metrics, self.progress, self.worker_pool, self.workers,
+            self.reporter
+        )
+        importer.campaign_id = campaign_id
+        importer.campaign_id_cached = campaign_id_cached
+        importer.worker_stats = self.worker_stats
+        return importer
+
+    def resolve_campaign(self) -> str:
+        """Looks up (or creates) the campaign unless its ID is already known, returning the ID"""
+        if self.campaign_id:
+            return self.campaign_id
+        self.reporter.resolving_campaign(self)
+
+        campaign_id = None
+        if self.id_cache:
+            campaign_id = self.id_cache.get(self.connection_params.vectr_gql_url, self.target_db, CAMPAIGN,
+                                            campaign_cache_name(self.assessment_name, self.campaign_name))
+        if campaign_id:
+            self.reporter.campaign_resolved(self, campaign_id, cached=True)
+            self.campaign_id_cached = True
+        else:
+            with self.metrics.stage("lookup"):
+                campaign_id = self._lookup_campaign()
+        self.campaign_id = campaign_id
+        return campaign_id
+
+    def _lookup_campaign(self) -> str:
+        """Resolves (or creates) the assessment and campaign, looking up uncached IDs concurrently"""
+        from vectrapi.vectr_api_client import create_assessment, create_campaigns, get_assessment_by_name, \
+            get_campaign_by_name, get_org_id_for_campaign_and_assessment_data
+        connection_params = self.connection_params
+        vectr_url = connection_params.vectr_gql_url
+        id_cache = self.id_cache
+
+        org_id = id_cache.get(vectr_url, "", ORGANIZATION, self.org_name) if id_cache else None
+        assessment_id = id_cache.get(vectr_url, self.target_db, ASSESSMENT, self.assessment_name) if id_cache else None
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            org_lookup = None if org_id else executor.submit(get_org_id_for_campaign_and_assessment_data, connection_params, self.org_name)
+            assessment_lookup = None if assessment_id else executor.submit(
+                _lookup_or_none, get_assessment_by_name, connection_params, self.target_db, self.assessment_name)
+            campaign_lookup = executor.submit(_lookup_or_none, get_campaign_by_name, connection_params, self.target_db, self.campaign_name,
+                                            self.assessment_name)
+            campaign_id = campaign_lookup.result()
+            if assessment_lookup:
+                assessment_id = assessment_lookup.result()
+            if org_lookup:
+                org_id = org_lookup.result()
+
+        if assessment_id:
+            self.reporter.assessment_resolved(self, assessment_id, created=False)
+        else:
+            created_assessment_detail = create_assessment(connection_params, self.target_db, org_id, self.assessment_name)
+            assessment_id = created_assessment_detail.get(self.assessment_name).get("id")
+            self.reporter.assessment_resolved(self, assessment_id, created=True)
+
+        if campaign_id:
+            self.reporter.campaign_resolved(self, campaign_id)
+        else:
+            cpgn = {self.campaign_name: Campaign(name=self.campaign_name, test_cases=[])}
+            created_campaigns = create_campaigns(connection_params, self.target_db, org_id, cpgn, assessment_id)
+            campaign_id = created_campaigns.get(self.campaign_name).get("id")
+            self.reporter.campaign_resolved(self, campaign_id, created=True)
+
+        if id_cache:
+            id_cache.put(vectr_url, "", ORGANIZATION, self.org_name, org_id)
+            id_cache.put(vectr_url, self.target_db, ASSESSMENT, self.assessment_name, assessment_id)
+            id_cache.put(vectr_url, self.target_db, CAMPAIGN, campaign_cache_name(self.assessment_name, self.campaign_name), campaign_id)
+        return campaign_id
+
+    def find_campaign(self) -> Optional[str]:
+        """Looks up the campaign's ID without creating it, None if VECTR doesn't hold the campaign"""
+        if not self.campaign_id:
+            from vectrapi.vectr_api_client import get_campaign_by_name
+            with self.metrics.stage("lookup"):
+                self.campaign_id = _lookup_or_none(get_campaign_by_name, self.connection_params, self.target_db, self.campaign_name,
+                                                   self.assessment_name)
+        return self.campaign_id
+
+    def iter_test_case_pages(self, fields: Iterable[str], page_size: Optional[int] = None) -> Iterator[List[dict]]:
+        """
+        Pages of the campaign's test cases with the given fields, see iter_campaign_test_case_pages
+
+        Unlike the imports, reading never creates the campaign: a campaign VECTR
+        doesn't hold raises RuntimeError. page_size defaults to the options'.
+        """
+        from vectrapi.vectr_api_client import iter_campaign_test_case_pages
+        campaign_id = self.find_campaign()
+        if not campaign_id:
+            raise RuntimeError(f"couldn't find campaign '{self.campaign_name}'")
+        pages = iter_campaign_test_case_pages(self.connection_params, self.target_db, campaign_id,
+                                              page_size or self.options.page_size, fields)
+        return self.metrics.timed("fetch", pages)
+
+    def refresh_stale_campaign_id(self) -> bool:
+        """Re-resolves a cached campaign ID after an upload failed with it, returning True if the ID changed"""
+        if not self.campaign_id_cached:
+            return False
+        # Only the first failure is treated as a possibly stale ID
+        self.campaign_id_cached = False
+        self.reporter.refreshing_campaign_id(self)
+        if self.id_cache:
+            self.id_cache.invalidate(self.connection_params.vectr_gql_url, self.target_db)
+        stale_campaign_id = self.campaign_id
+        self.campaign_id = self._lookup_campaign()
+        return self.campaign_id != stale_campaign_id
+
+    def checkpoint_key(self, source: str) -> str:
+        """Key identifying an import of the export at source into this campaign in the checkpoint ledger"""
+        return "|".join([
+            self.connection_params.vectr_gql_url,
+            self.target_db or "",
+            self.campaign_name or "",
+            os.path.abspath(source)
+        ])
+
+    def open_checkpoint(self, source: str, resume: bool = False) -> ImportCheckpoint:
+        """Opens the checkpoint ledger of an import, keeping the previous run's progress when resuming"""
+        checkpoint = ImportCheckpoint(self.checkpoint_path, self.checkpoint_key(source), resume)
+        if resume:
+            self.reporter.resuming(self, checkpoint.state_counts())
+        return checkpoint
+
+    def index_campaign(self, checkpoint: Optional[ImportCheckpoint] = None, incremental: bool = False,
+                       with_results: bool = False) -> Optional[CampaignTestCaseIndex]:
+        """Indexes the campaign's test cases when skipping imported emails, updating them or reconciling unconfirmed ones, else None"""
+        unconfirmed_sent = checkpoint.unconfirmed_sent() if checkpoint else []
+        if not (incremental or with_results or unconfirmed_sent):
+            return None
+        from vectrapi.vectr_api_client import INDEX_FIELDS, RESULT_FIELDS, iter_campaign_test_cases
+        with self.metrics.stage("campaign_index"):
+            # Indexed page by page, so only the index itself is held in memory
+            campaign_index = CampaignTestCaseIndex(iter_campaign_test_cases(
+                self.connection_params,
+                self.target_db,
+                self.resolve_campaign(),
+                self.options.page_size,
+                RESULT_FIELDS if with_results else INDEX_FIELDS
+            ), keep_test_cases=with_results)
+        reconciled = checkpoint.reconcile(campaign_index) if unconfirmed_sent else None
+        self.reporter.campaign_indexed(self, len(campaign_index), reconciled)
+        return campaign_index
+
+    def import_results(self, email_results: Iterable[dict], source: Optional[str] = None, resume: bool = False) -> ImportResult:
+        """
+        Import email results into the campaign, resolving it first if needed
+
+        Emails are transformed and uploaded in windows that fill every in-flight
+        batch, so memory stays bounded however many there are. With a source and a
+        checkpoint_path, every email's progress is recorded in the checkpoint ledger
+        under the source, and resume skips the emails a previous import of it confirmed.
+
+        Parameters
+        ----------
+        email_results : Iterable[dict]
+            delivr.to email results, e.g. an EmailResultsReader
+        source : Optional[str]
+            Path of the export the email results come from
+        resume : bool
+            Resume an interrupted import of source
+
+        Returns
+        -------
+        ImportResult
+            Counts, uploaded email IDs and the upload (and update) reports of the import
+        """
+        result = ImportResult()
+        self.resolve_campaign()
+        checkpoint = self.open_checkpoint(source, resume) if source and self.checkpoint_path else None
+        emails = _counted(self.metrics.timed("parse", email_results), result)
+        if checkpoint:
+            emails = checkpoint.skip_confirmed(emails)
+        incremental = self.options.incremental and not self.options.update_existing
+        campaign_index = self.index_campaign(checkpoint, incremental, self.options.update_existing)
+        if incremental:
+            emails = campaign_index.skip_imported(emails)
+        try:
+            self.upload_emails(emails, result, checkpoint, campaign_index if self.options.update_existing else None)
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        self._count_result(result, checkpoint if resume else None, campaign_index if incremental else None)
+        return result
+
+    def import_results_async(self, email_results: Iterable[dict], source: Optional[str] = None,
+                             resume: bool = False) -> ImportResult:
+        """
+        Import email results into the campaign with run_async_import
+
+        The campaign is resolved while the first emails are transformed, and up to
+        max_in_flight batches are uploaded concurrently over an asyncio connection.
+        Checkpointing, resuming and incremental skipping work as in import_results,
+        updating existing test cases isn't supported. Its requests are added to stats.
+
+        Parameters
+        ----------
+        email_results : Iterable[dict]
+            delivr.to email results, e.g. an EmailResultsReader
+        source : Optional[str]
+            Path of the export the email results come from
+        resume : bool
+            Resume an interrupted import of source
+
+        Returns
+        -------
+        ImportResult
+            Counts, uploaded email IDs and the upload report of the import
+        """
+        import asyncio
+        from .async_pipeline import run_async_import
+        result = ImportResult()
+        checkpoint = self.open_checkpoint(source, resume) if source and self.checkpoint_path else None
+        emails = _counted(self.metrics.timed("parse", email_results), result)
+        incremental = self.options.incremental
+        try:
+            async_result = asyncio.run(run_async_import(
+                self,
+                emails,
+                self.transform,
+                self.options.batch_size,
+                self.options.max_in_flight,
+                incremental,
+                checkpoint,
+                self.id_cache
+            ))
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        self.worker_stats.merge(async_result.stats)
+        result.emails_uploaded = async_result.emails_uploaded
+        result.upload_report = async_result.upload_report
+        if incremental:
+            result.emails_skipped = async_result.emails_skipped
+        self._count_result(result, checkpoint if resume else None)
+        return result
+
+    def upload_spool(self, records: Iterable[dict], source: Optional[str] = None, resume: bool = False) -> ImportResult:
+        """
+        Upload the test cases of a spool into the campaign, resolving it first if needed
+
+        The spool's records are uploaded in the same windows and with the same
+        checkpointing, resuming and incremental skipping as import_results, only
+        their test cases aren't transformed again.
+
+        Parameters
+        ----------
+        records : Iterable[dict]
+            Spooled test case records, e.g. a SpoolReader
+        source : Optional[str]
+            Path of the spool, which keys its checkpoint ledger
+        resume : bool
+            Resume an interrupted upload of source
+
+        Returns
+        -------
+        ImportResult
+            Counts, uploaded email IDs and the upload report of the spool
+        """
+        result = ImportResult()
+        self.resolve_campaign()
+        checkpoint = self.open_checkpoint(source, resume) if source and self.checkpoint_path else None
+        records = _counted(self.metrics.timed("parse", records), result)
+        if checkpoint:
+            records = checkpoint.skip_confirmed(records)
+        incremental = self.options.incremental
+        campaign_index = self.index_campaign(checkpoint, incremental)
+        if incremental:
+            records = campaign_index.skip_imported(records, spooled_variant)
+        try:
+            for window in self._upload_windows(records):
+                test_cases = [spooled_test_case(record) for record in window]
+                email_ids = [record['email_id'] for record in window]
+                if self.progress:
+                    self.progress.update(len(window))
+                result.emails_uploaded.extend(self.upload_test_cases(test_cases, email_ids, result.upload_report, checkpoint))
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        self._count_result(result, checkpoint if resume else None, campaign_index if incremental else None)
+        return result
+
+    def _count_result(self, result: ImportResult, resumed: Optional[ImportCheckpoint] = None,
+                      skipped: Optional[CampaignTestCaseIndex] = None):
+        """Records the emails a resumed checkpoint and an incremental campaign index skipped, and adds the result to the metrics"""
+        if resumed is not None:
+            result.emails_resumed = resumed.skipped
+        if skipped is not None:
+            result.emails_skipped = skipped.skipped
+        self.metrics.count("read", result.emails_read)
+        self.metrics.count("uploaded", len(result.emails_uploaded))
+        self.metrics.count("skipped_resumed", result.emails_resumed or 0)
+        self.metrics.count("skipped_existing", result.emails_skipped or 0)
+
+    def upload_emails(self, emails: Iterable[dict], result: ImportResult, checkpoint: Optional[ImportCheckpoint] = None,
+                      campaign_index: Optional[CampaignTestCaseIndex] = None) -> List[str]:
+        """
+        Transform and upload email results into result, returning the email IDs uploaded
+
+        Given the campaign_index of a campaign indexed with its test case results,
+        emails that already have a test case there update it where it changed instead,
+        recorded in result.update_report.
+        """
+        if self.worker_pool:
+            return self._import_shards(emails, result, checkpoint)
+
+        emails_uploaded = []
+        for pending_emails in self._upload_windows(emails):
+            emails_uploaded.extend(self._upload_pending_emails(pending_emails, result, checkpoint, campaign_index))
+        result.emails_uploaded.extend(emails_uploaded)
+        return emails_uploaded
+
+    def current_upload_window(self) -> Optional[int]:
+        """Number of pending emails that fills every in-flight batch, None to upload everything at once"""
+        options = self.options
+        if options.adaptive_batches:
+            from vectrapi.vectr_api_client import get_connection
+            batch_sizer = get_connection(self.connection_params).adaptive_batch_sizer(options.batch_size, options.max_batch_bytes)
+            return batch_sizer.size * options.max_in_flight
+        return options.batch_size * options.max_in_flight if options.batch_size > 0 else None
+
+    def _upload_windows(self, items: Iterable) -> Iterator[list]:
+        # Upload as soon as enough items are pending to fill every in-flight batch,
+        # so memory stays bounded however large the export is. The window is sized
+        # again once the previous one was uploaded, as adaptive batches may have grown
+        upload_window = self.current_upload_window()
+        pending = []
+        for item in items:
+            pending.append(item)
+            if upload_window and len(pending) >= upload_window:
+                yield pending
+                pending = []
+                upload_window = self.current_upload_window()
+        if pending:
+            yield pending
+
+    def _import_shards(self, emails: Iterable[dict], result: ImportResult, checkpoint: Optional[ImportCheckpoint] = None) -> List[str]:
+        from vectrapi.vectr_api_client import get_campaign_by_name
+        from .sharded_import import run_sharded_import
+        if self.campaign_id_cached:
+            # Workers can't refresh a stale campaign ID mid-run, so check a cached one up front
+            current_campaign_id = _lookup_or_none(get_campaign_by_name, self.connection_params, self.target_db, self.campaign_name,
+                                                   self.assessment_name)
+            if current_campaign_id != self.campaign_id:
+                self.reporter.stale_campaign_id(self, self.campaign_id)
+                self.refresh_stale_campaign_id()
+            self.campaign_id_cached = False
+
+        def on_shard_done(shard_result):
+            self.metrics.add_time("transform", shard_result.transform_seconds, len(shard_result.email_ids) + shard_result.failed)
+            self.metrics.add_time("upload", shard_result.upload_seconds, len(shard_result.email_ids))
+            self.metrics.count("transformed", len(shard_result.email_ids))
+            self.metrics.count("failed", shard_result.failed)
+            if self.progress:
+                self.progress.update(len(shard_result.email_ids), shard_result.failed)
+            self.reporter.shard_done(shard_result)
+
+        options = self.options
+        if options.adaptive_batches:
+            # Leave room for the workers' batches to grow
+            shard_size = DEFAULT_MAX_BATCH_SIZE * options.max_in_flight
+        else:
+            shard_size = options.batch_size * options.max_in_flight if options.batch_size > 0 else 1000
+        import_result = run_sharded_import(
+            self.worker_pool,
+            self.workers,
+            self.connection_params,
+            self.target_db,
+            self.campaign_id,
+            self.org_name,
+            emails,
+            shard_size,
+            options.batch_size,
+            options.max_in_flight,
+            checkpoint,
+            options.debug,
+            on_shard_done,
+            options.adaptive_batches,
+            options.max_batch_bytes,
+            options.click_rows
+        )
+        self.worker_stats.merge(import_result.stats)
+        _merge_batches(result.upload_report, import_result.upload_report)
+        result.emails_uploaded.extend(import_result.emails_uploaded)
+        return import_result.emails_uploaded
+
+    def _upload_pending_emails(self, emails: List[dict], result: ImportResult, checkpoint: Optional[ImportCheckpoint] = None,
+                               campaign_index: Optional[CampaignTestCaseIndex] = None) -> List[str]:
+        email_test_cases = []
+        email_ids = []
+        existing = []
+        for email_json, vectr_test_case in zip(emails, self.transform(emails)):
+            if not vectr_test_case:
+                continue
+            held_test_case = None
+            if campaign_index:
+                held_test_case = campaign_index.test_cases.get(campaign_index.find_variant(vectr_test_case.name, email_json['email_id']))
+            if held_test_case:
+                existing.append((email_json['email_id'], vectr_test_case, held_test_case))
+            else:
+                email_test_cases.append(vectr_test_case)
+                email_ids.append(email_json['email_id'])
+
+        emails_uploaded = []
+        if existing:
+            emails_uploaded.extend(self._update_existing_test_cases(existing, result.update_report, checkpoint))
+        if email_test_cases:
+            emails_uploaded.extend(self.upload_test_cases(email_test_cases, email_ids, result.upload_report, checkpoint))
+        return emails_uploaded
+
+    def _update_existing_test_cases(self, existing: List[Tuple[str, TestCaseRecord, dict]], update_report: TestCaseUpdateReport,
+                                    checkpoint: Optional[ImportCheckpoint] = None) -> List[str]:
+        """Updates the changed fields of existing test cases from (email ID, generated test case, VECTR test case) triples, returning the email IDs now current"""
+        current_ids = []
+        current_test_case_ids = []
+        updates = []
+        update_email_ids = []
+        for email_id, vectr_test_case, held_test_case in existing:
+            update = test_case_update(held_test_case, vectr_test_case)
+            if update:
+                updates.append(update)
+                update_email_ids.append(email_id)
+            else:
+                current_ids.append(email_id)
+                current_test_case_ids.append(held_test_case["id"])
+        update_report.unchanged += len(current_ids)
+        self.metrics.count("unchanged", len(current_ids))
+
+        if updates:
+            from vectrapi.vectr_api_client import update_test_cases_batched
+            with self.metrics.stage("update", len(updates)):
+                report = update_test_cases_batched(self.connection_params, self.target_db, updates,
+                                                   self.options.batch_size, self.options.max_in_flight)
+            updated = 0
+            for batch in report.batches:
+                if batch.succeeded:
+                    current_ids.extend(update_email_ids[batch.start:batch.start + batch.size])
+                    current_test_case_ids.extend(update.testCaseId for update in updates[batch.start:batch.start + batch.size])
+                    updated += batch.size
+            _merge_batches(update_report.upload_report, report)
+            self.metrics.count("updated", updated)
+
+        if checkpoint:
+            # Already in VECTR, so recorded as confirmed with the test case they are in
+            variants = {email_id: vectr_test_case.name for email_id, vectr_test_case, _ in existing}
+            checkpoint.mark_parsed([(email_id, variants[email_id]) for email_id in current_ids])
+            checkpoint.mark_confirmed(current_ids, current_test_case_ids)
+        return current_ids
+
+    def upload_test_cases(self, test_cases: List[TestCaseInput], email_ids: List[str], upload_report: TestCaseUploadReport,
+                          checkpoint: Optional[ImportCheckpoint] = None, batch_size: Optional[int] = None,
+                          max_in_flight: Optional[int] = None) -> List[str]:
+        """
+        Upload test cases generated for email_ids, merging their batches into upload_report
+
+        A batch that fails while using a cached campaign ID refreshes the ID and, if it
+        changed, is sent again. batch_size and max_in_flight default to the options'.
+
+        Returns
+        -------
+        List[str]
+            The email IDs whose test cases were uploaded
+        """
+        batch_size = self.options.batch_size if batch_size is None else batch_size
+        max_in_flight = self.options.max_in_flight if max_in_flight is None else max_in_flight
+        first_batch_index = len(upload_report.batches)
+        self.resolve_campaign()
+
+        if checkpoint:
+            checkpoint.mark_parsed([(email_id, test_case.name) for email_id, test_case in zip(email_ids, test_cases)])
+
+        with self.metrics.stage("upload", len(test_cases)):
+            report = self._create_test_cases(test_cases, batch_size, max_in_flight,
+                                             *_checkpoint_callbacks(checkpoint, email_ids, first_batch_index),
+                                             adaptive=self.options.adaptive_batches)
+            if report.failed_batches and self.refresh_stale_campaign_id():
+                for batch in report.failed_batches:
+                    batch_end = batch.start + batch.size
+                    # Re-sent as it was, so each failed batch is replaced by exactly one batch
+                    retried = self._create_test_cases(test_cases[batch.start:batch_end], batch.size, 1,
+                                                      *_checkpoint_callbacks(checkpoint, email_ids[batch.start:batch_end], first_batch_index + batch.index))
+                    batch.attempts += retried.batches[0].attempts
+                    batch.created = retried.batches[0].created
+                    batch.error = retried.batches[0].error
+
+        uploaded = []
+        for batch in report.batches:
+            if batch.succeeded:
+                uploaded.extend(email_ids[batch.start:batch.start + batch.size])
+        _merge_batches(upload_report, report)
+        return uploaded
+
+    def _create_test_cases(self, test_cases: List[TestCaseInput], batch_size: int, max_in_flight: int,
+                           on_batch_sent=None, on_batch_done=None, adaptive: bool = False) -> TestCaseUploadReport:
+        from vectrapi.vectr_api_client import create_test_cases_adaptive, create_test_cases_batched
+        if adaptive:
+            return create_test_cases_adaptive(
+                self.connection_params,
+                self.target_db,
+                self.campaign_id,
+                test_cases,
+                initial_size=batch_size,
+                max_in_flight=max_in_flight,
+                max_batch_bytes=self.options.max_batch_bytes,
+                on_batch_sent=on_batch_sent,
+                on_batch_done=on_batch_done
+            )
+        return create_test_cases_batched(
+            self.connection_params,
+            self.target_db,
+            self.campaign_id,
+            test_cases,
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+            on_batch_sent=on_batch_sent,
+            on_batch_done=on_batch_done
+        )
+
+    def transform(self, emails: List[dict]) -> List[Union[TestCaseRecord, bool]]:
+        """Converts a batch of email results to VECTR test cases (or False), reporting each one"""
+        if self.options.debug:
+            # Keep each email's debug output together
+            return [self.transform_one(email_json) for email_json in emails]
+        with self.metrics.stage("transform", len(emails)):
+            vectr_test_cases = [generate_vectr_test_case(self, email_json, False) for email_json in emails]
+        transformed = sum(1 for vectr_test_case in vectr_test_cases if vectr_test_case)
+        self.metrics.count("transformed", transformed)
+        self.metrics.count("failed", len(emails) - transformed)
+        if self.progress:
+            self.progress.update(transformed, len(emails) - transformed)
+        for email_json, vectr_test_case in zip(emails, vectr_test_cases):
+            self.reporter.email_processed(email_json, vectr_test_case)
+        return vectr_test_cases
+
+    def transform_one(self, email_json: dict) -> Union[TestCaseRecord, bool]:
+        """Converts a single email result to its VECTR test case (or False), reporting it"""
+        with self.metrics.stage("transform"):
+            vectr_test_case = generate_vectr_test_case(self, email_json, self.options.debug)
+        self.metrics.count("transformed" if vectr_test_case else "failed")
+        if self.progress:
+            self.progress.update(1 if vectr_test_case else 0, 0 if vectr_test_case else 1)
+        self.reporter.email_processed(email_json, vectr_test_case)
+        return vectr_test_case
+
+    def close(self):
+        """Closes the VECTR connection, shared with any other Importer for the same VECTR instance"""
+        if self.connection_params:
+            from vectrapi.vectr_api_client import get_connection
+            get_connection(self.connection_params).close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _merge_batches(upload_report: TestCaseUploadReport, report: TestCaseUploadReport):
+    # Renumber the batches of report to follow on from those already in upload_report
+    first_batch_index = len(upload_report.batches)
+    first_offset = sum(batch.size for batch in upload_report.batches)
+    for batch in report.batches:
+        batch.index += first_batch_index
+        batch.start += first_offset
+        upload_report.batches.append(batch)
+    upload_report.splits += report.splits
+
+
+def _checkpoint_callbacks(checkpoint: Optional[ImportCheckpoint], email_ids: List[str], first_batch_index: int):
+    """Batch callbacks recording upload progress of email_ids in the checkpoint ledger"""
+    if not checkpoint:
+        return None, None
+
+    def on_batch_sent(batch):
+        checkpoint.mark_sent(email_ids[batch.start:batch.start + batch.size], first_batch_index + batch.index)
+
+    def on_batch_done(batch):
+        if not batch.succeeded:
+            return
+        if len(batch.created) == batch.size:
+            test_case_ids = [test_case["id"] for test_case in batch.created]
+        else:
+            test_case_ids = [None] * batch.size
+        checkpoint.mark_confirmed(email_ids[batch.start:batch.start + batch.size], test_case_ids)
+
+    return on_batch_sent, on_batch_done
+
+
+def _counted(email_results: Iterable[dict], result: ImportResult) -> Iterator[dict]:
+    for email_json in email_results:
+        result.emails_read += 1
+        yield email_json
+
+
+def _lookup_or_none(lookup, *lookup_args) -> Optional[str]:
+    try:
+        return lookup(*lookup_args)
+    except RuntimeError:
+        return None
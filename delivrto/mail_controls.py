@@ -0,0 +1,71 @@
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .outcome_notes import render_defender, render_sublime
+
+MAIL_CONTROL_PREFIX = "mail_control_information"
+
+
+class ControlResult(NamedTuple):
+    """What a mail control integration contributes to a test case"""
+    tags: List[str]
+    detected: bool
+    notes: str
+
+
+def handle_sublime(control: dict) -> ControlResult:
+    flagged = bool(control['flagged_rules'])
+    return ControlResult(["Sublime"] if flagged else [], flagged, render_sublime(control))
+
+
+def handle_defender(control: dict) -> ControlResult:
+    # Defender isn't technically 'alerting' like Sublime
+    # so its threat types don't set detected
+    delivered = "delivered" in control['state'].lower()
+    return ControlResult([] if delivered else ["Defender"], False, render_defender(control))
+
+
+MAIL_CONTROL_HANDLERS: Dict[str, Callable[[dict], ControlResult]] = {
+    "Sublime": handle_sublime,
+    "Defender": handle_defender,
+}
+
+# Live view, so integrations added with register_mail_control are supported too
+SUPPORTED_SECURITY_TOOL_INTEGRATIONS = MAIL_CONTROL_HANDLERS.keys()
+
+# Email result key -> control name ("" for the nested information object,
+# None for keys that aren't mail controls). Filled as new keys are seen, so
+# each export only pays for the prefix check once per distinct column.
+_control_key_names: Dict[str, Optional[str]] = {MAIL_CONTROL_PREFIX: ""}
+
+
+def register_mail_control(name: str, handler: Callable[[dict], ControlResult]):
+    """Add (or replace) the handler for a mail control integration"""
+    MAIL_CONTROL_HANDLERS[name.capitalize()] = handler
+
+
+def _control_key_name(key: str) -> Optional[str]:
+    try:
+        return _control_key_names[key]
+    except KeyError:
+        name = None
+        if key.startswith(f"{MAIL_CONTROL_PREFIX}."):
+            name = key[len(MAIL_CONTROL_PREFIX) + 1:].capitalize()
+        _control_key_names[key] = name
+        return name
+
+
+def iter_mail_controls(email_json: dict) -> Iterator[Tuple[str, dict]]:
+    """Yield (control name, control data) for every mail control on an email result
+
+    Handles both the nested `mail_control_information` object of API exports
+    and the flattened `mail_control_information.<Control>` keys of UI exports.
+    """
+    for key, value in email_json.items():
+        name = _control_key_name(key)
+        if name is None:
+            continue
+        if name:
+            yield name, value
+        else:
+            for control, data in value.items():
+                yield control.capitalize(), data
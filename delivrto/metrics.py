@@ -0,0 +1,192 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pydantic import BaseModel
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+from vectrapi.models import VectrGQLStats
+
+# Prefix of every metric in the Prometheus textfile
+PROMETHEUS_PREFIX = "delivrto_vectr_import"
+
+# Seconds between redraws of the progress line
+PROGRESS_INTERVAL = 0.5
+
+
+class StageMetrics(BaseModel):
+    count: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.count / self.seconds if self.seconds else 0.0
+
+
+class ImportMetrics:
+    """Timers and counters for one run of the importer
+
+    Stages (load, lookup, parse, transform, upload, ...) accumulate the number of
+    items they handled and the time spent on them, counters hold the email totals.
+    Together with the VECTR API stats they are written out as a JSON summary and
+    as a Prometheus textfile-collector file. Safe to update from several threads.
+    """
+
+    def __init__(self, mode: str = "sync"):
+        self.mode = mode
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages: Dict[str, StageMetrics] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def add_time(self, stage: str, seconds: float, count: int = 1):
+        with self._lock:
+            stage_metrics = self.stages.setdefault(stage, StageMetrics())
+            stage_metrics.count += count
+            stage_metrics.seconds += seconds
+
+    @contextmanager
+    def stage(self, stage: str, count: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start, count)
+
+    def timed(self, stage: str, items: Iterable) -> Iterator:
+        """Iterates items, timing each step of the iteration as one item of stage"""
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start, 0)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def summary(self, api_stats: Optional[VectrGQLStats] = None) -> dict:
+        with self._lock:
+            stages = {name: stage.dict() for name, stage in self.stages.items()}
+            counters = dict(self.counters)
+        summary = {
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "duration_seconds": self.elapsed,
+            "counters": counters,
+            "stages": stages,
+        }
+        if api_stats is not None:
+            summary["vectr_api"] = dict(api_stats.dict(), average_latency=api_stats.average_latency)
+        return summary
+
+    def prometheus(self, api_stats: Optional[VectrGQLStats] = None) -> str:
+        summary = self.summary(api_stats)
+        lines = []
+
+        def metric(name, help_text, samples, metric_type="gauge"):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+        metric("last_run_timestamp_seconds", "Start time of the last import run.", [({"mode": self.mode}, summary["started_at"])])
+        metric("duration_seconds", "Wall clock duration of the last import run.", [({}, summary["duration_seconds"])])
+        metric("emails", "Emails handled by the last import run, by result.",
+               [({"result": name}, value) for name, value in sorted(summary["counters"].items())])
+        metric("stage_seconds", "Time spent in each import stage.",
+               [({"stage": name}, stage["seconds"]) for name, stage in sorted(summary["stages"].items())])
+        metric("stage_items", "Items handled by each import stage.",
+               [({"stage": name}, stage["count"]) for name, stage in sorted(summary["stages"].items())])
+        if api_stats is not None:
+            metric("api_requests", "VECTR GraphQL requests by HTTP status.",
+                   [({"status": status}, count) for status, count in sorted(api_stats.status_counts.items())])
+            metric("api_errors", "VECTR GraphQL requests that raised an error.", [({}, api_stats.error_count)])
+            metric("api_bytes", "Bytes exchanged with the VECTR GraphQL API.",
+                   [({"direction": "sent"}, api_stats.bytes_sent), ({"direction": "received"}, api_stats.bytes_received)])
+            metric("api_latency_seconds_sum", "Total VECTR GraphQL request latency.", [({}, api_stats.total_latency)])
+            metric("api_latency_seconds_count", "VECTR GraphQL requests timed.", [({}, api_stats.request_count)])
+            metric("api_latency_seconds_max", "Slowest VECTR GraphQL request.", [({}, api_stats.max_latency)])
+            metric("api_serialize_seconds", "Time spent building test case mutation inputs.", [({}, api_stats.serialize_time)])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, api_stats: Optional[VectrGQLStats] = None) -> str:
+        """Writes the JSON summary to path and the Prometheus textfile next to it, returning its path"""
+        prometheus_path = os.path.splitext(path)[0] + ".prom"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        _write_atomic(path, json.dumps(self.summary(api_stats), indent=2))
+        _write_atomic(prometheus_path, self.prometheus(api_stats))
+        return prometheus_path
+
+
+def _write_atomic(path: str, content: str):
+    # The textfile collector may read at any moment, so never expose a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_path, path)
+
+
+class ProgressLine:
+    """Single, continuously redrawn line showing emails done, rate and ETA
+
+    The ETA is estimated from how far through the export file reading has got,
+    for a compressed export how far through the compressed file.
+    """
+
+    def __init__(self, data_file: Optional[TextIO] = None, stream: TextIO = sys.stderr):
+        self.stream = stream
+        self.total_bytes = 0
+        self.data_file = data_file
+        if data_file is not None:
+            self.position_file = getattr(data_file, "compressed_file", None) or data_file.buffer
+            self.total_bytes = os.fstat(self.position_file.fileno()).st_size
+        self.done = 0
+        self.failed = 0
+        self._started = time.perf_counter()
+        self._last_draw = 0.0
+        self._lock = threading.Lock()
+
+    def _fraction_read(self) -> Optional[float]:
+        if not self.total_bytes:
+            return None
+        try:
+            return min(self.position_file.tell() / self.total_bytes, 1.0)
+        except (AttributeError, ValueError, OSError):
+            return None
+
+    def update(self, done: int = 0, failed: int = 0, force: bool = False):
+        with self._lock:
+            self.done += done
+            self.failed += failed
+            now = time.perf_counter()
+            if not force and now - self._last_draw < PROGRESS_INTERVAL:
+                return
+            self._last_draw = now
+            elapsed = now - self._started
+            rate = self.done / elapsed if elapsed else 0.0
+            line = f"[*] {self.done} emails processed, {self.failed} failed, {rate:.0f}/s"
+            fraction = self._fraction_read()
+            if fraction:
+                eta = elapsed * (1 - fraction) / fraction
+                line += f", {fraction:.0%} read, ETA {int(eta // 60)}m{int(eta % 60):02d}s"
+            self.stream.write(f"\r{line}\033[K")
+            self.stream.flush()
+
+    def finish(self):
+        self.update(force=True)
+        self.stream.write("\n")
+        self.stream.flush()
@@ -0,0 +1,116 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+@lru_cache(maxsize=65536)
+def _click_time(timestamp: int) -> str:
+    # Scanners click in bursts, so many clicks of an export share a timestamp
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+def render_clicks(clicks: Iterable[dict], max_rows: Optional[int] = None) -> str:
+    """
+    Markdown table of the link clicks recorded for an email
+
+    With max_rows, only the first max_rows clicks get a row of their own. The
+    rest are summarised by source IP, user agent and method with their count and
+    first and last seen times, the max_rows busiest of those groups listed and
+    any others folded into one row, so the notes stay bounded however many
+    clicks sandboxes and link scanners made.
+
+    Parameters
+    ----------
+    clicks : Iterable[dict]
+        Clicks of an email result with timestamp, http_method, user_agent and source_ip
+    max_rows : Optional[int]
+        Clicks listed in full, None lists every click
+
+    Returns
+    -------
+    str
+        The Clicks section of the outcome notes
+    """
+    clicks = list(clicks)
+    listed = clicks if max_rows is None else clicks[:max_rows]
+    parts = [
+        "**Clicks:**\n\n",
+        "| Timestamp | Method | User Agent | Source IP |\n",
+        "| - | - | - | - |\n",
+    ]
+    for click in listed:
+        ts = _click_time(int(click['timestamp']))
+        parts.append(f"| {ts} | {click['http_method']} | {click['user_agent']} | {click['source_ip']} |\n")
+    if len(listed) < len(clicks):
+        parts.append(_render_click_summary(clicks[len(listed):], max_rows))
+    parts.append("\n\n\n")
+    return "".join(parts)
+
+
+def _render_click_summary(clicks: List[dict], max_groups: int) -> str:
+    # (source IP, user agent, method) -> [count, first seen, last seen]
+    groups: Dict[Tuple[str, str, str], List[int]] = {}
+    for click in clicks:
+        key = (click['source_ip'], click['user_agent'], click['http_method'])
+        group = groups.get(key)
+        timestamp = int(click['timestamp'])
+        if group is None:
+            groups[key] = [1, timestamp, timestamp]
+            continue
+        group[0] += 1
+        if timestamp < group[1]:
+            group[1] = timestamp
+        elif timestamp > group[2]:
+            group[2] = timestamp
+
+    ranked = sorted(groups.items(), key=lambda item: (-item[1][0], item[1][1]))
+    parts = [
+        f"\n**{len(clicks)} further clicks:**\n\n",
+        "| Source IP | User Agent | Method | Clicks | First Seen | Last Seen |\n",
+        "| - | - | - | - | - | - |\n",
+    ]
+    for (source_ip, user_agent, method), (count, first, last) in ranked[:max_groups]:
+        parts.append(f"| {source_ip} | {user_agent} | {method} | {count} | {_click_time(first)} | {_click_time(last)} |\n")
+    others = [group for _, group in ranked[max_groups:]]
+    if others:
+        parts.append(
+            f"| {len(others)} other sources | | | {sum(group[0] for group in others)} "
+            f"| {_click_time(min(group[1] for group in others))} | {_click_time(max(group[2] for group in others))} |\n"
+        )
+    return "".join(parts)
+
+
+def render_gateway_response(sendgrid_reason: str) -> str:
+    return f"**Gateway Response:**\n\n```\n{sendgrid_reason}\n```\n\n\n"
+
+
+def _render_list(items: Iterable[str]) -> str:
+    return "".join([f" - `{item}`\n" for item in items])
+
+
+def render_sublime(control: dict) -> str:
+    parts = ["**Sublime:**\n\n", f"Action: `{control['state']}`\n\n"]
+    if control['flagged_rules']:
+        parts.append("Rules:\n")
+        parts.append(_render_list(rule['name'] for rule in control['flagged_rules']))
+    return "".join(parts)
+
+
+def render_defender(control: dict) -> str:
+    parts = ["**Defender**\n\n", f"Action: `{control['state']}`\n\n"]
+    if control['threat_types']:
+        parts.append("Threat Types:\n")
+        parts.append(_render_list(control['threat_types'].split(',')))
+        parts.append("\n")
+    if control['threat_names']:
+        parts.append("Threat Names:\n")
+        parts.append(_render_list(control['threat_names'].split(',')))
+        parts.append("\n")
+    if control['detection_methods']:
+        parts.append("Detection Methods:\n\n")
+        parts.append(_render_list(
+            f"{threat_type}: {method}"
+            for threat_type, methods in control['detection_methods'].items()
+            for method in methods
+        ))
+    return "".join(parts)
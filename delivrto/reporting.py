@@ -0,0 +1,47 @@
+from typing import TYPE_CHECKING, Dict, Optional, Union
+
+if TYPE_CHECKING:
+    # Annotations only, so the CLI can import this before its deferred imports
+    from vectrapi.models import TestCaseRecord
+    from .importer import Importer
+    from .sharded_import import ShardResult
+
+
+class ImportReporter:
+    """Receives what an Importer is doing, for its caller to show
+
+    An Importer never prints, it calls these as it resolves its campaign, indexes
+    it, transforms emails and refreshes stale IDs. Upload and update reports are
+    returned in ImportResult instead. Every method does nothing here, a caller
+    overrides the ones it shows, e.g. the CLI prints them.
+    """
+
+    def resolving_campaign(self, importer: "Importer"):
+        """The campaign's ID isn't known yet and is about to be looked up"""
+
+    def assessment_resolved(self, importer: "Importer", assessment_id: str, created: bool):
+        """The assessment was found in VECTR, or created"""
+
+    def campaign_resolved(self, importer: "Importer", campaign_id: str, cached: bool = False, created: bool = False):
+        """The campaign's ID was read from the ID cache, found in VECTR or created"""
+
+    def stale_campaign_id(self, importer: "Importer", campaign_id: str):
+        """A cached campaign ID no longer matches the campaign VECTR holds"""
+
+    def refreshing_campaign_id(self, importer: "Importer"):
+        """An upload failed using a cached campaign ID, which is looked up again"""
+
+    def resuming(self, importer: "Importer", state_counts: Dict[str, int]):
+        """An interrupted import is resumed, with its emails counted per checkpoint state"""
+
+    def campaign_indexed(self, importer: "Importer", test_cases: int, reconciled: Optional[int] = None):
+        """The campaign's test cases were indexed, reconciling unconfirmed emails if any were sent"""
+
+    def email_processed(self, email_json: dict, vectr_test_case: Union["TestCaseRecord", bool]):
+        """An email result was transformed into its test case, or False if it couldn't be"""
+
+    def background_upload_failed(self, importer: "Importer", test_cases: int, error: Exception):
+        """A BackgroundUploader batch raised, so none of its test cases were uploaded"""
+
+    def shard_done(self, shard_result: "ShardResult"):
+        """A worker finished transforming and uploading a shard of the export"""
@@ -0,0 +1,245 @@
+import multiprocessing
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import Pool
+from pydantic import BaseModel
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+from vectrapi.vectr_api_client import VectrGQLConnParams, VectrGQLStats, TestCaseUploadReport, \
+    DEFAULT_MAX_BATCH_BYTES, \
+    create_test_cases_adaptive, \
+    create_test_cases_batched, \
+    get_connection
+from .checkpoint import ImportCheckpoint
+from .transform import generate_vectr_test_case, test_case_variant
+
+# Shards queued per worker ahead of the one it is working on
+SHARDS_AHEAD = 2
+
+
+class ShardResult(BaseModel):
+    index: int
+    email_ids: List[str] = []
+    failed: int = 0
+    transform_seconds: float = 0.0
+    upload_seconds: float = 0.0
+    upload_report: TestCaseUploadReport = TestCaseUploadReport()
+    stats: VectrGQLStats = VectrGQLStats()
+
+
+class ShardedImportResult(BaseModel):
+    emails_uploaded: List[str] = []
+    emails_failed: int = 0
+    upload_report: TestCaseUploadReport = TestCaseUploadReport()
+    stats: VectrGQLStats = VectrGQLStats()
+
+
+class _ShardTarget:
+    """The part of an Importer a worker needs to build test cases"""
+
+    def __init__(self, org_name: str, click_rows: Optional[int] = None):
+        self.org_name = org_name
+        self.click_rows = click_rows
+
+
+def create_worker_pool(workers: int) -> Pool:
+    """
+    Start the worker processes of a sharded import
+
+    Workers are forked so they don't re-run the importer script. Create the pool
+    before any VECTR connection is opened so no live sessions or threads are
+    copied into the workers, each of which opens its own pooled connection.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes
+
+    Returns
+    -------
+    Pool
+        The worker pool, close it with terminate() or close() and join()
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("Sharded imports need a platform that can fork worker processes")
+    return multiprocessing.get_context("fork").Pool(workers)
+
+
+def _import_shard(index: int,
+                  connection_params: VectrGQLConnParams,
+                  db: str,
+                  campaign_id: str,
+                  org_name: str,
+                  emails: List[dict],
+                  batch_size: int,
+                  max_in_flight: int,
+                  debug: bool,
+                  adaptive_batches: bool,
+                  max_batch_bytes: int,
+                  click_rows: Optional[int]) -> ShardResult:
+    result = ShardResult(index=index)
+    start = time.perf_counter()
+    test_cases = []
+    target = _ShardTarget(org_name, click_rows)
+    for email_json in emails:
+        test_case = generate_vectr_test_case(target, email_json, debug)
+        if test_case:
+            test_cases.append(test_case)
+            result.email_ids.append(email_json['email_id'])
+        else:
+            result.failed += 1
+    result.transform_seconds = time.perf_counter() - start
+
+    if test_cases:
+        # A worker runs one shard at a time, so fresh stats hold exactly this shard's requests
+        connection = get_connection(connection_params)
+        connection.stats = VectrGQLStats()
+        start = time.perf_counter()
+        if adaptive_batches:
+            # The connection's sizer carries over between the shards of this worker
+            result.upload_report = create_test_cases_adaptive(
+                connection_params, db, campaign_id, test_cases,
+                initial_size=batch_size, max_in_flight=max_in_flight, max_batch_bytes=max_batch_bytes
+            )
+        else:
+            result.upload_report = create_test_cases_batched(
+                connection_params, db, campaign_id, test_cases,
+                batch_size=batch_size, max_in_flight=max_in_flight
+            )
+        result.upload_seconds = time.perf_counter() - start
+        result.stats = connection.stats
+    return result
+
+
+def _shard_variants(shard: List[dict]) -> List[Tuple[str, str]]:
+    variants = []
+    for email_json in shard:
+        try:
+            variants.append((email_json['email_id'], test_case_variant(email_json)))
+        except KeyError:
+            # Can't be transformed either, so it will never be sent
+            pass
+    return variants
+
+
+def _confirm_shard(checkpoint: ImportCheckpoint, result: ShardResult):
+    for batch in result.upload_report.batches:
+        if not batch.succeeded:
+            continue
+        if len(batch.created) == batch.size:
+            test_case_ids = [test_case["id"] for test_case in batch.created]
+        else:
+            test_case_ids = [None] * batch.size
+        checkpoint.mark_confirmed(result.email_ids[batch.start:batch.start + batch.size], test_case_ids)
+
+
+def run_sharded_import(pool: Pool,
+                       workers: int,
+                       connection_params: VectrGQLConnParams,
+                       db: str,
+                       campaign_id: str,
+                       org_name: str,
+                       emails: Iterable[dict],
+                       shard_size: int,
+                       batch_size: int = 100,
+                       max_in_flight: int = 4,
+                       checkpoint: Optional[ImportCheckpoint] = None,
+                       debug: bool = False,
+                       on_shard_done: Optional[Callable[[ShardResult], None]] = None,
+                       adaptive_batches: bool = False,
+                       max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+                       click_rows: Optional[int] = None) -> ShardedImportResult:
+    """
+    Transform and upload an email stream on a pool of worker processes
+
+    The coordinator splits the stream into shards of shard_size emails and hands
+    each shard to exactly one worker, which transforms it and uploads its test
+    cases into campaign_id over its own connection. No email is given to two
+    workers and failed batches aren't resubmitted, so nothing is created twice.
+    Each shard is marked sent in the checkpoint before it is dispatched and
+    confirmed once its results are back, so an interrupted run can be resumed.
+    At most SHARDS_AHEAD shards per worker are read ahead of the slowest one.
+
+    Parameters
+    ----------
+    pool : Pool
+        Worker pool from create_worker_pool
+    workers : int
+        Number of processes in pool
+    connection_params : VectrGQLConnParams
+        Connection parameters for the target VECTR instance including api key and url
+    db : str
+        The database holding the campaign
+    campaign_id : str
+        The resolved ID of the campaign every worker uploads into
+    org_name : str
+        Organization set on the generated test cases
+    emails : Iterable[dict]
+        delivr.to email results
+    shard_size : int
+        Number of emails sent to a worker at a time
+    batch_size : int
+        Maximum number of Test Cases sent in one mutation by a worker, the initial one with adaptive_batches
+    max_in_flight : int
+        Maximum number of batch mutations in flight in each worker
+    checkpoint : Optional[ImportCheckpoint]
+        Ledger recording the progress of every email
+    debug : bool
+        Print the details of each processed email
+    on_shard_done : Optional[Callable[[ShardResult], None]]
+        Called in the coordinator with each shard's result as it completes
+    adaptive_batches : bool
+        Let each worker adapt its batch size to what VECTR sustains, see create_test_cases_adaptive
+    max_batch_bytes : int
+        Largest serialized size of one adaptive batch
+    click_rows : Optional[int]
+        Clicks of an email listed in full in its outcome notes, see render_clicks
+
+    Returns
+    -------
+    ShardedImportResult
+        The uploaded email IDs, transform failures and the merged upload report and API stats
+    """
+    result = ShardedImportResult()
+    pending: Deque = deque()
+    email_iter: Iterator[dict] = iter(emails)
+    shard_index = 0
+
+    def collect(shard_result: ShardResult):
+        report = shard_result.upload_report
+        if checkpoint:
+            _confirm_shard(checkpoint, shard_result)
+        # Renumber the shard's batches to follow on from those already merged
+        first_batch_index = len(result.upload_report.batches)
+        first_offset = sum(batch.size for batch in result.upload_report.batches)
+        for batch in report.batches:
+            if batch.succeeded:
+                result.emails_uploaded.extend(shard_result.email_ids[batch.start:batch.start + batch.size])
+            batch.index += first_batch_index
+            batch.start += first_offset
+            result.upload_report.batches.append(batch)
+        result.upload_report.splits += report.splits
+        result.emails_failed += shard_result.failed
+        result.stats.merge(shard_result.stats)
+        if on_shard_done:
+            on_shard_done(shard_result)
+
+    while True:
+        shard = list(islice(email_iter, shard_size))
+        if not shard:
+            break
+        if checkpoint:
+            variants = _shard_variants(shard)
+            checkpoint.mark_parsed(variants)
+            checkpoint.mark_sent([email_id for email_id, _ in variants], shard_index)
+        pending.append(pool.apply_async(_import_shard, (
+            shard_index, connection_params, db, campaign_id, org_name, shard, batch_size, max_in_flight, debug,
+            adaptive_batches, max_batch_bytes, click_rows
+        )))
+        shard_index += 1
+        while len(pending) >= workers * SHARDS_AHEAD:
+            collect(pending.popleft().get())
+
+    while pending:
+        collect(pending.popleft().get())
+    return result
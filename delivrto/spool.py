@@ -0,0 +1,171 @@
+import gzip
+import json
+import os
+import time
+from pydantic import BaseModel
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from vectrapi.models import TestCaseInput, TestCaseRecord
+
+SPOOL_VERSION = 1
+
+# Email results transformed together before their test cases are written to a spool
+SPOOL_WINDOW = 1000
+
+# gzip level of spool files, level 9 barely shrinks NDJSON further but is several times slower
+SPOOL_COMPRESSLEVEL = 6
+
+
+class SpoolHeader(BaseModel):
+    """First line of a spool, recording where its test cases were meant to be imported"""
+    version: int = SPOOL_VERSION
+    source: str
+    created: float = 0.0
+    org_name: Optional[str] = None
+    target_db: Optional[str] = None
+    assessment_name: Optional[str] = None
+    campaign_name: Optional[str] = None
+
+
+class SpoolWriter:
+    """Writes generated test cases as gzip-compressed NDJSON for a later replay
+
+    The first line is the SpoolHeader, every further line holds the email_id of an
+    email result and the testCaseData input built for it, exactly as it would be
+    sent in a createWithTemplateMatchByName mutation. The spool is written to a
+    temporary file next to path and only renamed to path once closed, so a spool
+    that exists is always complete.
+
+    Parameters
+    ----------
+    path : str
+        File the spool is written to, conventionally ending in .ndjson.gz
+    header : SpoolHeader
+        Target and source of the spooled test cases
+    """
+
+    def __init__(self, path: str, header: SpoolHeader):
+        self.path = path
+        self.count = 0
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        if not header.created:
+            header.created = time.time()
+        self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8", compresslevel=SPOOL_COMPRESSLEVEL)
+        self._file.write(header.json() + "\n")
+
+    def write(self, email_ids: List[str], test_cases: List[TestCaseInput]):
+        self._file.write("".join(
+            json.dumps({"email_id": email_id, "testCaseData": dict(test_case)}) + "\n"
+            for email_id, test_case in zip(email_ids, test_cases)
+        ))
+        self.count += len(test_cases)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def discard(self):
+        """Abandons an unfinished spool, removing its temporary file"""
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class SpoolReader:
+    """Streams the records of a spool written by SpoolWriter one line at a time
+
+    Records are dicts holding an email_id and its testCaseData input, see
+    spooled_test_case to turn the latter back into a test case. A spool may be
+    stale or edited by hand, so every record is checked first: records that
+    aren't valid JSON or don't hold a test case are skipped and kept in invalid
+    as (line number, reason), and passed to on_invalid as they are read.
+
+    Parameters
+    ----------
+    path : str
+        Spool file to read
+    on_invalid : Optional[Callable[[int, str], None]]
+        Called with the line number and reason of every invalid record
+    """
+
+    def __init__(self, path: str, on_invalid: Optional[Callable[[int, str], None]] = None):
+        self.records_read = 0
+        self.invalid: List[Tuple[int, str]] = []
+        self.on_invalid = on_invalid
+        self._file = gzip.open(path, "rt", encoding="utf-8")
+        try:
+            self.header = SpoolHeader.parse_raw(self._file.readline())
+        except Exception:
+            self._file.close()
+            raise ValueError("not a spool written by this importer")
+        if self.header.version != SPOOL_VERSION:
+            self._file.close()
+            raise ValueError(f"spool version {self.header.version} is not supported")
+
+    def __iter__(self) -> Iterator[dict]:
+        for line in self._file:
+            self.records_read += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record, error = None, "not valid JSON"
+            else:
+                error = spool_record_error(record)
+            if error is None:
+                yield record
+                continue
+            # The header is line 1
+            line_number = self.records_read + 1
+            self.invalid.append((line_number, error))
+            if self.on_invalid:
+                self.on_invalid(line_number, error)
+
+    def close(self):
+        self._file.close()
+
+
+def spool_record_error(record) -> Optional[str]:
+    """Why a spool record can't be replayed, None if it holds an email_id and a test case"""
+    if not isinstance(record, dict):
+        return "not a JSON object"
+    if not isinstance(record.get("email_id"), str):
+        return "missing email_id"
+    test_case_data = record.get("testCaseData")
+    if not isinstance(test_case_data, dict):
+        return "missing testCaseData"
+    missing = [field for field in ("name", "technique") if not test_case_data.get(field)]
+    if missing:
+        return f"testCaseData is missing {', '.join(missing)}"
+    unknown = test_case_data.keys() - set(TestCaseRecord.__slots__)
+    if unknown:
+        return f"unknown testCaseData fields: {', '.join(sorted(unknown))}"
+    return None
+
+
+def spooled_test_case(record: dict) -> TestCaseRecord:
+    """The test case of a spool record, serializing to the same testCaseData it was spooled as"""
+    return TestCaseRecord(**record["testCaseData"])
+
+
+def spooled_variant(record: dict) -> str:
+    """Variant name of the test case in a spool record, for checkpoints and campaign lookups"""
+    return record["testCaseData"]["name"]
+
+
+def iter_windows(items: Iterable, size: int) -> Iterator[list]:
+    """Splits items into lists of up to size items"""
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
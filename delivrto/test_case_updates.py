@@ -0,0 +1,61 @@
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from vectrapi.models import TestCaseInput, TestCaseUpdate, TestCaseUploadReport
+
+# testCaseData fields that change as delivr.to results come in, and are compared with VECTR's
+UPDATABLE_FIELDS = ["outcome", "tags", "alertTriggered", "outcomeNotes"]
+
+
+class TestCaseUpdateReport(BaseModel):
+    upload_report: TestCaseUploadReport = TestCaseUploadReport()
+    unchanged: int = 0
+
+    @property
+    def updated(self) -> int:
+        return len(self.upload_report.created_ids)
+
+
+def held_fields(vectr_test_case: dict) -> Dict[str, Any]:
+    """The UPDATABLE_FIELDS of a test case as returned by VECTR, in their testCaseData form"""
+    outcome = vectr_test_case.get("outcome")
+    if isinstance(outcome, dict):
+        outcome = outcome.get("name")
+    alert_triggered = vectr_test_case.get("alertTriggered")
+    if isinstance(alert_triggered, bool):
+        alert_triggered = "Yes" if alert_triggered else "No"
+    return {
+        "outcome": outcome,
+        "tags": [tag["name"] if isinstance(tag, dict) else tag for tag in vectr_test_case.get("tags") or []],
+        "alertTriggered": alert_triggered,
+        "outcomeNotes": vectr_test_case.get("outcomeNotes"),
+    }
+
+
+def changed_fields(vectr_test_case: dict, test_case: TestCaseInput) -> Dict[str, Any]:
+    """The UPDATABLE_FIELDS of test_case that differ from what VECTR holds for it
+
+    Tags are compared regardless of order and case, outcomes and alert flags
+    regardless of case, and a missing value equals an empty one.
+    """
+    held = held_fields(vectr_test_case)
+    changes = {}
+    for field in UPDATABLE_FIELDS:
+        value = getattr(test_case, field)
+        if field == "tags":
+            same = sorted(tag.lower() for tag in value or []) == sorted(tag.lower() for tag in held["tags"])
+        elif field == "outcomeNotes":
+            same = (value or "") == (held[field] or "")
+        else:
+            same = (value or "").lower() == (held[field] or "").lower()
+        if not same:
+            changes[field] = value
+    return changes
+
+
+def test_case_update(vectr_test_case: dict, test_case: TestCaseInput) -> Optional[TestCaseUpdate]:
+    """Update bringing the VECTR test case in line with test_case, None when it already is"""
+    changes = changed_fields(vectr_test_case, test_case)
+    if not changes:
+        return None
+    return TestCaseUpdate(testCaseId=vectr_test_case["id"], testCaseData=changes)
+
@@ -0,0 +1,97 @@
+import json
+import os
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
+from .batch_import import export_stem
+from .export_reader import CompressedExport, EmailResultsReader, open_export
+
+
+class WatchedExport(BaseModel):
+    size: int = 0
+    mtime_ns: int = 0
+    json_lines: bool = False
+    # Bytes of a JSON lines export read up to the end of its last complete record
+    offset: int = 0
+
+
+class ExportWatcher:
+    """Polls an export, or a directory of exports, for email results added since the last poll
+
+    A JSON lines export that grows is read on from where the previous poll stopped,
+    up to its last complete record. Any other change (a new export, a rewritten
+    UI or API export, or a compressed export) reads the export whole, leaving it to the caller to skip the
+    emails it already imported. An export that can't be parsed yet, e.g. because it
+    is still being written, is read again on the next poll. Unchanged exports are
+    only stat'ed, so polling an idle directory costs next to nothing.
+
+    Parameters
+    ----------
+    path : str
+        Export file, or directory whose export files (see EXPORT_EXTENSIONS) are watched
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.exports: Dict[str, WatchedExport] = {}
+
+    def _export_paths(self) -> List[str]:
+        if os.path.isdir(self.path):
+            return sorted(
+                entry.path for entry in os.scandir(self.path)
+                if entry.is_file() and export_stem(entry.name) != entry.name
+            )
+        return [self.path]
+
+    def poll(self) -> List[Tuple[str, List[dict]]]:
+        """The email results read from each export that changed since the last poll"""
+        changes = []
+        for path in self._export_paths():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            watched = self.exports.get(path)
+            if watched and watched.size == stat.st_size and watched.mtime_ns == stat.st_mtime_ns:
+                continue
+            try:
+                records, state = self._read(path, watched, stat.st_size)
+            except ValueError:
+                # Incomplete, try again on the next poll
+                continue
+            state.size = stat.st_size
+            state.mtime_ns = stat.st_mtime_ns
+            self.exports[path] = state
+            if records:
+                changes.append((path, records))
+        return changes
+
+    def _read(self, path: str, watched: Optional[WatchedExport], size: int) -> Tuple[List[dict], WatchedExport]:
+        if watched and watched.json_lines and size >= watched.size:
+            try:
+                return _read_json_lines(path, watched.offset)
+            except ValueError:
+                # Rewritten rather than appended to, read it again from the start
+                pass
+        with open_export(path) as data_file:
+            email_results = EmailResultsReader(data_file)
+            if email_results.export_type != "JSONL" or isinstance(data_file, CompressedExport):
+                # Offsets into a compressed export can't be resumed from, so it is read whole
+                return list(email_results), WatchedExport()
+        return _read_json_lines(path, 0)
+
+
+def _read_json_lines(path: str, offset: int) -> Tuple[List[dict], WatchedExport]:
+    with open(path, 'rb') as data_file:
+        data_file.seek(offset)
+        data = data_file.read()
+    end = data.rfind(b"\n") + 1
+    records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+    tail = data[end:]
+    if tail.strip():
+        try:
+            # A last record without a trailing newline counts once it is complete
+            records.append(json.loads(tail))
+            end = len(data)
+        except ValueError:
+            pass
+    return records, WatchedExport(json_lines=True, offset=offset + end)
@@ -1,20 +1,19 @@
-import os, re, json, argparse, datetime
-from datetime import datetime, timezone
+import os, argparse, queue, signal, time
+from contextlib import contextmanager
 
 ### VECTR API ###
-from dotenv import dotenv_values
-from vectrapi.models import TestCase, Campaign
-from vectrapi.vectr_api_client import VectrGQLConnParams, \
-    create_assessment, \
-    create_campaigns, \
-    create_test_cases, \
-    get_org_id_for_campaign_and_assessment_data, \
-    get_assessment_by_name, \
-    get_campaign_by_name
+# Only what the argument parser needs is imported up front, the rest is imported once
+# the arguments are valid, and the VECTR client only on the paths that talk to VECTR
+from delivrto.campaign_export import DEFAULT_EXPORT_FIELDS
+from delivrto.id_cache import DEFAULT_TTL
+from delivrto.reporting import ImportReporter
+from vectrapi.defaults import DEFAULT_MAX_BATCH_BYTES, DEFAULT_PAGE_SIZE
 
 VECTR_CONFIG_FILE = "vectr.env"
+CHECKPOINT_FILE = os.path.join(os.path.dirname(VECTR_CONFIG_FILE), "vectr_import.db")
 
-SUPPORTED_SECURITY_TOOL_INTEGRATIONS = [ "Sublime", "Defender" ]
+# Seconds between polls of a watched export or directory
+DEFAULT_WATCH_INTERVAL = 5.0
 
 #################
 """
@@ -42,117 +41,381 @@ def print_banner():
     print(banner)
 
 """
-VECTR Connection Class Object
+Prints what an importer is doing, as a line per email unless the progress line is shown,
+holding the lines back while output is deferred until they are flushed
 """
-class vectr_connection():
-    def __init__(self, org_name, connection_params, target_db, campaign_name, campaign_id):
-        self.org_name = org_name
-        self.connection_params = connection_params
-        self.target_db = target_db
-        self.campaign_name = campaign_name
-        self.campaign_id = campaign_id
+class ConsoleReporter(ImportReporter):
+    def __init__(self, progress=None, debug=False):
+        self.progress = progress
+        self.debug = debug
+        # Lines held back while deferring, e.g. those a background upload reports during a --step prompt
+        self.deferred = None
+
+    def _print(self, line):
+        if self.deferred is not None:
+            self.deferred.put(line)
+        else:
+            print(line)
+
+    @contextmanager
+    def deferring_output(self):
+        self.deferred = queue.SimpleQueue()
+        try:
+            yield self
+        finally:
+            self.flush_output()
+            self.deferred = None
+
+    def flush_output(self):
+        while self.deferred is not None and not self.deferred.empty():
+            print(self.deferred.get())
+
+    def resolving_campaign(self, importer):
+        self._print(f"  - Assessment Name: {importer.assessment_name}")
+        self._print(f"  - Target DB: {importer.target_db}")
+
+    def assessment_resolved(self, importer, assessment_id, created):
+        self._print(f"  - {'Created' if created else 'Using existing'} assessment with ID: {assessment_id}")
+
+    def campaign_resolved(self, importer, campaign_id, cached=False, created=False):
+        if cached:
+            self._print(f"  - Using cached campaign ID: {campaign_id}\n")
+        else:
+            self._print(f"  - {'Created' if created else 'Using existing'} campaign with ID: {campaign_id}\n")
+
+    def stale_campaign_id(self, importer, campaign_id):
+        self._print(f"[!] Cached campaign ID {campaign_id} is stale, looking it up again.")
+
+    def refreshing_campaign_id(self, importer):
+        self._print("\n[!] Upload failed using a cached campaign ID, refreshing VECTR IDs:")
+
+    def resuming(self, importer, state_counts):
+        self._print(f"[*] Resuming import: {state_counts.get('confirmed', 0)} emails confirmed, {state_counts.get('sent', 0)} sent without confirmation.")
+
+    def campaign_indexed(self, importer, test_cases, reconciled=None):
+        self._print(f"[*] Campaign already holds {test_cases} test cases.")
+        if reconciled is not None:
+            self._print(f"[*] Reconciled {reconciled} unconfirmed emails found in the campaign.")
+
+    def email_processed(self, email_json, vectr_test_case):
+        if self.debug:
+            self._print("    [-] Test Case Data:")
+            self._print(vectr_test_case)
+        if self.progress:
+            return
+        file_name = email_json.get('payload_name')
+        delivery_type = get_mail_type(email_json.get('mail_type'))
+        if vectr_test_case:
+            self._print(f"[+] Processed '{file_name}' sent as {delivery_type}")
+        else:
+            self._print(f"[!] Failed to process '{file_name}' sent as {delivery_type}")
+
+    def background_upload_failed(self, importer, test_cases, error):
+        self._print(f"[!] Background upload of {test_cases} test cases failed: {error}")
+
+    def shard_done(self, shard_result):
+        if not self.progress:
+            self._print(f"[+] Shard {shard_result.index + 1}: {len(shard_result.email_ids)} emails processed, {shard_result.failed} failed")
 
 """
-Initialise VECTR connection
+Read the VECTR API details from the VECTR config file
 """
-def initialise_vectr_connection():
-    print("\n[*] Initialising VECTR API:")
-    
+def load_connection_params(compress_requests=False):
     env_config = dotenv_values(VECTR_CONFIG_FILE)
-    org_name=env_config.get("ORG_NAME")
-
-    connection_params = VectrGQLConnParams(
+    return VectrGQLConnParams(
         api_key=env_config.get("API_KEY"),
-        vectr_gql_url=env_config.get("VECTR_GQL_URL")
+        vectr_gql_url=env_config.get("VECTR_GQL_URL"),
+        compress_requests=compress_requests
     )
-    org_id = get_org_id_for_campaign_and_assessment_data(
-        connection_params=connection_params,
-        org_name=org_name
+
+"""
+Build an importer from the VECTR config file and this run's options, without API details when offline
+"""
+def load_importer(import_options, run_metrics, progress=None, id_cache=None, worker_pool=None, worker_count=0,
+                  compress_requests=False, offline=False):
+    env_config = dotenv_values(VECTR_CONFIG_FILE)
+    return Importer(
+        None if offline else load_connection_params(compress_requests),
+        env_config.get("ORG_NAME"),
+        env_config.get("TARGET_DB"),
+        env_config.get("ASSESSMENT_NAME"),
+        env_config.get("CAMPAIGN_NAME"),
+        import_options,
+        id_cache,
+        CHECKPOINT_FILE,
+        run_metrics,
+        progress,
+        worker_pool,
+        worker_count,
+        ConsoleReporter(progress, import_options.debug)
     )
-    target_db = env_config.get("TARGET_DB")
-    assessment_name = env_config.get("ASSESSMENT_NAME")
-    campaign_name = env_config.get("CAMPAIGN_NAME")
 
-    print(f"  - Assessment Name: {assessment_name}")
-    print(f"  - Target DB: {target_db}")
+"""
+Initialise the VECTR connection of importer, targeting the campaign recorded in spool_header if given
+"""
+def initialise_importer(importer, spool_header=None):
+    print("\n[*] Initialising VECTR API:")
+
+    if spool_header:
+        importer.org_name = spool_header.org_name or importer.org_name
+        importer.target_db = spool_header.target_db or importer.target_db
+        importer.assessment_name = spool_header.assessment_name or importer.assessment_name
+        importer.campaign_name = spool_header.campaign_name or importer.campaign_name
+    importer.resolve_campaign()
+    return importer
+
+"""
+Import email results one at a time, prompting for confirmation before each, returning the uploaded email IDs
+
+Confirmed test cases are uploaded in batches on a background thread, so the next prompt never waits on VECTR
+"""
+def enumerate_email_tests(importer, results_json, checkpoint=None):
+    # Only --step uploads in the background, so no other run imports it
+    from delivrto.background_upload import BackgroundUploader
+    accepted_emails = []
+    upload_report = TestCaseUploadReport()
+    reporter = importer.reporter
+    # Uploads report from their own thread, so hold that output back and show it between prompts
+    with reporter.deferring_output(), BackgroundUploader(importer, upload_report, checkpoint) as uploader:
+        try:
+            for email_json in results_json:
+                file_name = email_json['payload_name']
+                delivery_type = get_mail_type(email_json['mail_type'])
+
+                reporter.flush_output()
+                if not user_prompt_confirms_continue(f"[*] Process file '{file_name}' sent as {delivery_type}? [Y/n]"):
+                    continue
+                vectr_test_case = importer.transform_one(email_json)
+                if vectr_test_case:
+                    uploader.add(email_json['email_id'], vectr_test_case)
+                    accepted_emails.append(email_json)
+        except (KeyboardInterrupt, EOFError):
+            print("\n[*] Stopped reviewing, the emails accepted so far are still uploaded.")
+        reporter.flush_output()
+        if uploader.pending:
+            print(f"\n[*] Waiting for the last {uploader.pending} accepted test cases to upload...")
+
+    print_upload_report(upload_report)
+    print_accepted_emails(accepted_emails, uploader.uploaded)
+    return uploader.uploaded
+
+"""
+Print whether the test case of each email accepted with --step landed in VECTR
+"""
+def print_accepted_emails(accepted_emails, emails_uploaded):
+    uploaded = set(emails_uploaded)
+    print(f"[*] {len(uploaded)} of {len(accepted_emails)} accepted emails landed in VECTR:")
+    for email_json in accepted_emails:
+        landed = email_json['email_id'] in uploaded
+        print(f"  - {'Landed' if landed else 'NOT landed'}: '{email_json['payload_name']}' sent as "
+              f"{get_mail_type(email_json['mail_type'])} ({email_json['email_id']})")
+
+"""
+Import streamed email results into the resolved campaign of importer, returning the number of emails uploaded
+"""
+def import_email_results(importer, email_results, email_results_path, step=False, resume=False):
+    if not step:
+        import_result = importer.import_results(email_results, email_results_path, resume)
+        print_upload_report(import_result.upload_report)
+        if importer.options.update_existing:
+            print_update_report(import_result.update_report)
+        print_import_summary(import_result.emails_uploaded, import_result.emails_read, import_result.emails_resumed,
+                             import_result.emails_skipped, importer.progress)
+        return len(import_result.emails_uploaded)
+
+    incremental = importer.options.incremental
+    checkpoint = importer.open_checkpoint(email_results_path, resume)
+    emails_to_import = checkpoint.skip_confirmed(importer.metrics.timed("parse", email_results))
+    campaign_index = importer.index_campaign(checkpoint, incremental)
+    if incremental:
+        emails_to_import = campaign_index.skip_imported(emails_to_import)
+    emails_uploaded = enumerate_email_tests(importer, emails_to_import, checkpoint)
+    checkpoint.close()
+
+    record_import_counts(importer.metrics, len(emails_uploaded), email_results.records_read,
+                         checkpoint.skipped if resume else None,
+                         campaign_index.skipped if incremental else None)
+    print_import_summary(emails_uploaded, email_results.records_read,
+                         checkpoint.skipped if resume else None,
+                         campaign_index.skipped if incremental else None,
+                         importer.progress)
+    return len(emails_uploaded)
+
+"""
+Transform streamed email results and write their test cases to a spool instead of uploading them
+"""
+def spool_email_results(importer, email_results, email_results_path, spool_path):
+    header = SpoolHeader(
+        source=os.path.abspath(email_results_path),
+        org_name=importer.org_name,
+        target_db=importer.target_db,
+        assessment_name=importer.assessment_name,
+        campaign_name=importer.campaign_name
+    )
+    run_metrics = importer.metrics
+    with SpoolWriter(spool_path, header) as spool:
+        for emails in iter_windows(run_metrics.timed("parse", email_results), SPOOL_WINDOW):
+            email_ids = []
+            test_cases = []
+            for email_json, vectr_test_case in zip(emails, importer.transform(emails)):
+                if vectr_test_case:
+                    email_ids.append(email_json['email_id'])
+                    test_cases.append(vectr_test_case)
+            with run_metrics.stage("spool", len(test_cases)):
+                spool.write(email_ids, test_cases)
+
+    run_metrics.count("read", email_results.records_read)
+    run_metrics.count("spooled", spool.count)
+    if importer.progress:
+        importer.progress.finish()
+    print(f"\n[+] Spooled {spool.count} of {email_results.records_read} emails to {spool_path}.")
+
+"""
+Open a spool for replay, exiting if it is missing or not a spool
+"""
+def open_spool(spool_path, run_metrics):
+    if not os.path.exists(spool_path):
+        print("[!] No spool found at specified path.")
+        exit()
+
+    def report_invalid_record(line_number, reason):
+        # Read but never uploaded, so a bad record counts as a failed email
+        run_metrics.count("read")
+        run_metrics.count("failed")
+        print(f"[!] Skipping spool line {line_number}: {reason}.")
 
     try:
-        assessment_id = get_assessment_by_name(connection_params, target_db, assessment_name)
-        print(f"  - Using existing assessment with ID: {assessment_id}")
-    except RuntimeError as e:
-        created_assessment_detail = create_assessment(connection_params, target_db, org_id, assessment_name)
-        assessment_id = created_assessment_detail.get(assessment_name).get("id")
-        print(f"  - Created assessment with ID: {assessment_id}")
+        with run_metrics.stage("load"):
+            spool = SpoolReader(spool_path, on_invalid=report_invalid_record)
+    except Exception as e:
+        print(f"[!] Failed to open spool: {e}")
+        exit()
+    print(f"[*] Replaying spool of '{spool.header.source}'.")
+    return spool
+
+"""
+Upload the test cases of a spool into the resolved campaign of importer, returning the number of emails uploaded
+"""
+def replay_spool(importer, spool, spool_path, resume=False):
+    import_result = importer.upload_spool(spool, spool_path, resume)
+    print_upload_report(import_result.upload_report)
+    print_import_summary(import_result.emails_uploaded, import_result.emails_read + len(spool.invalid),
+                         import_result.emails_resumed, import_result.emails_skipped, importer.progress)
+    if spool.invalid:
+        print(f"[!] {len(spool.invalid)} spool records failed as malformed.")
+    return len(import_result.emails_uploaded)
 
+"""
+Keep importing the email results added to an export or directory of exports until stopped
+"""
+def watch_exports(importer, watch_path, interval=DEFAULT_WATCH_INTERVAL, metrics_path=None):
+    run_metrics = importer.metrics
+    incremental = importer.options.incremental
+    update_existing = importer.options.update_existing
+    # The ledger of every email imported from watch_path is kept across polls and restarts
+    checkpoint = importer.open_checkpoint(watch_path, resume=True)
+    # With update_existing every poll indexes the campaign as it is then instead
+    campaign_index = importer.index_campaign(checkpoint, incremental)
+    watcher = ExportWatcher(watch_path)
+    print(f"[*] Watching '{watch_path}' for new email results every {interval:g}s, Ctrl+C to stop.")
     try:
-        campaign_id = get_campaign_by_name(connection_params, target_db, campaign_name)
-        print(f"  - Using existing campaign with ID: {campaign_id}\n")
-    except RuntimeError as e:
-        cpgn = { campaign_name: Campaign(name=campaign_name, test_cases=[]) }
-        created_campaigns = create_campaigns(
-            connection_params,
-            target_db,
-            org_id,
-            cpgn,
-            assessment_id
-        )
-        campaign_id = created_campaigns.get(campaign_name).get("id")
-        print(f"  - Created campaign with ID: {campaign_id}\n")
-    
-    return vectr_connection(org_name, connection_params, target_db, campaign_name, campaign_id)
-
-"""
-Fetch mail type for API or UI results JSON
-"""
-def get_mail_type(mail_type):
-    if mail_type in ['as_link', 'Link']:
-        return 'Link'
-    elif mail_type in ['as_attachment', 'Attachment']:
-        return 'Attachment'
-    elif mail_type in ['as_body', 'Body']:
-        return 'Body'
-    else:
-        return None
-
-"""
-Enumerate email tests in input JSON
-"""
-def enumerate_email_tests(vectr_con, results_json, step=False, debug=False):
-    emails_uploaded = []
-    if step:
-        for email_json in results_json:
-            delivery_type = get_mail_type(email_json['mail_type'])
-
-            if not user_prompt_confirms_continue(f"[*] Process file '{file_name}' sent as {delivery_type}? [Y/n]"):
-                continue
-            vectr_test_case = generate_vectr_test_case(vectr_con, email_json, debug)
-            if vectr_test_case:
-                if add_test_cases_to_vectr(vectr_con, [vectr_test_case]):
-                    emails_uploaded.append(email_json['email_id'])
-            else:
-                print(f"[!] Failed to process '{file_name}' sent as {delivery_type}")
-                continue
-    else:
-        email_test_cases = []
-        for email_json in results_json:
-            file_name = email_json['payload_name']
-            
-            delivery_type = get_mail_type(email_json['mail_type'])
-
-            vectr_test_case = generate_vectr_test_case(vectr_con, email_json, debug)
-            if debug:
-                print(f"    [-] Test Case Data:")
-                print(vectr_test_case)
-            if vectr_test_case:
-                email_test_cases.append(vectr_test_case)
-                print(f"[+] Processed '{file_name}' sent as {delivery_type}")
-            else:
-                print(f"[!] Failed to process '{file_name}' sent as {delivery_type}")
-                continue
-        if add_test_cases_to_vectr(vectr_con, email_test_cases):
-            emails_uploaded.extend([email['email_id'] for email in results_json])
-
-    return emails_uploaded
+        while True:
+            for export_path, email_results in watcher.poll():
+                run_metrics.count("read", len(email_results))
+                if update_existing:
+                    # Confirmed emails may have changed results, compared against the campaign as it is now
+                    emails = email_results
+                    campaign_index = importer.index_campaign(checkpoint, with_results=True)
+                else:
+                    emails = list(checkpoint.skip_confirmed(email_results))
+                if incremental and not update_existing:
+                    emails = list(campaign_index.skip_imported(emails))
+                if not emails:
+                    continue
+                print(f"\n[*] {len(emails)} new email results in '{export_path}'.")
+                import_result = ImportResult()
+                emails_uploaded = importer.upload_emails(emails, import_result, checkpoint,
+                                                         campaign_index if update_existing else None)
+                print_upload_report(import_result.upload_report)
+                if update_existing:
+                    print_update_report(import_result.update_report)
+                run_metrics.count("uploaded", len(emails_uploaded))
+                if importer.progress:
+                    importer.progress.finish()
+                print(f"[+] {len(emails_uploaded)} of {len(emails)} new emails processed.")
+                if metrics_path:
+                    run_metrics.write(metrics_path, importer.stats)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n[*] Stopped watching.")
+    finally:
+        checkpoint.close()
+
+"""
+Stream the test cases of the campaign of importer to an NDJSON or CSV export, one page at a time
+"""
+def export_campaign(importer, export_path, fields):
+    print("\n[*] Initialising VECTR API:")
+    print(f"  - Target DB: {importer.target_db}")
+    print(f"  - Campaign Name: {importer.campaign_name}")
+    try:
+        with CampaignExportWriter(export_path, fields) as export:
+            for test_cases in importer.iter_test_case_pages(fields):
+                with importer.metrics.stage("export", len(test_cases)):
+                    export.write(test_cases)
+    except (RuntimeError, ValueError) as e:
+        print(f"[!] {e}.")
+        exit()
+    importer.metrics.count("exported", export.count)
+    print(f"\n[+] Exported {export.count} test cases to {export_path}.")
+
+"""
+Stop watching on SIGTERM as on Ctrl+C
+"""
+def stop_watching(signum, frame):
+    raise KeyboardInterrupt
+
+"""
+Add the outcome of an import the importer didn't count itself to the run metrics
+"""
+def record_import_counts(run_metrics, emails_uploaded, emails_read, emails_resumed=None, emails_skipped=None):
+    run_metrics.count("read", emails_read)
+    run_metrics.count("uploaded", emails_uploaded)
+    run_metrics.count("skipped_resumed", emails_resumed or 0)
+    run_metrics.count("skipped_existing", emails_skipped or 0)
+
+"""
+Print per-batch upload results
+"""
+def print_upload_report(upload_report):
+    print(f"\n[*] Uploaded {len(upload_report.created_ids)} test cases in {len(upload_report.batches)} batches.")
+    for batch in upload_report.retried_batches:
+        print(f"  - Batch {batch.index + 1} needed {batch.attempts} attempts")
+    if upload_report.splits:
+        print(f"  - {upload_report.splits} failed batches split to isolate the failing test cases")
+    for batch in upload_report.failed_batches:
+        print(f"[!] Batch {batch.index + 1} ({batch.size} test cases) failed: {batch.error}")
+
+"""
+Print the results of updating existing test cases
+"""
+def print_update_report(update_report):
+    print(f"[*] Updated {update_report.updated} existing test cases in {len(update_report.upload_report.batches)} batches, {update_report.unchanged} already up to date.")
+    for batch in update_report.upload_report.failed_batches:
+        print(f"[!] Update batch {batch.index + 1} ({batch.size} test cases) failed: {batch.error}")
+
+"""
+Print the outcome of importing one export
+"""
+def print_import_summary(emails_uploaded, emails_read, emails_resumed=None, emails_skipped=None, progress=None):
+    if progress:
+        progress.finish()
+    print(f"\n[+] Completed results import to VECTR.")
+    print(f"[+] {len(emails_uploaded)} of {emails_read} emails processed.")
+    if emails_resumed is not None:
+        print(f"[+] {emails_resumed} emails skipped as confirmed by the previous run.")
+    if emails_skipped is not None:
+        print(f"[+] {emails_skipped} emails skipped as already imported.")
 
 def user_prompt_confirms_continue(message):
     answer = input(message)
@@ -161,174 +424,54 @@ def user_prompt_confirms_continue(message):
     if not answer: return True
     return False
 
-def generate_vectr_test_case(vectr_con, email_json, debug):
-    email_id = ""
-    file_name = ""
-    delivery_type = ""
-    mitre_id = ""
-    detecting_tools = ""
-    activity_logged = "TBD"
-    was_detected = False
+"""
+Open the VECTR ID cache, discarding this VECTR instance's cached IDs when refreshing
+"""
+def open_id_cache(ttl, refresh=False):
+    id_cache = VectrIdCache(CHECKPOINT_FILE, ttl)
+    if refresh:
+        id_cache.invalidate(load_connection_params().vectr_gql_url)
+    return id_cache
+
+"""
+Open an export for streaming, exiting if it is missing or not valid JSON
+"""
+def open_email_results(email_results_path, run_metrics):
+    if not os.path.exists(email_results_path):
+        print("[!] No delivr.to campaign results JSON found at specified path.")
+        exit()
+
     try:
-        email_id = email_json['email_id']
-        file_name = email_json['payload_name']
-        delivery_type = get_mail_type(email_json['mail_type'])
-        payload_description = email_json.get('payload_description', "")
-        if re.match(r"^\d{10}$", email_json['sent']):
-            sent_epoch = int(email_json['sent']) * 1000
-        else:
-            sent_epoch = int(datetime.strptime(email_json['sent'], '%Y-%m-%d %H:%M').replace(tzinfo=timezone.utc).timestamp()) * 1000
-    
-        if delivery_type == 'Link':
-            mitre_id = 'T1566.002'
-        elif delivery_type == 'Attachment':
-            mitre_id = 'T1566.001'
-        else: #body
-            mitre_id = 'T1566'
-        
-        tags = [delivery_type]
-        payload_tags = email_json.get('payload_tags', [])
-        tags.extend(payload_tags)
-        description = f"""**Email ID**: {email_id}
-**Delivery type**: {delivery_type.capitalize()}
-**Description**: {payload_description}
-"""
-        references = ",".join(email_json.get('payload_references', []))
-        outcome_notes = ""
-
-        if 'clicks' in email_json and len(email_json['clicks']) > 0:
-            tags.append("Clicked")
-            outcome_notes+="**Clicks:**\n\n"
-            outcome_notes+="| Timestamp | Method | User Agent | Source IP |\n"
-            outcome_notes+="| - | - | - | - |\n"
-            for click in email_json.get('clicks',[]):
-                ts = datetime.fromtimestamp(int(click['timestamp'])).isoformat()
-                outcome_notes+=f"| {ts} | {click['http_method']} | {click['user_agent']} | {click['source_ip']} |" + "\n"
-            outcome_notes+="\n\n\n"
-
-        if 'sendgrid_reason' in email_json:
-            outcome_notes+="**Gateway Response:**\n\n"
-            outcome_notes+=f"```\n{email_json['sendgrid_reason']}\n```\n\n\n"
-        
-        mail_controls = []
-        for k,v in email_json.items():
-            if k.startswith('mail_control_information'):
-                if k == 'mail_control_information':
-                    for control in v:
-                        control = control.capitalize()
-                        mail_controls.append((control, v[control]))
-                else:
-                    control = k.replace('mail_control_information.', '')
-                    control = control.capitalize()
-                    v = email_json[f"mail_control_information.{control}"]
-                    mail_controls.append((control, v))
-
-        for control, v in mail_controls:                
-            if control in SUPPORTED_SECURITY_TOOL_INTEGRATIONS:
-                control_name = control.capitalize()
-                detecting_tools+=f",{control_name}"
-                activity_logged="Yes"
-                if control_name == "Sublime":
-                    outcome_notes+=f"**Sublime:**\n\n"
-                    outcome_notes+=f"Action: `{v['state']}`\n\n"
-                    if v['flagged_rules']:
-                        was_detected=True
-                        tags.append(control_name)
-                        outcome_notes+="Rules:\n"
-                        for rule in v['flagged_rules']:
-                            outcome_notes+=f" - `{rule['name']}`"
-                            outcome_notes+="\n"
-                if control_name == "Defender":
-                    outcome_notes+=f"**Defender**\n\n"
-                    outcome_notes+=f"Action: `{v['state']}`"+"\n\n"
-                    if "delivered" not in v['state'].lower():
-                        tags.append(control_name)
-                    if v['threat_types']:
-                        outcome_notes+="Threat Types:\n"
-                        for tt in v['threat_types'].split(','):
-                            # Defender isn't technically 'alerting' like Sublime 
-                            # so we'll leave this commented out
-                            # if tt != "Spam":
-                            #     was_detected=True
-                            outcome_notes+=f" - `{tt}`"
-                            outcome_notes+="\n"
-                        outcome_notes+="\n"    
-                    if v['threat_names']:
-                        outcome_notes+="Threat Names:\n"
-                        for tt in v['threat_names'].split(','):
-                            outcome_notes+=f" - `{tt}`"
-                            outcome_notes+="\n"
-                        outcome_notes+="\n"
-                    if v['detection_methods']:
-                        outcome_notes+="Detection Methods:\n\n"
-                        for tt in v['detection_methods']:
-                            for m in v['detection_methods'][tt]:
-                                outcome_notes+=f" - `{tt}: {m}`"
-                                outcome_notes+="\n"
-
-        email_status = email_json['status'].lower()
-
-        if 'junk' in email_status:
-            tags.append("Junk")
-        
-        outcome = ""
-        if 'delivered' in email_status:
-            outcome = "NOTDETECTED" if not was_detected else "DETECTED"
-        elif email_status.startswith('blocked'):
-            outcome = "BLOCKED"
-            if 'dropped' in email_status:
-                tags.append("Dropped")
-            elif 'bounced' in email_status:
-                tags.append("Bounced")
-        elif email_status in ["stripped", "held", "rewritten"]:
-            tags.append(email_status.capitalize())
-            outcome = "BLOCKED"
-        elif email_status.startswith('sent'):
-            outcome = "TBD"
+        with run_metrics.stage("load"):
+            data_file = open_export(email_results_path)
+            email_results = EmailResultsReader(data_file)
+        print(f"[*] Handling {email_results.export_type} results export.")
+    except RuntimeError as e:
+        print(f"[!] {e}.")
+        exit()
     except Exception as e:
-        print(f"[!] Failed to process email result with error: {e}")
-        return False
-
-    if debug:
-        print(f"""
-[+] Processing {file_name} sent as ({delivery_type})...
-    [-] Email ID: {email_id}
-    [-] File Name: {file_name}
-    [-] Delivery Type: {delivery_type}
-    [-] Outcome: {outcome}
-    [-] Alerted: {"Yes" if was_detected else "No"}
-    [-] Controls: {', '.join([c[0] for c in mail_controls])}
-    [-] Tags: {', '.join(tags)}
-""")
-
-    return TestCase(
-        Variant=f"{file_name} ({delivery_type})",
-        Objective=description,
-        Phase="Initial Access",
-        MitreID=mitre_id,
-        Tags=','.join(tags),
-        Status="Completed",
-        Outcome=outcome,
-        OutcomeNotes=outcome_notes,
-        ExpectedDetectionLayers="Email Security Gateway",
-        AlertTriggered="Yes" if was_detected else "No",
-        References=references,
-        DetectingTools=detecting_tools,
-        ActivityLogged=activity_logged,
-        StartTimeEpoch=sent_epoch,
-        StopTimeEpoch=sent_epoch,
-        Organizations=vectr_con.org_name
-    )
-    
-
-def add_test_cases_to_vectr(vectr_con, test_cases):
-    created_test_cases = create_test_cases(
-        vectr_con.connection_params,
-        vectr_con.target_db,
-        vectr_con.campaign_id,
-        test_cases
-    )
-    return True
+        print("[!] Failed to process JSON from specified path, is it valid JSON?")
+        exit()
+    return data_file, email_results
+
+"""
+Import every export of a manifest or directory with importer, resolving all their campaigns up front
+"""
+def import_batch(importer, jobs, step=False, resume=False, id_cache=None):
+    print("\n[*] Initialising VECTR API:")
+    print(f"  - Target DB: {importer.target_db}")
+    with importer.metrics.stage("lookup", len(jobs)):
+        resolve_import_jobs(importer.connection_params, importer.target_db, importer.org_name, jobs, id_cache)
+
+    total_uploaded = 0
+    for job in jobs:
+        print(f"\n[*] Importing '{job.path}' into campaign '{job.campaign_name}':")
+        job_importer = importer.for_campaign(job.campaign_name, job.assessment_name, job.campaign_id, job.campaign_id_cached)
+        data_file, email_results = open_email_results(job.path, importer.metrics)
+        total_uploaded += import_email_results(job_importer, email_results, job.path, step, resume)
+        data_file.close()
+
+    print(f"\n[+] {total_uploaded} emails processed across {len(jobs)} exports.")
 
 """
 Parse arguments
@@ -336,42 +479,238 @@ Parse arguments
 parser = argparse.ArgumentParser(
     description="Upload delivr.to campaign results to VECTR."
 )
-parser.add_argument("--path", required=True, help="Path to delivr.to campaign output." )
+source = parser.add_mutually_exclusive_group(required=True)
+source.add_argument("--path", help="Path to delivr.to campaign output." )
+source.add_argument("--dir", help="Import every export in a directory, each into a campaign named after its file." )
+source.add_argument("--replay", help="Upload the test cases of a spool written with --spool." )
+source.add_argument("--watch", help="Keep running, importing the email results added to this export or directory of exports." )
+source.add_argument("--manifest", help="Import the exports listed in a JSON manifest of {\"path\", \"assessment\", \"campaign\"} entries." )
+source.add_argument("--export", help="Export the test cases of the campaign in vectr.env to this NDJSON (.ndjson, .jsonl) or CSV (.csv) file instead of importing." )
 parser.add_argument("--step", action="store_true", help="Prompt user for confirmation before importing each email result into VECTR." )
 parser.add_argument("--no-banner", action="store_true", help="Suppress printing of banner." )
 parser.add_argument("--debug", action="store_true", help="Prints debug information for each email." )
+parser.add_argument("--batch-size", type=int, default=100, help="Number of test cases sent per GraphQL mutation, 0 sends all in one request (default: 100)." )
+parser.add_argument("--async", dest="use_async", action="store_true", help="Run VECTR lookups, email processing and uploads concurrently on an asyncio pipeline." )
+parser.add_argument("--incremental", action="store_true", help="Skip emails that already have a test case in the target campaign." )
+parser.add_argument("--update", action="store_true", help="Experimental: update the outcome, tags, alert flag and notes of test cases already in the campaign where they changed, creating the rest. The update mutation is not yet verified against a VECTR server." )
+parser.add_argument("--resume", action="store_true", help=f"Resume an interrupted import of the same export, skipping emails already confirmed in {CHECKPOINT_FILE}." )
+parser.add_argument("--id-cache-ttl", type=int, default=DEFAULT_TTL, help=f"Seconds resolved VECTR organization, assessment and campaign IDs are cached for, 0 disables the cache (default: {DEFAULT_TTL})." )
+parser.add_argument("--refresh-ids", action="store_true", help="Discard cached VECTR IDs and look them up again." )
+parser.add_argument("--max-in-flight", type=int, default=4, help="Maximum number of concurrent upload requests (default: 4)." )
+parser.add_argument("--metrics", help="Write run metrics as JSON to this path, and as a Prometheus textfile next to it (.prom)." )
+parser.add_argument("--progress", action="store_true", help="Show a live progress line with rate and ETA instead of a line per email." )
+parser.add_argument("--adaptive-batches", action="store_true", help="Grow and shrink batches to what VECTR sustains, starting from --batch-size, and split failing batches to isolate bad test cases." )
+parser.add_argument("--max-batch-bytes", type=int, default=DEFAULT_MAX_BATCH_BYTES, help=f"Largest serialized size of an adaptive batch (default: {DEFAULT_MAX_BATCH_BYTES})." )
+parser.add_argument("--spool", help="Write the generated test cases to this gzip-compressed NDJSON spool instead of uploading them, for a later --replay." )
+parser.add_argument("--watch-interval", type=float, default=DEFAULT_WATCH_INTERVAL, help=f"Seconds between checks of a watched export or directory (default: {DEFAULT_WATCH_INTERVAL:g})." )
+parser.add_argument("--click-rows", type=int, help="List only the first CLICK_ROWS clicks of an email in its outcome notes and summarise the rest by source IP, user agent and method (default: list every click)." )
+parser.add_argument("--compress", action="store_true", help="Send large requests to VECTR gzip-compressed, if your VECTR deployment accepts them." )
+parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help=f"Test cases fetched per request when reading a campaign, for --export, --incremental and --update (default: {DEFAULT_PAGE_SIZE})." )
+parser.add_argument("--export-fields", default=",".join(DEFAULT_EXPORT_FIELDS), help=f"Comma separated test case fields written by --export, of id, name, description, outcome, outcomeNotes, alertTriggered and tags (default: {','.join(DEFAULT_EXPORT_FIELDS)})." )
+parser.add_argument("--workers", type=int, default=0, help="Transform and upload shards of the export on this many worker processes (default: 0, no workers)." )
 args = parser.parse_args()
 
 no_banner = args.no_banner
 step_import = args.step
 email_results_path = args.path
-debug = args.debug
+use_async = args.use_async
+incremental = args.incremental
+resume = args.resume
+id_cache_ttl = args.id_cache_ttl
+refresh_ids = args.refresh_ids
+metrics_path = args.metrics
+show_progress = args.progress
+worker_count = args.workers
+adaptive_batches = args.adaptive_batches
+spool_path = args.spool
+replay_path = args.replay
+watch_path = args.watch
+watch_interval = args.watch_interval
+update_existing = args.update
+compress_requests = args.compress
+click_rows = args.click_rows
+export_path = args.export
+export_fields = [field.strip() for field in args.export_fields.split(",") if field.strip()]
 
 if not no_banner:
     print_banner()
 
-if not os.path.exists(email_results_path):
-    print("[!] No delivr.to campaign results JSON found at specified path.")
+if use_async and step_import:
+    print("[!] --async cannot be combined with --step.")
     exit()
 
-results_json = []
-try:
-    with open(email_results_path, 'r') as data_file:
-        results_json = json.load(data_file)
-        if 'emails' in results_json:
-            results_json = results_json['emails']
-            print(f"[*] Handling API results export.")
-        else:
-            print(f"[*] Handling UI results export.")
-    print(f"[*] {len(results_json)} emails to be processed.")
-except Exception as e:
-    print("[!] Failed to process JSON from specified path, is it valid JSON?")
+if use_async and not email_results_path:
+    print("[!] --async only supports a single export given with --path.")
     exit()
 
-vectr_con = initialise_vectr_connection()
+if click_rows is not None and click_rows < 1:
+    print("[!] --click-rows must be at least 1.")
+    exit()
+
+if args.page_size < 1:
+    print("[!] --page-size must be at least 1.")
+    exit()
+
+if export_path and (step_import or use_async or worker_count > 0 or spool_path or incremental or update_existing or resume):
+    print("[!] --export only reads the campaign, so it cannot be combined with --step, --async, --workers, --spool, --incremental, --update or --resume.")
+    exit()
+
+if compress_requests and use_async:
+    print("[!] --compress cannot be combined with --async.")
+    exit()
 
-emails_uploaded = enumerate_email_tests(vectr_con, results_json, step_import, debug)
+if adaptive_batches and use_async:
+    print("[!] --adaptive-batches cannot be combined with --async.")
+    exit()
+
+if worker_count > 0 and (step_import or use_async or replay_path):
+    print("[!] --workers cannot be combined with --step, --async or --replay.")
+    exit()
+
+if watch_path and (step_import or worker_count > 0 or spool_path or resume):
+    print("[!] --watch cannot be combined with --step, --workers, --spool or --resume, it always resumes.")
+    exit()
+
+if update_existing and (step_import or use_async or worker_count > 0 or spool_path or replay_path or resume):
+    print("[!] --update cannot be combined with --step, --async, --workers, --spool, --replay or --resume.")
+    exit()
 
-count_of_email_results_processed = len(emails_uploaded)
-print(f"\n[+] Completed results import to VECTR.")
-print(f"[+] {count_of_email_results_processed} emails processed.")
\ No newline at end of file
+if step_import and replay_path:
+    print("[!] --step cannot be combined with --replay.")
+    exit()
+
+if spool_path and not email_results_path:
+    print("[!] --spool only supports a single export given with --path.")
+    exit()
+
+if spool_path and (step_import or use_async or worker_count > 0 or incremental or resume):
+    print("[!] --spool only transforms the export, so it cannot be combined with --step, --async, --workers, --incremental or --resume.")
+    exit()
+
+# Deferred until the arguments are valid, see the imports at the top
+from dotenv import dotenv_values
+from delivrto.export_reader import EmailResultsReader, open_export
+from delivrto.id_cache import VectrIdCache
+from delivrto.importer import Importer, ImportOptions, ImportResult
+from delivrto.metrics import ImportMetrics, ProgressLine
+from delivrto.spool import SpoolHeader, SpoolReader, SpoolWriter, SPOOL_WINDOW, iter_windows
+from delivrto.transform import get_mail_type
+from vectrapi.models import VectrGQLConnParams, TestCaseUploadReport
+
+# Stage timers and email counters of this run, written out with --metrics
+run_metrics = ImportMetrics()
+# Batching, skipping and transform options of every import in this run
+import_options = ImportOptions(
+    batch_size=args.batch_size,
+    max_in_flight=args.max_in_flight,
+    adaptive_batches=adaptive_batches,
+    max_batch_bytes=args.max_batch_bytes,
+    click_rows=click_rows,
+    incremental=incremental,
+    update_existing=update_existing,
+    page_size=args.page_size,
+    debug=args.debug
+)
+
+# Live progress line shown instead of per-email output with --progress
+progress = None
+# Worker processes transforming and uploading shards of the export with --workers
+worker_pool = None
+if worker_count > 0:
+    from delivrto.sharded_import import create_worker_pool
+    # Started before any VECTR connection exists, so none is copied into the workers
+    try:
+        worker_pool = create_worker_pool(worker_count)
+    except RuntimeError as e:
+        print(f"[!] {e}.")
+        exit()
+    run_metrics.mode = "workers"
+
+id_cache = open_id_cache(id_cache_ttl, refresh_ids)
+
+if args.manifest or args.dir:
+    from delivrto.batch_import import load_import_manifest, jobs_from_directory, resolve_import_jobs
+    run_metrics.mode = "batch"
+    if show_progress:
+        progress = ProgressLine()
+    importer = load_importer(import_options, run_metrics, progress, id_cache, worker_pool, worker_count, compress_requests)
+    if args.manifest:
+        jobs = load_import_manifest(args.manifest, importer.assessment_name, importer.campaign_name)
+    else:
+        jobs = jobs_from_directory(args.dir, importer.assessment_name)
+    print(f"[*] {len(jobs)} exports to be imported.")
+    import_batch(importer, jobs, step_import, resume, id_cache)
+elif spool_path:
+    run_metrics.mode = "spool"
+    data_file, email_results = open_email_results(email_results_path, run_metrics)
+    if show_progress:
+        progress = ProgressLine(data_file)
+    importer = load_importer(import_options, run_metrics, progress, offline=True)
+    spool_email_results(importer, email_results, email_results_path, spool_path)
+    data_file.close()
+elif watch_path:
+    from delivrto.watch import ExportWatcher
+    run_metrics.mode = "watch"
+    if show_progress:
+        progress = ProgressLine()
+    importer = initialise_importer(load_importer(import_options, run_metrics, progress, id_cache,
+                                                 compress_requests=compress_requests))
+    signal.signal(signal.SIGTERM, stop_watching)
+    watch_exports(importer, watch_path, watch_interval, metrics_path)
+elif export_path:
+    from delivrto.campaign_export import CampaignExportWriter
+    run_metrics.mode = "export"
+    importer = load_importer(import_options, run_metrics, id_cache=id_cache, compress_requests=compress_requests)
+    export_campaign(importer, export_path, export_fields)
+elif replay_path:
+    run_metrics.mode = "replay"
+    spool = open_spool(replay_path, run_metrics)
+    if show_progress:
+        progress = ProgressLine()
+    importer = initialise_importer(load_importer(import_options, run_metrics, progress, id_cache,
+                                                 compress_requests=compress_requests), spool.header)
+    replay_spool(importer, spool, replay_path, resume)
+    spool.close()
+elif use_async:
+    run_metrics.mode = "async"
+    data_file, email_results = open_email_results(email_results_path, run_metrics)
+    if show_progress:
+        progress = ProgressLine(data_file)
+    importer = load_importer(import_options, run_metrics, progress, id_cache)
+    # The campaign is resolved while the first emails are transformed
+    print("\n[*] Initialising VECTR API:")
+    import_result = importer.import_results_async(email_results, email_results_path, resume)
+    data_file.close()
+    print_upload_report(import_result.upload_report)
+    print_import_summary(import_result.emails_uploaded, import_result.emails_read, import_result.emails_resumed,
+                         import_result.emails_skipped, progress)
+else:
+    data_file, email_results = open_email_results(email_results_path, run_metrics)
+    if show_progress:
+        progress = ProgressLine(data_file)
+    importer = initialise_importer(load_importer(import_options, run_metrics, progress, id_cache, worker_pool, worker_count,
+                                                 compress_requests))
+    import_email_results(importer, email_results, email_results_path, step_import, resume)
+    data_file.close()
+id_cache.close()
+if worker_pool:
+    worker_pool.close()
+    worker_pool.join()
+
+if spool_path:
+    api_stats = None
+else:
+    api_stats = importer.stats
+if api_stats is not None:
+    print(f"[*] VECTR API: {api_stats.summary()}")
+if adaptive_batches and not worker_pool and importer.connection_params:
+    from vectrapi.vectr_api_client import get_connection
+    batch_sizer = get_connection(importer.connection_params).batch_sizer
+    if batch_sizer:
+        print(f"[*] Adaptive batch size settled at {batch_sizer.size} test cases")
+if metrics_path:
+    prometheus_path = run_metrics.write(metrics_path, api_stats)
+    print(f"[*] Run metrics written to {metrics_path} and {prometheus_path}")
+if not spool_path:
+    from vectrapi.vectr_api_client import close_connections
+    close_connections()
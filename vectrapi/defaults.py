@@ -0,0 +1,14 @@
+# Defaults of the VECTR API clients, kept free of imports so that the CLI can
+# show them in its help without loading pydantic, gql or requests
+
+# Seconds a request to VECTR may take before it is abandoned
+DEFAULT_REQUEST_TIMEOUT = 120.0
+
+# Largest serialized size of the test cases sent in one adaptive batch
+DEFAULT_MAX_BATCH_BYTES = 2 * 1024 * 1024
+
+# Largest number of test cases an adaptive batch can grow to
+DEFAULT_MAX_BATCH_SIZE = 1000
+
+# Test cases fetched per page when reading a campaign
+DEFAULT_PAGE_SIZE = 500
@@ -1,6 +1,8 @@
 # import re
-from typing import List, Optional, Dict
+from operator import attrgetter
+from typing import Any, List, Optional, Dict, Union
 from pydantic import BaseModel, Field, validator, root_validator
+from .defaults import DEFAULT_REQUEST_TIMEOUT
 
 """
 [
@@ -176,6 +178,62 @@ class TestCase(BaseModel):
         return float(v)
 
 
+class TestCaseRecord:
+    """
+    Test case data that is already normalised, for test cases the importer generates itself
+
+    Holds the same fields as TestCase, with the list fields as native lists, and skips
+    pydantic validation. dict(record) gives the same testCaseData input as dict(test_case)
+    for the equivalent TestCase. Anything from outside the importer should still go
+    through TestCase.
+    """
+    __slots__ = (
+        "name", "description", "phase", "technique", "tags", "organization", "status",
+        "targets", "sources", "defenses", "detectionSteps", "alertTriggered", "activityLogged",
+        "outcome", "outcomePath", "outcomeNotes", "alertSeverity", "detectionTime",
+        "detectingDefenseTools", "references", "redTools", "operatorGuidance",
+        "attackStart", "attackStop",
+    )
+
+    def __init__(self, name: str, technique: str, **fields):
+        unknown = fields.keys() - set(self.__slots__)
+        if unknown:
+            raise TypeError(f"Unknown TestCase fields: {', '.join(sorted(unknown))}")
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+        self.name = name
+        self.technique = technique
+
+    def __iter__(self):
+        return zip(self.__slots__, _record_values(self))
+
+    def __eq__(self, other):
+        if isinstance(other, (TestCaseRecord, TestCase)):
+            return dict(self) == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TestCaseRecord({', '.join(f'{k}={v!r}' for k, v in self)})"
+
+    def to_test_case(self) -> TestCase:
+        """Run the record through full TestCase validation"""
+        values = {}
+        for field in TestCase.__fields__.values():
+            value = getattr(self, field.name)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                value = ",".join(v["name"] if isinstance(v, dict) else v for v in value)
+            values[field.alias] = value
+        return TestCase(**values)
+
+
+_record_values = attrgetter(*TestCaseRecord.__slots__)
+
+# Either form can be sent as testCaseData
+TestCaseInput = Union[TestCase, TestCaseRecord]
+
+
 class Campaign(BaseModel):
     name: str
     test_cases: Optional[List[TestCase]]
@@ -184,3 +242,100 @@ class Campaign(BaseModel):
 class Assessment(BaseModel):
     name: str
     campaigns: Optional[Dict[str, Campaign]]
+
+
+class TestCaseUpdate(BaseModel):
+    """Changed testCaseData fields of an existing Test Case"""
+    testCaseId: str
+    testCaseData: Dict[str, Any]
+
+
+class VectrGQLConnParams(BaseModel):
+    api_key: str
+    vectr_gql_url: str
+    request_timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT
+    compress_requests: bool = False
+
+
+class VectrGQLStats(BaseModel):
+    request_count: int = 0
+    error_count: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    serialize_time: float = 0.0
+    status_counts: Dict[str, int] = {}
+
+    @property
+    def average_latency(self) -> float:
+        if not self.request_count:
+            return 0.0
+        return self.total_latency / self.request_count
+
+    def record_request(self, elapsed: float, failed: bool):
+        self.request_count += 1
+        self.total_latency += elapsed
+        self.max_latency = max(self.max_latency, elapsed)
+        if failed:
+            self.error_count += 1
+
+    def record_response(self, status: int, bytes_sent: int, bytes_received: int):
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+
+    def merge(self, other: "VectrGQLStats"):
+        """Adds the requests counted in other, e.g. by another process, to these stats"""
+        self.request_count += other.request_count
+        self.error_count += other.error_count
+        self.total_latency += other.total_latency
+        self.max_latency = max(self.max_latency, other.max_latency)
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+        self.serialize_time += other.serialize_time
+        for status, count in other.status_counts.items():
+            self.status_counts[status] = self.status_counts.get(status, 0) + count
+
+    def summary(self) -> str:
+        return (f"{self.request_count} requests, {self.error_count} errors, "
+                f"avg {self.average_latency * 1000:.1f}ms, max {self.max_latency * 1000:.1f}ms, "
+                f"{self.bytes_sent / 1024:.1f} KiB sent")
+
+
+class TestCaseBatchResult(BaseModel):
+    index: int
+    start: int
+    size: int
+    attempts: int = 0
+    created: List[Dict[str, str]] = []
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    @property
+    def retried(self) -> bool:
+        return self.attempts > 1
+
+
+class TestCaseUploadReport(BaseModel):
+    batches: List[TestCaseBatchResult] = []
+    splits: int = 0
+
+    @property
+    def created_ids(self) -> List[str]:
+        return [test_case["id"] for batch in self.batches for test_case in batch.created]
+
+    @property
+    def failed_batches(self) -> List[TestCaseBatchResult]:
+        return [batch for batch in self.batches if not batch.succeeded]
+
+    @property
+    def retried_batches(self) -> List[TestCaseBatchResult]:
+        return [batch for batch in self.batches if batch.retried]
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.failed_batches
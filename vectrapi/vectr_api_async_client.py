@@ -0,0 +1,222 @@
+import time
+from aiohttp import TraceConfig
+from gql import Client
+from gql.client import AsyncClientSession
+from gql.transport.aiohttp import AIOHTTPTransport
+from graphql import DocumentNode
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+from .defaults import DEFAULT_PAGE_SIZE
+from .models import Campaign, TestCaseInput
+from .vectr_api_client import VectrGQLConnParams, VectrGQLStats, \
+    TestCaseBatchResult, \
+    CREATE_ASSESSMENT_MUTATION, \
+    CREATE_CAMPAIGN_MUTATION, \
+    CREATE_TEST_CASE_MUTATION, \
+    ORGANIZATION_BY_NAME_QUERY, \
+    ASSESSMENT_BY_NAME_QUERY, \
+    CAMPAIGN_BY_NAME_QUERY, \
+    INDEX_FIELDS, \
+    _create_assessment_vars, \
+    _create_campaign_vars, \
+    _create_test_case_vars, \
+    _parse_created_assessments, \
+    _parse_created_campaigns, \
+    _parse_created_test_cases, \
+    _parse_campaign_id, \
+    _parse_first_node_id, \
+    _test_case_fields, \
+    _test_case_page_query
+
+
+class AsyncVectrGQLConnection:
+    """An asyncio connection to a VECTR GraphQL endpoint
+
+    Async counterpart of VectrGQLConnection, backed by one aiohttp session so that
+    any number of queries and mutations can be awaited concurrently on a single event loop.
+
+    Parameters
+    ----------
+    connection_params : VectrGQLConnParams
+        Connection parameters for the target VECTR instance including api key and url
+    timeout : Optional[float]
+        Request timeout in seconds, connection_params.request_timeout by default
+    """
+
+    def __init__(self, connection_params: VectrGQLConnParams, timeout: Optional[float] = None):
+        self.connection_params = connection_params
+        if timeout is None:
+            timeout = connection_params.request_timeout
+        self.stats = VectrGQLStats()
+        trace_config = TraceConfig()
+        trace_config.on_request_chunk_sent.append(self._on_chunk_sent)
+        trace_config.on_response_chunk_received.append(self._on_chunk_received)
+        trace_config.on_request_end.append(self._on_request_end)
+        transport = AIOHTTPTransport(
+            url=connection_params.vectr_gql_url, ssl=False, timeout=timeout,
+            headers={"Authorization": "VEC1 " + connection_params.api_key},
+            client_session_args={"trace_configs": [trace_config]}
+        )
+        self._client = Client(transport=transport, fetch_schema_from_transport=False)
+        self._session: Optional[AsyncClientSession] = None
+
+    async def _on_chunk_sent(self, session, context, params):
+        self.stats.bytes_sent += len(params.chunk)
+
+    async def _on_chunk_received(self, session, context, params):
+        self.stats.bytes_received += len(params.chunk)
+
+    async def _on_request_end(self, session, context, params):
+        self.stats.record_response(params.response.status, 0, 0)
+
+    def serialize_test_cases(self, db: str, campaign_id: str, test_cases: List[TestCaseInput]) -> Dict[str, Any]:
+        """Builds the createWithTemplateMatchByName input for test_cases, timing it in stats"""
+        start = time.perf_counter()
+        test_case_vars = _create_test_case_vars(db, campaign_id, test_cases)
+        self.stats.serialize_time += time.perf_counter() - start
+        return test_case_vars
+
+    async def connect(self):
+        if self._session is None:
+            self._session = await self._client.connect_async()
+
+    async def execute(self, document: DocumentNode, variable_values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        await self.connect()
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await self._session.execute(document, variable_values=variable_values)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.stats.record_request(time.perf_counter() - start, failed)
+
+    async def close(self):
+        if self._session is not None:
+            await self._client.close_async()
+            self._session = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+async def create_assessment(connection: AsyncVectrGQLConnection,
+                            db: str,
+                            org_id: str,
+                            assessment_name: str) -> Dict[str, dict]:
+    """Async variant of vectr_api_client.create_assessment"""
+    result = await connection.execute(CREATE_ASSESSMENT_MUTATION,
+                                      variable_values=_create_assessment_vars(db, org_id, assessment_name))
+    return _parse_created_assessments(result)
+
+
+async def create_campaigns(connection: AsyncVectrGQLConnection,
+                           db: str,
+                           org_id: str,
+                           campaigns: Dict[str, Campaign],
+                           parent_assessment_id: str) -> Dict[str, dict]:
+    """Async variant of vectr_api_client.create_campaigns"""
+    result = await connection.execute(CREATE_CAMPAIGN_MUTATION,
+                                      variable_values=_create_campaign_vars(db, org_id, campaigns, parent_assessment_id))
+    return _parse_created_campaigns(result)
+
+
+async def create_test_case_batch(connection: AsyncVectrGQLConnection,
+                                 db: str,
+                                 campaign_id: str,
+                                 test_cases: List[TestCaseInput],
+                                 batch: TestCaseBatchResult,
+                                 batch_retries: int = 1) -> TestCaseBatchResult:
+    """Sends one batch of Test Cases, retrying it up to batch_retries times
+
+        Parameters
+        ----------
+        connection : AsyncVectrGQLConnection
+            Open connection to the target VECTR instance
+        db : str
+            The database target where the Test Cases will be created
+        campaign_id : str
+            The Campaign ID to which the Test Cases will belong
+        test_cases: List[TestCaseInput]
+            The TestCases of this batch
+        batch : TestCaseBatchResult
+            The batch being sent, updated in place with attempts, created Test Cases and errors
+        batch_retries : int
+            Number of times a failed batch is re-sent before it is reported as failed
+
+        Returns
+        -------
+        TestCaseBatchResult
+            The updated batch
+        """
+    test_case_vars = connection.serialize_test_cases(db, campaign_id, test_cases)
+    while batch.attempts <= batch_retries:
+        batch.attempts += 1
+        try:
+            result = await connection.execute(CREATE_TEST_CASE_MUTATION, variable_values=test_case_vars)
+            batch.created = _parse_created_test_cases(result)
+            batch.error = None
+            break
+        except Exception as e:
+            batch.error = str(e) or type(e).__name__
+    return batch
+
+
+async def get_org_id_for_campaign_and_assessment_data(connection: AsyncVectrGQLConnection, org_name: str) -> str:
+    result = await connection.execute(ORGANIZATION_BY_NAME_QUERY, variable_values={"nameVar": org_name})
+    return _parse_first_node_id(result, "organizations", "org")
+
+
+async def get_assessment_by_name(connection: AsyncVectrGQLConnection, db_name: str, assessment_name: str) -> str:
+    result = await connection.execute(ASSESSMENT_BY_NAME_QUERY,
+                                      variable_values={"nameVar": assessment_name, "db": db_name})
+    return _parse_first_node_id(result, "assessments", "assessment")
+
+
+async def get_campaign_by_name(connection: AsyncVectrGQLConnection,
+                               db_name: str,
+                               campaign_name: str,
+                               assessment_name: Optional[str] = None) -> str:
+    """ID of the campaign named campaign_name, of the assessment named assessment_name if given"""
+    result = await connection.execute(CAMPAIGN_BY_NAME_QUERY,
+                                      variable_values={"nameVar": campaign_name, "db": db_name})
+    return _parse_campaign_id(result, assessment_name)
+
+
+async def iter_campaign_test_case_pages(connection: AsyncVectrGQLConnection,
+                                        db_name: str,
+                                        campaign_id: str,
+                                        page_size: int = DEFAULT_PAGE_SIZE,
+                                        fields: Iterable[str] = INDEX_FIELDS) -> AsyncIterator[List[dict]]:
+    """Pages of the test cases of a campaign, async counterpart of vectr_api_client.iter_campaign_test_case_pages"""
+    query = _test_case_page_query(_test_case_fields(fields))
+
+    cursor = None
+    while True:
+        result = await connection.execute(query, variable_values={
+            "db": db_name,
+            "campaignId": campaign_id,
+            "first": page_size,
+            "after": cursor
+        })
+        page = result.get("testcases")
+        if page is None:
+            raise RuntimeError("couldn't read the campaign's test cases")
+        yield page["nodes"]
+        if not page["pageInfo"]["hasNextPage"]:
+            return
+        cursor = page["pageInfo"]["endCursor"]
+
+
+async def get_testcases_for_campaign_by_id(connection: AsyncVectrGQLConnection,
+                                           db_name: str,
+                                           campaign_id: str,
+                                           page_size: int = DEFAULT_PAGE_SIZE) -> List[dict]:
+    test_cases = []
+    async for page in iter_campaign_test_case_pages(connection, db_name, campaign_id, page_size):
+        test_cases.extend(page)
+    return test_cases
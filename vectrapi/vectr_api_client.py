@@ -1,33 +1,391 @@
+import gzip
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
 from gql import Client, gql
+from gql.client import SyncClientSession
+from gql.transport.exceptions import TransportServerError
 from gql.transport.requests import RequestsHTTPTransport
-from pydantic import BaseModel
-from typing import Dict
-from .models import Campaign, TestCase
+from graphql import DocumentNode
+from requests.adapters import HTTPAdapter, Retry
+from requests.exceptions import RetryError, Timeout
+from urllib3.util.request import ACCEPT_ENCODING
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from .defaults import DEFAULT_MAX_BATCH_BYTES, DEFAULT_MAX_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from .models import Campaign, TestCaseInput, TestCaseUpdate, \
+    VectrGQLConnParams, VectrGQLStats, TestCaseBatchResult, TestCaseUploadReport
 
 # REMOVE ME
 import urllib3
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# HTTP statuses meaning VECTR is overloaded or the request was too large
+OVERLOAD_STATUSES = {408, 413, 429}
 
-class VectrGQLConnParams(BaseModel):
-    api_key: str
-    vectr_gql_url: str
+# Smallest request body worth gzip-compressing, lookups and small batches are sent as is
+COMPRESS_MIN_BYTES = 1024
 
+# gzip level of compressed request bodies, higher levels cost far more CPU for little gain on JSON
+COMPRESS_LEVEL = 5
 
-class TestCaseGQLInput(BaseModel):
-    testCaseData: TestCase
+
+CREATE_ASSESSMENT_MUTATION = gql(
+    """
+    mutation ($input: CreateAssessmentInput!) {
+      assessment {
+        create(input: $input) {
+          assessments {
+            id, name, description, createTime
+          }
+        }
+      }
+    }
+    """
+)
+
+CREATE_CAMPAIGN_MUTATION = gql(
+    """
+    mutation ($input: CreateCampaignInput!) {
+      campaign {
+        create(input: $input) {
+          campaigns {
+            id, name, createTime
+          }
+        }
+      }
+    }
+    """
+)
+
+CREATE_TEST_CASE_MUTATION = gql(
+    """
+    mutation ($input: CreateTestCaseAndTemplateMatchByNameInput!) {
+      testCase {
+        createWithTemplateMatchByName(input: $input) {
+          testCases {
+            id, name
+          }
+        }
+      }
+    }
+    """
+)
+
+ORGANIZATION_BY_NAME_QUERY = gql(
+    """
+    query($nameVar: String) {
+      organizations(filter: {name: {eq:  $nameVar}}) {
+        nodes {
+          id, name
+        }
+      }
+    }
+    """
+)
+
+ASSESSMENT_BY_NAME_QUERY = gql(
+    """
+    query ($db: String!, $nameVar: String){
+      assessments(db:$db, filter: {name: {eq:  $nameVar}}) {
+        nodes {
+          id, name
+        }
+      }
+    }
+    """
+)
+
+CAMPAIGN_BY_NAME_QUERY = gql(
+    """
+    query ($db: String!, $nameVar: String){
+      campaigns(db:$db, filter: {name: {eq:  $nameVar}}) {
+        nodes {
+          id, name, assessment { name }
+        }
+      }
+    }
+    """
+)
+
+# GraphQL selection of every test case field the paginated test case reader can fetch
+TEST_CASE_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "description": "description",
+    "outcome": "outcome { name }",
+    "outcomeNotes": "outcomeNotes",
+    "alertTriggered": "alertTriggered",
+    "tags": "tags { name }",
+}
+
+# Fields CampaignTestCaseIndex needs, and with results what test_case_update compares
+INDEX_FIELDS = ("id", "name", "description")
+RESULT_FIELDS = INDEX_FIELDS + ("outcome", "outcomeNotes", "alertTriggered", "tags")
+
+# Experimental: modelled on CREATE_TEST_CASE_MUTATION, not yet verified against VECTR's schema
+UPDATE_TEST_CASE_MUTATION = gql(
+    """
+    mutation ($input: UpdateTestCaseInput!) {
+      testCase {
+        update(input: $input) {
+          testCases {
+            id, name
+          }
+        }
+      }
+    }
+    """
+)
+
+
+class AdaptiveBatchSizer:
+    """Adapts the number of Test Cases sent per mutation to what VECTR can sustain
+
+    The size limit grows additively after every full batch that succeeds and is
+    cut multiplicatively after a timeout or overload response (AIMD), at most once
+    per round of batches sent at the same size. Independently of the count, a batch
+    never holds more than max_bytes of serialized Test Cases, unless a single Test
+    Case is larger by itself. Safe to share between threads.
+
+    Parameters
+    ----------
+    initial_size : int
+        Number of Test Cases per batch to start from
+    min_size : int
+        Smallest size the limit is cut to
+    max_size : int
+        Largest size the limit grows to
+    max_bytes : int
+        Largest serialized size of the Test Cases in one batch
+    increase : Optional[int]
+        Test Cases added to the limit after a full batch succeeded, a tenth of initial_size by default
+    decrease : float
+        Factor the limit is multiplied by after an overload
+    """
+
+    def __init__(self,
+                 initial_size: int = 100,
+                 min_size: int = 1,
+                 max_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+                 increase: Optional[int] = None,
+                 decrease: float = 0.5):
+        self.min_size = max(min_size, 1)
+        self.max_size = max(max_size, self.min_size)
+        self.size = min(max(initial_size or self.max_size, self.min_size), self.max_size)
+        self.max_bytes = max_bytes
+        self.increase = increase or max(self.size // 10, 1)
+        self.decrease = decrease
+        self.overloads = 0
+        self._lock = threading.Lock()
+
+    def succeeded(self, batch_size: int):
+        with self._lock:
+            # Only a batch that filled the limit shows that the limit can grow
+            if batch_size >= self.size:
+                self.size = min(self.size + self.increase, self.max_size)
+
+    def overloaded(self, overloads_seen: int):
+        """Cuts the limit, unless it was already cut after the batch was sent (overloads_seen then is behind)"""
+        with self._lock:
+            if overloads_seen == self.overloads:
+                self.size = max(int(self.size * self.decrease), self.min_size)
+                self.overloads += 1
+
+
+def is_overload_error(error: Exception) -> bool:
+    """Whether a failed request means VECTR timed out, is overloaded or refused a too large request"""
+    if isinstance(error, (Timeout, RetryError)):
+        # The pooled adapter raises RetryError once 5xx responses used up its own retries
+        return True
+    if isinstance(error, TransportServerError):
+        return error.code is not None and (error.code >= 500 or error.code in OVERLOAD_STATUSES)
+    return False
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Seconds to wait before retry number attempt, exponential with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class _CompressingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter sending request bodies of at least COMPRESS_MIN_BYTES gzip-encoded"""
+
+    def send(self, request, *args, **kwargs):
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if body and len(body) >= COMPRESS_MIN_BYTES and "Content-Encoding" not in request.headers:
+            request.body = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+            request.headers["Content-Encoding"] = "gzip"
+            request.headers["Content-Length"] = str(len(request.body))
+        return super().send(request, *args, **kwargs)
+
+
+class VectrGQLConnection:
+    """A long-lived connection to a VECTR GraphQL endpoint
+
+    Owns a single connected gql session backed by one pooled requests.Session, so
+    every API call reuses kept-alive (and already TLS-negotiated) connections
+    rather than building a new transport per call. Safe to share between threads.
+    Compressed responses are always accepted, request bodies are only compressed
+    when connection_params.compress_requests is set, as not every VECTR deployment
+    accepts them.
+
+    Parameters
+    ----------
+    connection_params : VectrGQLConnParams
+        Connection parameters for the target VECTR instance including api key and url
+    pool_size : int
+        Maximum number of pooled HTTP connections kept open to the VECTR host
+    """
+
+    def __init__(self, connection_params: VectrGQLConnParams, pool_size: int = 10):
+        self.connection_params = connection_params
+        self.pool_size = pool_size
+        self.stats = VectrGQLStats()
+        self._stats_lock = threading.Lock()
+        self._client = get_client(connection_params)
+        self._session: Optional[SyncClientSession] = None
+        self._connect_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_workers = 0
+        self.batch_sizer: Optional[AdaptiveBatchSizer] = None
+
+    @property
+    def session(self) -> SyncClientSession:
+        if self._session is None:
+            with self._connect_lock:
+                if self._session is None:
+                    session = self._client.connect_sync()
+                    self._mount_adapter()
+                    self._client.transport.session.hooks["response"].append(self._record_response)
+                    self._session = session
+        return self._session
+
+    def _mount_adapter(self):
+        transport = self._client.transport
+        adapter_class = _CompressingHTTPAdapter if self.connection_params.compress_requests else HTTPAdapter
+        adapter = adapter_class(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(
+                total=transport.retries,
+                backoff_factor=0.1,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=None,
+            )
+        )
+        for prefix in "http://", "https://":
+            transport.session.mount(prefix, adapter)
+
+    def _record_response(self, response, *args, **kwargs):
+        body = response.request.body or b""
+        content = response.content
+        # Bytes read off the wire, fewer than len(content) for a compressed response
+        received = response.raw.tell() if hasattr(response.raw, "tell") else len(content)
+        with self._stats_lock:
+            self.stats.record_response(response.status_code, len(body), received)
+
+    def serialize_test_cases(self, db: str, campaign_id: str, test_cases: List[TestCaseInput]) -> Dict[str, Any]:
+        """Builds the createWithTemplateMatchByName input for test_cases, timing it in stats"""
+        start = time.perf_counter()
+        test_case_vars = _create_test_case_vars(db, campaign_id, test_cases)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats.serialize_time += elapsed
+        return test_case_vars
+
+    def ensure_pool_size(self, pool_size: int):
+        """Grows the HTTP connection pool so that pool_size requests can be in flight at once"""
+        with self._connect_lock:
+            if pool_size <= self.pool_size:
+                return
+            self.pool_size = pool_size
+            if self._session is not None:
+                self._mount_adapter()
+
+    def upload_executor(self, max_workers: int) -> ThreadPoolExecutor:
+        """Thread pool shared by every batched upload made over this connection"""
+        self.ensure_pool_size(max_workers)
+        with self._connect_lock:
+            if self._executor is None or self._executor_workers < max_workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vectr-upload")
+                self._executor_workers = max_workers
+            return self._executor
+
+    def adaptive_batch_sizer(self, initial_size: int, max_bytes: int = DEFAULT_MAX_BATCH_BYTES) -> "AdaptiveBatchSizer":
+        """Batch sizer shared by every adaptive upload made over this connection, created on first use"""
+        with self._connect_lock:
+            if self.batch_sizer is None:
+                self.batch_sizer = AdaptiveBatchSizer(initial_size, max_bytes=max_bytes)
+            return self.batch_sizer
+
+    def execute(self, document: DocumentNode, variable_values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        session = self.session
+        start = time.perf_counter()
+        failed = False
+        try:
+            return session.execute(document, variable_values=variable_values)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.stats.record_request(elapsed, failed)
+
+    def close(self):
+        with self._connect_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._session is not None:
+                self._client.close_sync()
+                self._session = None
+
+
+_connections: Dict[Tuple[str, str], VectrGQLConnection] = {}
+_connections_lock = threading.Lock()
 
 
 def get_client(connection_params: VectrGQLConnParams):
     transport = RequestsHTTPTransport(
         url=connection_params.vectr_gql_url, verify=False, retries=1,
-        headers={"Authorization": "VEC1 " + connection_params.api_key}
+        timeout=connection_params.request_timeout,
+        # Every response encoding urllib3 can decode here, including br and zstd when installed
+        headers={"Authorization": "VEC1 " + connection_params.api_key, "Accept-Encoding": ACCEPT_ENCODING}
     )
 
     return Client(transport=transport, fetch_schema_from_transport=False)
 
 
+def get_connection(connection_params: VectrGQLConnParams) -> VectrGQLConnection:
+    """Returns the shared VectrGQLConnection for a VECTR url and api key, creating it on first use"""
+    key = (connection_params.vectr_gql_url, connection_params.api_key)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            connection = VectrGQLConnection(connection_params)
+            _connections[key] = connection
+    return connection
+
+
+def close_connections():
+    """Closes every shared VectrGQLConnection"""
+    with _connections_lock:
+        for connection in _connections.values():
+            connection.close()
+        _connections.clear()
+
+
 def create_assessment(connection_params: VectrGQLConnParams,
                       db: str,
                       org_id: str,
@@ -51,22 +409,16 @@ def create_assessment(connection_params: VectrGQLConnParams,
     Dict[str, dict]
         An Assessment name-keyed dict of objects with the id and name of a created Assessment
     """
-    client = get_client(connection_params)
-    assessment_mutation = gql(
-        """
-        mutation ($input: CreateAssessmentInput!) {
-          assessment {
-            create(input: $input) {
-              assessments {
-                id, name, description, createTime
-              }
-            }
-          }
-        }
-        """
-    )
+    connection = get_connection(connection_params)
+
+    result = connection.execute(CREATE_ASSESSMENT_MUTATION,
+                                variable_values=_create_assessment_vars(db, org_id, assessment_name))
 
-    assessment_vars = {
+    return _parse_created_assessments(result)
+
+
+def _create_assessment_vars(db: str, org_id: str, assessment_name: str) -> Dict[str, Any]:
+    return {
         "input": {
             "db": db,
             "assessmentData": [
@@ -78,9 +430,10 @@ def create_assessment(connection_params: VectrGQLConnParams,
         }
     }
 
+
+def _parse_created_assessments(result: Dict[str, Any]) -> Dict[str, dict]:
     assessments = {}
 
-    result = client.execute(assessment_mutation, variable_values=assessment_vars)
     if "assessment" in result.keys():
         assessment_type_res = result["assessment"]
         if "create" in assessment_type_res:
@@ -120,21 +473,18 @@ def create_campaigns(connection_params: VectrGQLConnParams,
         Dict[str, dict]
             A Campaign name-keyed dict of objects with the id and name of created Campaigns
         """
-    client = get_client(connection_params)
-    campaign_mutation = gql(
-        """
-        mutation ($input: CreateCampaignInput!) {
-          campaign {
-            create(input: $input) {
-              campaigns {
-                id, name, createTime
-              }
-            }
-          }
-        }
-        """
-    )
+    connection = get_connection(connection_params)
+
+    result = connection.execute(CREATE_CAMPAIGN_MUTATION,
+                                variable_values=_create_campaign_vars(db, org_id, campaigns, parent_assessment_id))
+
+    return _parse_created_campaigns(result)
+
 
+def _create_campaign_vars(db: str,
+                          org_id: str,
+                          campaigns: Dict[str, Campaign],
+                          parent_assessment_id: str) -> Dict[str, Any]:
     campaign_data = []
     for campaign_name in campaigns.keys():
         campaign_data.append({
@@ -142,7 +492,7 @@ def create_campaigns(connection_params: VectrGQLConnParams,
             "organizationIds": [org_id]
         })
 
-    campaign_vars = {
+    return {
         "input": {
             "db": db,
             "assessmentId": parent_assessment_id,
@@ -150,9 +500,9 @@ def create_campaigns(connection_params: VectrGQLConnParams,
         }
     }
 
-    campaigns = {}
 
-    result = client.execute(campaign_mutation, variable_values=campaign_vars)
+def _parse_created_campaigns(result: Dict[str, Any]) -> Dict[str, dict]:
+    campaigns = {}
 
     if "campaign" in result.keys():
         campaign_type_res = result["campaign"]
@@ -170,7 +520,7 @@ def create_campaigns(connection_params: VectrGQLConnParams,
 def create_test_cases(connection_params: VectrGQLConnParams,
                       db: str,
                       campaign_id: str,
-                      test_cases: Dict[str, TestCase]) -> Dict[str, dict]:
+                      test_cases: Dict[str, TestCaseInput]) -> Dict[str, dict]:
     """Creates VECTR Test Cases in the target Campaign and Database
 
         Parameters
@@ -182,7 +532,7 @@ def create_test_cases(connection_params: VectrGQLConnParams,
             This only includes selectable databases, template operations are separate
         campaign_id : str
             The Campaign ID to which the Test Cases will belong
-        test_cases: Dict[str, TestCase]
+        test_cases: Dict[str, TestCaseInput]
             TestCases to be created
 
         Returns
@@ -190,28 +540,27 @@ def create_test_cases(connection_params: VectrGQLConnParams,
         Dict[str, dict]
             A Test Case name-keyed dict of objects with the id and name of created Test Cases
         """
-    client = get_client(connection_params)
-    test_case_mutation = gql(
-        """
-        mutation ($input: CreateTestCaseAndTemplateMatchByNameInput!) {
-          testCase {
-            createWithTemplateMatchByName(input: $input) {
-              testCases {
-                id, name
-              }
-            }
-          }
-        }
-        """
-    )
+    connection = get_connection(connection_params)
+
+    result = connection.execute(CREATE_TEST_CASE_MUTATION,
+                                variable_values=connection.serialize_test_cases(db, campaign_id, test_cases))
+
+    test_cases = {}
 
+    for test_case in _parse_created_test_cases(result):
+        test_cases[test_case["name"]] = test_case
+
+    return test_cases
+
+
+def _create_test_case_vars(db: str, campaign_id: str, test_cases: List[TestCaseInput]) -> Dict[str, Any]:
     test_case_data = []
     for test_case in test_cases:
         test_case_data.append({
             "testCaseData": dict(test_case)
         })
 
-    test_case_vars = {
+    return {
         "input": {
             "db": db,
             "campaignId": campaign_id,
@@ -219,125 +568,502 @@ def create_test_cases(connection_params: VectrGQLConnParams,
         }
     }
 
-    test_cases = {}
-
-    result = client.execute(test_case_mutation, variable_values=test_case_vars)
 
+def _parse_created_test_cases(result: Dict[str, Any]) -> List[Dict[str, str]]:
+    created = []
     if "testCase" in result.keys():
         test_case_type_res = result["testCase"]
-        if "create" in test_case_type_res:
-            create_res = test_case_type_res["create"]
+        if "createWithTemplateMatchByName" in test_case_type_res:
+            create_res = test_case_type_res["createWithTemplateMatchByName"]
             if "testCases" in create_res:
-                test_cases_created = create_res["testCases"]
+                for test_case in create_res["testCases"]:
+                    created.append({"id": test_case["id"], "name": test_case["name"]})
 
-                for test_case in test_cases_created:
-                    test_cases[test_case["name"]] = {"id": test_case["id"], "name": test_case["name"]}
+    return created
 
-    return test_cases
 
+def create_test_cases_batched(connection_params: VectrGQLConnParams,
+                              db: str,
+                              campaign_id: str,
+                              test_cases: List[TestCaseInput],
+                              batch_size: int = 100,
+                              max_in_flight: int = 4,
+                              batch_retries: int = 1,
+                              on_batch_sent: Optional[Callable[[TestCaseBatchResult], None]] = None,
+                              on_batch_done: Optional[Callable[[TestCaseBatchResult], None]] = None) -> TestCaseUploadReport:
+    """Creates VECTR Test Cases in the target Campaign and Database in concurrent batches
 
-def get_org_id_for_campaign_and_assessment_data(connection_params: VectrGQLConnParams, org_name: str) -> str:
-    client = get_client(connection_params)
+        Parameters
+        ----------
+        connection_params : VectrGQLConnParams
+            Connection parameters for the target VECTR instance including api key and url
+        db : str
+            The database target where the Test Cases will be created
+        campaign_id : str
+            The Campaign ID to which the Test Cases will belong
+        test_cases: List[TestCaseInput]
+            TestCases to be created
+        batch_size : int
+            Maximum number of Test Cases sent in one mutation, 0 sends everything in one batch
+        max_in_flight : int
+            Maximum number of batch mutations in flight at the same time
+        batch_retries : int
+            Number of times a failed batch is re-sent before it is reported as failed
+        on_batch_sent : Optional[Callable[[TestCaseBatchResult], None]]
+            Called from the upload thread right before a batch is first sent
+        on_batch_done : Optional[Callable[[TestCaseBatchResult], None]]
+            Called from the upload thread once a batch succeeded or ran out of retries
 
-    org_query = gql(
+        Returns
+        -------
+        TestCaseUploadReport
+            Per-batch results, where each batch records the offset of its Test Cases in test_cases
         """
-        query($nameVar: String) {
-          organizations(filter: {name: {eq:  $nameVar}}) {
-            nodes {
-              id, name
-            }
-          }
+    connection = get_connection(connection_params)
+
+    def build_vars(batch: TestCaseBatchResult) -> Dict[str, Any]:
+        return connection.serialize_test_cases(db, campaign_id, test_cases[batch.start:batch.start + batch.size])
+
+    return _send_batched(connection, CREATE_TEST_CASE_MUTATION, build_vars, _parse_created_test_cases, len(test_cases),
+                         batch_size, max_in_flight, batch_retries, on_batch_sent, on_batch_done)
+
+
+def update_test_cases_batched(connection_params: VectrGQLConnParams,
+                              db: str,
+                              updates: List[TestCaseUpdate],
+                              batch_size: int = 100,
+                              max_in_flight: int = 4,
+                              batch_retries: int = 1) -> TestCaseUploadReport:
+    """Updates fields of existing VECTR Test Cases in concurrent batches
+
+        Parameters
+        ----------
+        connection_params : VectrGQLConnParams
+            Connection parameters for the target VECTR instance including api key and url
+        db : str
+            The database holding the Test Cases
+        updates: List[TestCaseUpdate]
+            The ID of each Test Case to update and the testCaseData fields to set on it
+        batch_size : int
+            Maximum number of Test Cases updated in one mutation, 0 sends everything in one batch
+        max_in_flight : int
+            Maximum number of batch mutations in flight at the same time
+        batch_retries : int
+            Number of times a failed batch is re-sent before it is reported as failed
+
+        Returns
+        -------
+        TestCaseUploadReport
+            Per-batch results, where each batch records the offset of its updates in updates
+            and created holds the updated Test Cases
+        """
+    connection = get_connection(connection_params)
+
+    def build_vars(batch: TestCaseBatchResult) -> Dict[str, Any]:
+        return _update_test_case_vars(db, updates[batch.start:batch.start + batch.size])
+
+    return _send_batched(connection, UPDATE_TEST_CASE_MUTATION, build_vars, _parse_updated_test_cases, len(updates),
+                         batch_size, max_in_flight, batch_retries)
+
+
+def _update_test_case_vars(db: str, updates: List[TestCaseUpdate]) -> Dict[str, Any]:
+    return {
+        "input": {
+            "db": db,
+            "testCaseUpdates": [update.dict() for update in updates]
         }
-    """
-    )
+    }
 
-    org_vars = {"nameVar": org_name}
 
-    result = client.execute(org_query, variable_values=org_vars)
+def _parse_updated_test_cases(result: Dict[str, Any]) -> List[Dict[str, str]]:
+    updated = []
+    if "testCase" in result.keys():
+        test_case_type_res = result["testCase"]
+        if "update" in test_case_type_res:
+            update_res = test_case_type_res["update"]
+            if "testCases" in update_res:
+                for test_case in update_res["testCases"]:
+                    updated.append({"id": test_case["id"], "name": test_case["name"]})
 
-    if "organizations" in result.keys():
-        organizations_type_res = result["organizations"]
-        if "nodes" in organizations_type_res:
-            nodes_res = organizations_type_res["nodes"]
-            if nodes_res:
-                return nodes_res[0]["id"]
+    return updated
 
-    raise RuntimeError("couldn't find org name. create in VECTR first")
 
+def _send_batched(connection: VectrGQLConnection,
+                  document: DocumentNode,
+                  build_vars: Callable[[TestCaseBatchResult], Dict[str, Any]],
+                  parse_result: Callable[[Dict[str, Any]], List[Dict[str, str]]],
+                  count: int,
+                  batch_size: int,
+                  max_in_flight: int,
+                  batch_retries: int,
+                  on_batch_sent: Optional[Callable[[TestCaseBatchResult], None]] = None,
+                  on_batch_done: Optional[Callable[[TestCaseBatchResult], None]] = None) -> TestCaseUploadReport:
+    """Sends count items in fixed-size batches of document, each built by build_vars, on the upload pool"""
+    if batch_size <= 0:
+        batch_size = max(count, 1)
+    max_in_flight = max(max_in_flight, 1)
+    executor = connection.upload_executor(max_in_flight)
+    # The shared pool may be larger than this upload's own in-flight limit
+    in_flight = threading.BoundedSemaphore(max_in_flight)
 
-def get_assessment_by_name(connection_params: VectrGQLConnParams, db_name: str, assessment_name: str) -> str:
-    client = get_client(connection_params)
+    def upload_batch(batch: TestCaseBatchResult) -> TestCaseBatchResult:
+        batch_vars = build_vars(batch)
+        with in_flight:
+            if on_batch_sent:
+                on_batch_sent(batch)
+            while batch.attempts <= batch_retries:
+                batch.attempts += 1
+                try:
+                    result = connection.execute(document, variable_values=batch_vars)
+                    batch.created = parse_result(result)
+                    batch.error = None
+                    break
+                except Exception as e:
+                    batch.error = str(e) or type(e).__name__
+        if on_batch_done:
+            on_batch_done(batch)
+        return batch
+
+    batches = [
+        TestCaseBatchResult(index=index, start=start, size=min(batch_size, count - start))
+        for index, start in enumerate(range(0, count, batch_size))
+    ]
+
+    return TestCaseUploadReport(batches=list(executor.map(upload_batch, batches)))
+
+
+class _SplitBatch:
+    """The two halves of a failed batch, split further once both have been sent"""
+
+    def __init__(self):
+        self.pending = 2
+        self.failed: List[TestCaseBatchResult] = []
+
+
+def create_test_cases_adaptive(connection_params: VectrGQLConnParams,
+                               db: str,
+                               campaign_id: str,
+                               test_cases: List[TestCaseInput],
+                               initial_size: int = 100,
+                               max_in_flight: int = 4,
+                               batch_retries: int = 2,
+                               max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+                               sizer: Optional[AdaptiveBatchSizer] = None,
+                               on_batch_sent: Optional[Callable[[TestCaseBatchResult], None]] = None,
+                               on_batch_done: Optional[Callable[[TestCaseBatchResult], None]] = None) -> TestCaseUploadReport:
+    """Creates VECTR Test Cases in concurrent batches sized to what VECTR sustains
+
+    Batches are cut from test_cases as they are sent, limited in count and in
+    serialized bytes by an AdaptiveBatchSizer (by default the one kept on the
+    connection, so it carries over between calls). Failed batches are retried
+    with jittered exponential backoff. A batch hitting an overload that made the
+    size limit drop below its own size is cut again at the new limit instead.
+    A batch still failing after its retries is split in half, where halves are
+    only retried after overloads rather than after every error, and failing
+    halves are split again until each failing Test Case is sent on its own.
+    While no batch of the upload has succeeded, only one of two failing halves
+    is split further and the other is held back: if even single Test Cases fail
+    then, the request itself is at fault (e.g. a stale campaign ID) and every
+    held back batch is reported as failed instead of being split.
+
+        Parameters
+        ----------
+        connection_params : VectrGQLConnParams
+            Connection parameters for the target VECTR instance including api key and url
+        db : str
+            The database target where the Test Cases will be created
+        campaign_id : str
+            The Campaign ID to which the Test Cases will belong
+        test_cases: List[TestCaseInput]
+            TestCases to be created
+        initial_size : int
+            Number of Test Cases per batch a new sizer starts from, 0 starts from its maximum
+        max_in_flight : int
+            Maximum number of batch mutations in flight at the same time
+        batch_retries : int
+            Number of times a failed batch is re-sent before it is split or reported as failed
+        max_batch_bytes : int
+            Largest serialized size of the Test Cases in one batch for a new sizer
+        sizer : Optional[AdaptiveBatchSizer]
+            Sizer to use instead of the connection's own
+        on_batch_sent : Optional[Callable[[TestCaseBatchResult], None]]
+            Called from the upload thread right before a batch is first sent
+        on_batch_done : Optional[Callable[[TestCaseBatchResult], None]]
+            Called from the calling thread once a batch succeeded or failed for good
 
-    org_query = gql(
+        Returns
+        -------
+        TestCaseUploadReport
+            Per-batch results in order of their offset in test_cases, and the number of splits made
         """
-        query ($db: String!, $nameVar: String){
-          assessments(db:$db, filter: {name: {eq:  $nameVar}}) {
-            nodes {
-              id, name
-            }
-          }
-        }
-    """
-    )
+    connection = get_connection(connection_params)
+    sizer = sizer or connection.adaptive_batch_sizer(initial_size, max_batch_bytes)
+    max_in_flight = max(max_in_flight, 1)
+    executor = connection.upload_executor(max_in_flight)
+    report = TestCaseUploadReport()
+    test_case_bytes = [len(json.dumps(dict(test_case))) for test_case in test_cases]
+    # Ranges of test_cases not cut into batches yet, and halves of failed batches
+    unsent: Deque[Tuple[int, int]] = deque([(0, len(test_cases))] if test_cases else [])
+    halves: Deque[Tuple[TestCaseBatchResult, _SplitBatch]] = deque()
+    in_flight: Dict[Future, Optional[_SplitBatch]] = {}
+    batch_count = 0
+    any_succeeded = False
+    request_failing = False
+    held_back: List[TestCaseBatchResult] = []
+
+    def new_batch(start: int, size: int) -> TestCaseBatchResult:
+        nonlocal batch_count
+        batch_count += 1
+        return TestCaseBatchResult(index=batch_count - 1, start=start, size=size)
+
+    def next_batch() -> Tuple[Optional[TestCaseBatchResult], Optional[_SplitBatch]]:
+        if halves:
+            return halves.popleft()
+        if not unsent:
+            return None, None
+        start, stop = unsent.popleft()
+        end = start + 1
+        batch_bytes = test_case_bytes[start]
+        while end < stop and end - start < sizer.size and batch_bytes + test_case_bytes[end] <= sizer.max_bytes:
+            batch_bytes += test_case_bytes[end]
+            end += 1
+        if end < stop:
+            unsent.appendleft((end, stop))
+        return new_batch(start, end - start), None
+
+    def upload_batch(batch: TestCaseBatchResult, is_half: bool) -> Tuple[TestCaseBatchResult, bool]:
+        test_case_vars = connection.serialize_test_cases(db, campaign_id, test_cases[batch.start:batch.start + batch.size])
+        if on_batch_sent:
+            on_batch_sent(batch)
+        while batch.attempts <= batch_retries:
+            if batch.attempts:
+                time.sleep(backoff_delay(batch.attempts))
+            overloads_seen = sizer.overloads
+            batch.attempts += 1
+            try:
+                result = connection.execute(CREATE_TEST_CASE_MUTATION, variable_values=test_case_vars)
+                batch.created = _parse_created_test_cases(result)
+                batch.error = None
+                sizer.succeeded(batch.size)
+                break
+            except Exception as e:
+                batch.error = str(e) or type(e).__name__
+                if not is_overload_error(e):
+                    if is_half:
+                        # Most likely one of its Test Cases, which splitting finds sooner than retrying
+                        break
+                    continue
+                sizer.overloaded(overloads_seen)
+                if not is_half and batch.size > sizer.size:
+                    return batch, True
+        return batch, False
+
+    def finish(batch: TestCaseBatchResult):
+        nonlocal any_succeeded
+        if batch.succeeded and not any_succeeded:
+            any_succeeded = True
+            while held_back:
+                split(held_back.pop())
+        report.batches.append(batch)
+        if on_batch_done:
+            on_batch_done(batch)
+
+    def split(batch: TestCaseBatchResult):
+        report.splits += 1
+        split_batch = _SplitBatch()
+        half = batch.size // 2
+        halves.append((new_batch(batch.start, half), split_batch))
+        halves.append((new_batch(batch.start + half, batch.size - half), split_batch))
+
+    while True:
+        while len(in_flight) < max_in_flight:
+            batch, split_batch = next_batch()
+            if batch is None:
+                break
+            in_flight[executor.submit(upload_batch, batch, split_batch is not None)] = split_batch
+        if not in_flight:
+            break
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            split_batch = in_flight.pop(future)
+            batch, resize = future.result()
+            if resize:
+                # Cut again at the reduced size limit
+                unsent.appendleft((batch.start, batch.start + batch.size))
+            elif split_batch is None:
+                if batch.succeeded or batch.size == 1:
+                    finish(batch)
+                else:
+                    split(batch)
+            else:
+                split_batch.pending -= 1
+                if batch.succeeded:
+                    finish(batch)
+                else:
+                    split_batch.failed.append(batch)
+                if not split_batch.pending:
+                    failed = split_batch.failed
+                    if len(failed) == 2 and not any_succeeded:
+                        if failed[0].size == 1:
+                            # Nothing gets through, not even single Test Cases
+                            request_failing = True
+                        if request_failing:
+                            finish(failed.pop())
+                            finish(failed.pop())
+                            continue
+                        held_back.append(failed.pop())
+                    for failed_batch in failed:
+                        if failed_batch.size > 1:
+                            split(failed_batch)
+                        else:
+                            finish(failed_batch)
+
+    for failed_batch in held_back:
+        finish(failed_batch)
+
+    report.batches.sort(key=lambda batch: batch.start)
+    for index, batch in enumerate(report.batches):
+        batch.index = index
+    return report
+
+
+def get_org_id_for_campaign_and_assessment_data(connection_params: VectrGQLConnParams, org_name: str) -> str:
+    connection = get_connection(connection_params)
+
+    org_vars = {"nameVar": org_name}
+
+    result = connection.execute(ORGANIZATION_BY_NAME_QUERY, variable_values=org_vars)
+    return _parse_first_node_id(result, "organizations", "org")
+
+
+def get_assessment_by_name(connection_params: VectrGQLConnParams, db_name: str, assessment_name: str) -> str:
+    connection = get_connection(connection_params)
+
     ass_vars = {"nameVar": assessment_name, "db": db_name}
-    result = client.execute(org_query, variable_values=ass_vars)
-    if "assessments" in result.keys():
-        assessments_type_res = result["assessments"]
-        if "nodes" in assessments_type_res:
-            nodes_res = assessments_type_res["nodes"]
+    result = connection.execute(ASSESSMENT_BY_NAME_QUERY, variable_values=ass_vars)
+    return _parse_first_node_id(result, "assessments", "assessment")
+
+def get_campaign_by_name(connection_params: VectrGQLConnParams,
+                         db_name: str,
+                         campaign_name: str,
+                         assessment_name: Optional[str] = None) -> str:
+    """ID of the campaign named campaign_name
+
+    Campaign names are only unique within an assessment, given an assessment_name only a
+    campaign of that assessment is returned.
+    """
+    connection = get_connection(connection_params)
+
+    cpg_vars = {"nameVar": campaign_name, "db": db_name}
+    result = connection.execute(CAMPAIGN_BY_NAME_QUERY, variable_values=cpg_vars)
+    return _parse_campaign_id(result, assessment_name)
+
+
+def _parse_campaign_id(result: Dict[str, Any], assessment_name: Optional[str] = None) -> str:
+    if assessment_name is not None and "campaigns" in result:
+        nodes = [node for node in result["campaigns"].get("nodes") or []
+                 if (node.get("assessment") or {}).get("name") == assessment_name]
+        result = {"campaigns": {"nodes": nodes}}
+    return _parse_first_node_id(result, "campaigns", "campaign")
+
+
+def _parse_first_node_id(result: Dict[str, Any], key: str, label: str) -> str:
+    if key in result.keys():
+        type_res = result[key]
+        if "nodes" in type_res:
+            nodes_res = type_res["nodes"]
             if nodes_res:
                 return nodes_res[0]["id"]
 
-    raise RuntimeError("couldn't find assessment name. create in VECTR first")
+    raise RuntimeError(f"couldn't find {label} name. create in VECTR first")
+
+
+def get_testcases_for_campaign_by_id(connection_params: VectrGQLConnParams, db_name: str, campaign_id: str, with_results: bool = False) -> List[dict]:
+    """Test cases of a campaign with id, name and description, and with_results their outcome, notes, alert flag and tags"""
+    return list(iter_campaign_test_cases(connection_params, db_name, campaign_id,
+                                         fields=RESULT_FIELDS if with_results else INDEX_FIELDS))
+
 
-def get_campaign_by_name(connection_params: VectrGQLConnParams, db_name: str, campaign_name: str) -> str:
-    client = get_client(connection_params)
+def _test_case_fields(fields: Iterable[str]) -> Tuple[str, ...]:
+    fields = tuple(fields)
+    for field in fields:
+        if field not in TEST_CASE_FIELDS:
+            raise ValueError(f"unknown test case field '{field}'")
+    return fields
 
-    org_query = gql(
+
+@lru_cache(maxsize=None)
+def _test_case_page_query(fields: Tuple[str, ...]) -> DocumentNode:
+    return gql(
         """
-        query ($db: String!, $nameVar: String){
-          campaigns(db:$db, filter: {name: {eq:  $nameVar}}) {
+        query ($db: String!, $campaignId: String!, $first: Int, $after: String){
+          testcases(db:$db, filter: {campaign: {id: {eq: $campaignId}}}, first: $first, after: $after) {
             nodes {
-              id, name
+              %s
+            }
+            pageInfo {
+              hasNextPage, endCursor
             }
           }
         }
-    """
+        """ % ", ".join(TEST_CASE_FIELDS[field] for field in fields)
     )
 
-    cpg_vars = {"nameVar": campaign_name, "db": db_name}
-    result = client.execute(org_query, variable_values=cpg_vars)
-    if "campaigns" in result.keys():
-        campaigns_type_res = result["campaigns"]
-        if "nodes" in campaigns_type_res:
-            nodes_res = campaigns_type_res["nodes"]
-            if nodes_res:
-                return nodes_res[0]["id"]
 
-    raise RuntimeError("couldn't find campaign name. create in VECTR first")
+def iter_campaign_test_case_pages(connection_params: VectrGQLConnParams,
+                                  db_name: str,
+                                  campaign_id: str,
+                                  page_size: int = DEFAULT_PAGE_SIZE,
+                                  fields: Iterable[str] = INDEX_FIELDS) -> Iterator[List[dict]]:
+    """
+    Pages of the test cases of a campaign, each fetched only once the previous one was consumed
+
+    Follows the endCursor of VECTR's paginated testcases query, so however many
+    test cases the campaign holds, only one page of them is in memory at a time.
 
-def get_testcases_for_campaign_by_id(connection_params: VectrGQLConnParams, db_name: str, campaign_id: str) -> str:
-    client = get_client(connection_params)
+    Parameters
+    ----------
+    connection_params : VectrGQLConnParams
+        Connection parameters for the target VECTR instance
+    db_name : str
+        The database holding the campaign
+    campaign_id : str
+        ID of the campaign
+    page_size : int
+        Test cases requested per page
+    fields : Iterable[str]
+        Test case fields to fetch, keys of TEST_CASE_FIELDS
 
-    org_query = gql(
-        """
-        query ($db: String!, $idVar: String!){
-          campaign(id:$idVar, db:$db) {
-            
-              id, name, testCases {
-                  id, name
-              }
-          }
-        }
+    Returns
+    -------
+    Iterator[List[dict]]
+        Pages of test cases shaped as VECTR returns them, e.g. outcome as {"name": ...}
     """
-    )
+    connection = get_connection(connection_params)
+    query = _test_case_page_query(_test_case_fields(fields))
+
+    cursor = None
+    while True:
+        result = connection.execute(query, variable_values={
+            "db": db_name,
+            "campaignId": campaign_id,
+            "first": page_size,
+            "after": cursor
+        })
+        page = result.get("testcases")
+        if page is None:
+            raise RuntimeError("couldn't read the campaign's test cases")
+        yield page["nodes"]
+        if not page["pageInfo"]["hasNextPage"]:
+            return
+        cursor = page["pageInfo"]["endCursor"]
 
-    cpg_vars = {"idVar": campaign_id, "db": db_name}
-    result = client.execute(org_query, variable_values=cpg_vars)
-    #print(result)
-    if "campaign" in result.keys():
-        campaign_type_res = result["campaign"]
-        if "testCases" in campaign_type_res:
-            return campaign_type_res["testCases"]
 
-    raise RuntimeError("couldn't find campaign name. create in VECTR first")
\ No newline at end of file
+def iter_campaign_test_cases(connection_params: VectrGQLConnParams,
+                             db_name: str,
+                             campaign_id: str,
+                             page_size: int = DEFAULT_PAGE_SIZE,
+                             fields: Iterable[str] = INDEX_FIELDS) -> Iterator[dict]:
+    """The test cases of a campaign one at a time, fetched page by page, see iter_campaign_test_case_pages"""
+    for page in iter_campaign_test_case_pages(connection_params, db_name, campaign_id, page_size, fields):
+        yield from page